@@ -0,0 +1,273 @@
+"""Versioned JSON API.
+
+Everything here reads plain column tuples instead of ORM objects and pages
+with keyset cursors: message lists take `before` (a message id) and user
+lists take `after` (a user id). Follower and following lists can also be
+streamed in full as NDJSON with ?format=ndjson. Automated accounts post
+many messages in one request to /messages/batch.
+"""
+
+import json
+from functools import wraps
+
+from flask import Blueprint, Response, g, jsonify, request, stream_with_context
+
+from models import db, Follows, Likes, Message, User, MESSAGE_LENGTH
+from ratelimit import limiter
+from readmodels import MESSAGE_COLUMNS
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+MAX_LIMIT = 100
+MAX_BATCH = 500
+STREAM_CHUNK = 1000
+
+USER_COLUMNS = (User.id, User.username, User.image_url)
+
+
+def login_required(view):
+    """401 unless someone is logged in."""
+
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not g.user:
+            return error("Access unauthorized.", 401)
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+def error(message, status):
+    return jsonify(error=message), status
+
+
+@api.errorhandler(429)
+def too_many_requests(exc):
+    """Rate limited (see ratelimit.py)."""
+
+    resp, status = error("Too many requests.", 429)
+    resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp, status
+
+
+def text_problem(text):
+    """Why `text` can't be posted (MessageForm's rules), or None."""
+
+    if not isinstance(text, str) or not text.strip():
+        return "text is required."
+    if len(text) > MESSAGE_LENGTH:
+        return f"text is longer than {MESSAGE_LENGTH} characters."
+    return None
+
+
+def page_limit():
+    return max(1, min(request.args.get("limit", 20, type=int), MAX_LIMIT))
+
+
+def message_json(row):
+    msg_id, text, timestamp, user_id, username, image_url = row
+    return {
+        # snowflake ids don't fit in a JavaScript number
+        "id": str(msg_id),
+        "text": text,
+        "timestamp": timestamp.isoformat(),
+        "user": {"id": user_id, "username": username, "image_url": image_url},
+    }
+
+
+def user_json(row):
+    user_id, username, image_url = row
+    return {"id": user_id, "username": username, "image_url": image_url}
+
+
+def message_query():
+    return db.session.query(*MESSAGE_COLUMNS).join(User, User.id == Message.user_id)
+
+
+def message_page(query):
+    """Newest-first page of `query`, older than the `before` cursor."""
+
+    limit = page_limit()
+    before = request.args.get("before", type=int)
+    if before:
+        query = query.filter(Message.id < before)
+
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+
+    return jsonify(data=[message_json(row) for row in rows[:limit]], next_cursor=next_cursor)
+
+
+def user_page(query):
+    """Page of `query` by user id, or all of it as NDJSON with ?format=ndjson."""
+
+    if request.args.get("format") == "ndjson":
+        rows = query.order_by(User.id).yield_per(STREAM_CHUNK)
+
+        def lines():
+            for row in rows:
+                yield json.dumps(user_json(row)) + "\n"
+
+        return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
+    limit = page_limit()
+    after = request.args.get("after", type=int)
+    if after:
+        query = query.filter(User.id > after)
+
+    rows = query.order_by(User.id).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+
+    return jsonify(data=[user_json(row) for row in rows[:limit]], next_cursor=next_cursor)
+
+
+@api.route("/timeline")
+@login_required
+def timeline():
+    """Messages from the users the current user follows."""
+
+    from app import get_following_ids
+
+    following_ids = list(get_following_ids(g.user))
+    return message_page(message_query().filter(Message.user_id.in_(following_ids)))
+
+
+@api.route("/users/<int:user_id>")
+def user_profile(user_id):
+    """Public profile fields of a user."""
+
+    row = (
+        db.session.query(
+            User.id, User.username, User.image_url, User.header_image_url,
+            User.bio, User.location,
+        )
+        .filter(User.id == user_id)
+        .first()
+    )
+    if row is None:
+        return error("Not found.", 404)
+
+    return jsonify(data=dict(row._mapping))
+
+
+@api.route("/users/<int:user_id>/messages")
+def user_messages(user_id):
+    """Messages posted by a user."""
+
+    return message_page(message_query().filter(Message.user_id == user_id))
+
+
+@api.route("/users/<int:user_id>/followers")
+@login_required
+def user_followers(user_id):
+    """Users following a user."""
+
+    query = (
+        db.session.query(*USER_COLUMNS)
+        .join(Follows, Follows.user_following_id == User.id)
+        .filter(Follows.user_being_followed_id == user_id)
+    )
+    return user_page(query)
+
+
+@api.route("/users/<int:user_id>/following")
+@login_required
+def user_following(user_id):
+    """Users a user follows."""
+
+    query = (
+        db.session.query(*USER_COLUMNS)
+        .join(Follows, Follows.user_being_followed_id == User.id)
+        .filter(Follows.user_following_id == user_id)
+    )
+    return user_page(query)
+
+
+@api.route("/users/<int:user_id>/likes")
+@login_required
+def user_likes(user_id):
+    """Messages a user has liked."""
+
+    query = message_query().join(Likes, Likes.message_id == Message.id).filter(
+        Likes.user_id == user_id
+    )
+    return message_page(query)
+
+
+@api.route("/messages", methods=["POST"])
+@login_required
+@limiter.limit("post")
+def create_message():
+    """Post a message: {"text": "..."}."""
+
+    from app import post_message
+
+    text = (request.get_json(silent=True) or {}).get("text")
+    problem = text_problem(text)
+    if problem:
+        return error(problem, 400)
+
+    msg = post_message(g.user, text)
+    row = (msg.id, msg.text, msg.timestamp, g.user.id, g.user.username, g.user.image_url)
+    return jsonify(data=message_json(row)), 201
+
+
+def read_batch():
+    """The message objects in a batch request, or None if it can't be read.
+
+    NDJSON is read a line at a time and only up to one past MAX_BATCH, so
+    an oversized stream is turned away without reading all of it.
+    """
+
+    if request.mimetype == "application/x-ndjson":
+        items = []
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                return None
+            if len(items) > MAX_BATCH:
+                break
+        return items
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("messages"), list):
+        return None
+    return body["messages"]
+
+
+@api.route("/messages/batch", methods=["POST"])
+@login_required
+@limiter.limit("ingest")
+def create_messages():
+    """Post up to MAX_BATCH messages at once.
+
+    Takes {"messages": [{"text": "..."}, ...]}, or the same objects one per
+    line as NDJSON (Content-Type: application/x-ndjson). Either every
+    message is valid and all are posted, or none are and the errors are
+    listed by position.
+    """
+
+    from app import post_messages
+
+    items = read_batch()
+    if items is None:
+        return error('Send {"messages": [...]} as JSON, or NDJSON.', 400)
+    if not items:
+        return error("messages is required.", 400)
+    if len(items) > MAX_BATCH:
+        return error(f"At most {MAX_BATCH} messages per batch.", 400)
+
+    texts = [item.get("text") if isinstance(item, dict) else None for item in items]
+    problems = [
+        dict(index=index, error=problem)
+        for index, problem in enumerate(map(text_problem, texts))
+        if problem
+    ]
+    if problems:
+        return jsonify(error="Some messages are invalid.", errors=problems), 400
+
+    rows = post_messages(g.user, texts)
+    return jsonify(data=[message_json(row) for row in rows]), 201
@@ -1,48 +1,372 @@
+import json
 import os
-
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    render_template,
+    request,
+    flash,
+    redirect,
+    session,
+    g,
+    abort,
+    jsonify,
+    make_response,
+    send_file,
+    stream_template,
+    stream_with_context,
+)
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
-
-from forms import UserAddForm, LoginForm, MessageForm, EditUserForm
-from models import db, connect_db, User, Message
-from secret_word import APP_SECRET_KEY
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from config import PROFILES
+from models import (
+    db,
+    connect_db,
+    User,
+    Message,
+    Follows,
+    FollowerCount,
+    LikeCount,
+    LikedCount,
+    Likes,
+    Suggestion,
+    Job,
+)
+from trending import Trending
+from graph import FollowGraph
+from search import search_messages
+from tags import tagged_messages, mentioning_messages
+from snowflake import generator as id_generator, id_for, next_id
+from partitions import ensure_partitions, archived_messages
+from jobs import enqueue, queue_metrics
+from export import export_files, export_path, export_rows, stream_zip
+from pubsub import Broker, PostgresBridge, libpq_dsn, notify, notify_many
+from ratelimit import client_identity, limiter
+from rollups import (
+    daily_counts,
+    follower_count,
+    forget_message,
+    like_count,
+    most_followed,
+    most_liked,
+    record_daily,
+    record_followers,
+    record_liked,
+    record_likes,
+)
+from readmodels import MessageRow, message_rows, user_cards, user_cards_query
+from snapshot import Snapshot, write_snapshot
+from timeline import COUNT_CAP, new_message_count, record_posted
+from cache import LRUCache, LocalBackend, ObjectCache, RedisBackend, RenderCache
 
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+views = Blueprint("views", __name__)
+
+# Per-process state shared by the views that doesn't depend on the app's
+# config; the rest is an AppState in app.extensions (see init_state).
+trending = Trending()
+broker = Broker()
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
-    "DATABASE_URL", "postgresql:///warbler"
+# object caches announce invalidations to each other on this channel
+CACHE_CHANNEL = "warbler_cache"
+
+startup = dict(
+    started_at=time.time(),
+    snapshot_entries=0,
+    snapshot_age_seconds=None,
+    attach_ms=None,
+    warm_after_seconds=None,
+    snapshot_written_at=None,
 )
 
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ECHO"] = False
-app.config["DEBUG_TB_INTERCEPT_REDIRECTS"] = False
-app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY",APP_SECRET_KEY)
-toolbar = DebugToolbarExtension(app)
 
-connect_db(app)
+def create_app(config=None):
+    """Build the app for a profile in config.py.
+
+    `config` is a profile name ("development", "testing" or "production";
+    default $WARBLER_CONFIG, else "development") or a config class. Only
+    the development profile imports Flask-DebugToolbar, and production
+    never imports secret_word.py.
+    """
+
+    config = config or os.environ.get("WARBLER_CONFIG", "development")
+    config = PROFILES.get(config, config)
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    if not app.config["SECRET_KEY"]:
+        if not app.config["SECRET_KEY_FROM_FILE"]:
+            raise RuntimeError("SECRET_KEY must be set in the environment.")
+        from secret_word import APP_SECRET_KEY
+
+        app.config["SECRET_KEY"] = APP_SECRET_KEY
+
+    if app.config["DEBUG_TOOLBAR"]:
+        from flask_debugtoolbar import DebugToolbarExtension
+
+        DebugToolbarExtension(app)
+
+    # behind a reverse proxy, take the client's address from X-Forwarded-For
+    # so logged-out visitors don't all share the proxy's rate limit bucket
+    hops = app.config["PROXY_FIX_HOPS"]
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    id_generator.require_assigned = app.config["REQUIRE_WORKER_ID"]
+
+    connect_db(app)
+    init_state(app)
+    limiter.init_app(app)
+
+    from api import api
+
+    app.register_blueprint(views)
+    app.register_blueprint(api)
+
+    attach_cache_snapshot(app)
+
+    return app
+
+
+class AppState:
+    """What the views share within a process, built from one app's config."""
+
+    def __init__(self, follow_graph, bridge, object_cache, cache_bridge, page_cache):
+        self.follow_graph = follow_graph
+        self.bridge = bridge
+        self.object_cache = object_cache
+        self.cache_bridge = cache_bridge
+        self.page_cache = page_cache
+
+
+def app_state():
+    """The AppState of the current app."""
+
+    return current_app.extensions["warbler"]
+
+
+def init_state(app):
+    """Build `app`'s AppState from its config, as app.extensions["warbler"]."""
+
+    follow_graph = (
+        FollowGraph(app.config["FOLLOW_GRAPH_PATH"])
+        if app.config["FOLLOW_GRAPH_PATH"]
+        else None
+    )
+
+    dsn = libpq_dsn(app.config["SQLALCHEMY_DATABASE_URI"])
+    bridge = PostgresBridge(broker.publish, dsn)
+
+    if app.config["CACHE_URL"] == "local":
+        shared_cache = LocalBackend()
+    elif app.config["CACHE_URL"]:
+        shared_cache = RedisBackend(app.config["CACHE_URL"])
+    else:
+        shared_cache = None
+
+    object_cache = ObjectCache(
+        LRUCache(app.config["CACHE_MAX_ITEMS"], app.config["CACHE_TTL_SECONDS"]),
+        shared_cache,
+        app.config["CACHE_SHARED_TTL_SECONDS"],
+        announce_invalidation if app.config["CACHE_ANNOUNCE_INVALIDATIONS"] else None,
+    )
+    cache_bridge = PostgresBridge(object_cache.forget, dsn, CACHE_CHANNEL)
+
+    page_cache = RenderCache(
+        app.config["PAGE_CACHE_MAX_PAGES"],
+        app.config["PAGE_CACHE_FRESH_SECONDS"],
+        app.config["PAGE_CACHE_STALE_SECONDS"],
+    )
+
+    app.extensions["warbler"] = AppState(
+        follow_graph, bridge, object_cache, cache_bridge, page_cache
+    )
+
+
+def announce_invalidation(payload):
+    """Tell the other workers' object caches to drop a row or a table."""
+
+    with db.engine.begin() as connection:
+        notify(connection, payload, CACHE_CHANNEL)
+
+
+@views.before_app_request
+def listen_for_invalidations():
+    """Start hearing of rows other workers invalidate (once per process)."""
+
+    if current_app.config["CACHE_ANNOUNCE_INVALIDATIONS"]:
+        app_state().cache_bridge.start(wait=False)
+
+
+@db.event.listens_for(db.session, "after_bulk_delete")
+def forget_bulk_deleted(delete_context):
+    """Orphan the cached rows a bulk delete of users or messages may remove.
+
+    Deleting a user cascades to their messages in the database, so those go
+    too. Pages are left to whoever deleted the rows to invalidate, as every
+    other write does; bulk deletes of likes, follows and rollups don't touch
+    the object or page caches at all.
+    """
+
+    model = delete_context.mapper.class_
+    if model not in (User, Message):
+        return
+    # the session's app, which scripts and tests use without an app context
+    object_cache = db.get_app().extensions["warbler"].object_cache
+    # even a worker that has cached nothing itself moves every worker on
+    object_cache.invalidate_all(model)
+    if model is User:
+        object_cache.invalidate_all(Message)
+
+
+def attach_cache_snapshot(app):
+    """Start from the latest cache snapshot instead of cold, if it is recent."""
+
+    path = app.config["CACHE_SNAPSHOT_PATH"]
+    if not path:
+        return
+
+    start = time.perf_counter()
+    snapshot = Snapshot.open(path, app.config["CACHE_SNAPSHOT_MAX_AGE"])
+    if snapshot is None:
+        return
+
+    app.extensions["warbler"].object_cache.attach(snapshot)
+    trending_state = snapshot.get("trending", "state")
+    if trending_state is not None:
+        trending.restore(trending_state)
+
+    startup.update(
+        snapshot_entries=len(snapshot),
+        snapshot_age_seconds=round(snapshot.age(), 1),
+        attach_ms=round((time.perf_counter() - start) * 1000, 2),
+    )
+
+
+@views.before_app_request
+def write_cache_snapshot():
+    """Every CACHE_SNAPSHOT_SECONDS, save this worker's caches for new workers.
+
+    The first one waits a full interval after boot, so this worker has
+    loaded rows of its own; rows it only took from an attached snapshot are
+    not written again (see ObjectCache.dump).
+    """
+
+    path = current_app.config["CACHE_SNAPSHOT_PATH"]
+    last = startup["snapshot_written_at"] or startup["started_at"]
+    if not path or time.time() - last < current_app.config["CACHE_SNAPSHOT_SECONDS"]:
+        return
+
+    startup["snapshot_written_at"] = time.time()
+    write_snapshot(
+        path,
+        {"objects": app_state().object_cache.dump(), "trending": {"state": trending.state()}},
+    )
+
+
+@views.after_app_request
+def record_cache_warm_up(response):
+    """Note how long after boot the object cache reached its warm hit rate."""
+
+    if startup["warm_after_seconds"] is None:
+        metrics = app_state().object_cache.metrics()
+        if (
+            metrics["lookups"] >= 50
+            and metrics["hit_rate"] >= current_app.config["CACHE_WARM_HIT_RATE"]
+        ):
+            startup["warm_after_seconds"] = round(time.time() - startup["started_at"], 3)
+
+    return response
+
+
+def public_page(key, render):
+    """Serve a logged-out visitor's page from the page cache.
+
+    Logged-in views, and any with a flash message waiting, are rendered
+    for the request as usual.
+    """
+
+    if g.user or session.get("_flashes"):
+        return render()
+    return app_state().page_cache.get(key, render)
+
+
+def cached_or_404(model, ident):
+    """Look up a user or message through the object cache, or 404."""
+
+    obj = app_state().object_cache.get(db.session, model, ident)
+    if obj is None:
+        abort(404)
+    return obj
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@views.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = app_state().object_cache.get(db.session, User, session[CURR_USER_KEY])
 
     else:
         g.user = None
 
 
+@views.before_app_request
+def create_message_partitions():
+    """Make sure upcoming months have a messages partition."""
+
+    ensure_partitions()
+
+
+@views.before_app_request
+def refresh_follow_graph():
+    """Replay follows written by other workers since the last request."""
+
+    follow_graph = app_state().follow_graph
+    if follow_graph is None:
+        return
+
+    if not os.path.exists(follow_graph.path):
+        # every worker may get here on first boot; only one builds it
+        follow_graph.compact(follow_edges, if_missing=True)
+    follow_graph.refresh()
+
+
+def follow_edges():
+    """All (follower id, followed id) pairs, for rebuilding the follow graph."""
+
+    return db.session.query(Follows.user_following_id, Follows.user_being_followed_id)
+
+
+def get_following_ids(user):
+    """Ids of the users `user` follows."""
+
+    follow_graph = app_state().follow_graph
+    if follow_graph is not None:
+        return follow_graph.following_ids(user.id)
+    return {
+        followed_id
+        for (followed_id,) in db.session.query(Follows.user_being_followed_id).filter(
+            Follows.user_following_id == user.id
+        )
+    }
+
+
 def do_login(user):
     """Log in user."""
 
@@ -56,7 +380,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route("/signup", methods=["GET", "POST"])
+@views.route("/signup", methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -68,6 +392,10 @@ def signup():
     and re-present form.
     """
 
+    # forms.py builds email validators, which are slow to import; only the
+    # form views load it
+    from forms import UserAddForm
+
     form = UserAddForm()
 
     if form.validate_on_submit():
@@ -78,6 +406,7 @@ def signup():
                 email=form.email.data,
                 image_url=form.image_url.data or User.image_url.default.arg,
             )
+            record_daily("signups")
             db.session.commit()
 
         except IntegrityError:
@@ -92,10 +421,36 @@ def signup():
         return render_template("users/signup.html", form=form)
 
 
-@app.route("/login", methods=["GET", "POST"])
+def posting():
+    """Is this a form submission (rather than showing the form)?"""
+
+    return request.method == "POST"
+
+
+def login_username():
+    """The username a login attempt is for, from this client.
+
+    Keyed on the client too, so guessing at an account from elsewhere can't
+    lock its owner out.
+    """
+
+    return f"username:{request.form.get('username', '')}:{client_identity()}"
+
+
+def searching():
+    """Does this list page have a search query?"""
+
+    return bool(request.args.get("q"))
+
+
+@views.route("/login", methods=["GET", "POST"])
+@limiter.limit("login", when=posting)
+@limiter.limit("login_username", when=posting, key=login_username)
 def login():
     """Handle user login."""
 
+    from forms import LoginForm
+
     form = LoginForm()
 
     if form.validate_on_submit():
@@ -111,7 +466,7 @@ def login():
     return render_template("users/login.html", form=form)
 
 
-@app.route("/logout")
+@views.route("/logout")
 def logout():
     """Handle logout of user."""
 
@@ -124,7 +479,61 @@ def logout():
 # General user routes:
 
 
-@app.route("/users")
+def stream_page(template, **context):
+    """Render `template` as a streamed response.
+
+    List pages pass their rows as yield_per queries, so the layout goes out
+    before the list has been read and only one chunk of rows is in memory
+    at a time. Output is gathered into STREAM_BUFFER_SIZE writes rather
+    than one per template fragment.
+    """
+
+    limit = current_app.config["STREAM_BUFFER_SIZE"]
+    # called now so it holds on to the request context while streaming
+    pieces = stream_template(template, **context)
+
+    def chunks():
+        buffer, size = [], 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= limit:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        yield "".join(buffer)
+
+    return Response(chunks(), mimetype="text/html")
+
+
+def profile_counts(user_id):
+    """Counts for the profile header, without loading the collections.
+
+    Followers and likes come from their rollups, as a popular account's
+    followers are too many to count on every view.
+    """
+
+    def count(column):
+        return (
+            db.session.query(func.count())
+            .filter(column == user_id)
+            .scalar_subquery()
+        )
+
+    def rollup(column, key):
+        return func.coalesce(
+            db.session.query(column).filter(key == user_id).scalar_subquery(), 0
+        )
+
+    return db.session.query(
+        count(Message.user_id).label("messages"),
+        count(Follows.user_following_id).label("following"),
+        rollup(FollowerCount.followers, FollowerCount.user_id).label("followers"),
+        rollup(LikedCount.liked, LikedCount.user_id).label("likes"),
+    ).one()
+
+
+@views.route("/users")
+@limiter.limit("search", when=searching)
 def list_users():
     """Page with listing of users.
 
@@ -133,68 +542,265 @@ def list_users():
 
     search = request.args.get("q")
 
-    if not search:
-        users = User.query.all()
-    else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+    users = user_cards_query()
+    if search:
+        users = users.filter(User.username.like(f"%{search}%"))
 
-    return render_template("users/index.html", users=users)
+    return stream_page(
+        "users/index.html",
+        users=user_cards(
+            users.order_by(User.id).yield_per(current_app.config["STREAM_CHUNK_ROWS"])
+        ),
+        following_ids=get_following_ids(g.user) if g.user else set(),
+    )
 
 
-@app.route("/users/<int:user_id>")
+@views.route("/users/<int:user_id>")
 def users_show(user_id):
-    """Show user profile."""
+    """Show user profile.
+
+    With ?fragment=1 only the next page of message items is rendered.
+    """
+
+    if not request.args:
+        return public_page(f"/users/{user_id}", lambda: user_page(user_id))
+    return user_page(user_id)
+
+
+def user_page(user_id):
+    """Render a page of a user's profile for `users_show`."""
 
-    user = User.query.get_or_404(user_id)
+    user = cached_or_404(User, user_id)
+    page_size = current_app.config["TIMELINE_PAGE_SIZE"]
+    before = request.args.get("before", type=int)
 
     # snagging messages in order from the database;
     # user.messages won't be in order by default
-    messages = (
-        Message.query.filter(Message.user_id == user_id)
-        .order_by(Message.timestamp.desc())
-        .limit(100)
+    messages = message_rows(Message.user_id == user_id, before=before, limit=page_size)
+
+    # past the oldest live message, keep going in the archive segments
+    if len(messages) < page_size:
+        messages += archived_messages(
+            user_id, messages[-1].id if messages else before, page_size - len(messages)
+        )
+
+    next_before = messages[-1].id if len(messages) == page_size else None
+
+    if request.args.get("fragment"):
+        return render_fragment(
+            "users/_message_items.html",
+            next_before,
+            user=user,
+            messages=messages,
+            liked_ids=liked_ids(messages),
+        )
+
+    return render_template(
+        "users/show.html",
+        user=user,
+        counts=profile_counts(user_id),
+        messages=messages,
+        next_before=next_before,
+        liked_ids=liked_ids(messages),
+    )
+
+
+def encode_time_cursor(timestamp, row_id):
+    """Cursor for keyset pages ordered by (timestamp, id), newest first."""
+
+    micros = (timestamp - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+    return f"{micros}_{row_id}"
+
+
+def decode_time_cursor(cursor):
+    """(timestamp, id) from `encode_time_cursor`, or None if it is malformed."""
+
+    try:
+        micros, row_id = cursor.split("_")
+        return datetime(1970, 1, 1) + timedelta(microseconds=int(micros)), int(row_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def follows_page(user_id, followers):
+    """One page of `user_id`'s followers (or followed users), newest first.
+
+    Returns (UserCards, next cursor or None); the cursor is read from ?before=.
+    """
+
+    if followers:
+        other, this = Follows.user_following_id, Follows.user_being_followed_id
+    else:
+        other, this = Follows.user_being_followed_id, Follows.user_following_id
+
+    page_size = current_app.config["FOLLOWS_PAGE_SIZE"]
+    query = (
+        user_cards_query(Follows.created_at)
+        .join(Follows, other == User.id)
+        .filter(this == user_id)
+    )
+
+    cursor = decode_time_cursor(request.args.get("before"))
+    if cursor:
+        query = query.filter(tuple_(Follows.created_at, other) < cursor)
+
+    rows = (
+        query.order_by(Follows.created_at.desc(), other.desc())
+        .limit(page_size + 1)
         .all()
     )
-    return render_template("users/show.html", user=user, messages=messages)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        row = rows[page_size - 1]
+        next_cursor = encode_time_cursor(row.created_at, row.id)
+
+    return list(user_cards(rows[:page_size])), next_cursor
 
 
-@app.route("/users/<int:user_id>/following")
+def followed_among(users):
+    """Ids of `users` the current user follows, checked for this page only."""
+
+    ids = [user.id for user in users]
+    follow_graph = app_state().follow_graph
+    if follow_graph is not None:
+        return {i for i in ids if follow_graph.is_following(g.user.id, i)}
+    if not ids:
+        return set()
+
+    return {
+        followed_id
+        for (followed_id,) in db.session.query(Follows.user_being_followed_id).filter(
+            Follows.user_following_id == g.user.id,
+            Follows.user_being_followed_id.in_(ids),
+        )
+    }
+
+
+@views.route("/users/<int:user_id>/following")
 def show_following(user_id):
-    """Show list of people this user is following."""
+    """Show a page of the people this user is following, newest first."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template("users/following.html", user=user)
+    user = cached_or_404(User, user_id)
+    following, next_cursor = follows_page(user_id, followers=False)
+    return stream_page(
+        "users/following.html",
+        user=user,
+        counts=profile_counts(user_id),
+        following=following,
+        following_ids=followed_among(following),
+        next_cursor=next_cursor,
+    )
 
 
-@app.route("/users/<int:user_id>/followers")
+@views.route("/users/<int:user_id>/followers")
 def users_followers(user_id):
-    """Show list of followers of this user."""
+    """Show a page of this user's followers, newest first."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template("users/followers.html", user=user)
+    user = cached_or_404(User, user_id)
+    followers, next_cursor = follows_page(user_id, followers=True)
+    return stream_page(
+        "users/followers.html",
+        user=user,
+        counts=profile_counts(user_id),
+        followers=followers,
+        following_ids=followed_among(followers),
+        next_cursor=next_cursor,
+    )
 
 
-@app.route("/users/<int:user_id>/liked")
+@views.route("/users/<int:user_id>/liked")
 def users_liked(user_id):
-    """Show list of messages liked by this user."""
+    """Show a page of messages liked by this user, most recently liked first."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    user = cached_or_404(User, user_id)
+    page_size = current_app.config["TIMELINE_PAGE_SIZE"]
+
+    # authors come in one IN query per page rather than one per message
+    query = (
+        db.session.query(Message, Likes.created_at, Likes.id)
+        .join(Likes, Likes.message_id == Message.id)
+        .filter(Likes.user_id == user_id)
+        .options(db.selectinload(Message.user))
+    )
+    cursor = decode_time_cursor(request.args.get("before"))
+    if cursor:
+        query = query.filter(tuple_(Likes.created_at, Likes.id) < cursor)
+
+    rows = (
+        query.order_by(Likes.created_at.desc(), Likes.id.desc())
+        .limit(page_size + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        _, liked_at, like_id = rows[page_size - 1]
+        next_cursor = encode_time_cursor(liked_at, like_id)
+
+    return stream_page(
+        "users/liked.html",
+        user=user,
+        counts=profile_counts(user_id),
+        messages=[message for message, _, _ in rows[:page_size]],
+        next_cursor=next_cursor,
+    )
+
+
+@views.route("/users/<int:user_id>/mentions")
+def users_mentions(user_id):
+    """Show messages that @mention this user, newest first."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template("users/liked.html", user=user)
+    user = cached_or_404(User, user_id)
+    messages, next_before = mentioning_messages(
+        user_id, request.args.get("before", type=int)
+    )
+    return render_template(
+        "users/mentions.html",
+        user=user,
+        counts=profile_counts(user_id),
+        messages=messages,
+        next_before=next_before,
+    )
+
+
+def wants_json():
+    """Did the browser script (rather than a plain form post) send this?"""
+
+    return (
+        request.accept_mimetypes.best_match(["text/html", "application/json"])
+        == "application/json"
+    )
+
+
+def follow_counts(follow_id, change):
+    """Followers of `follow_id`, and how the current user's following count moved.
+
+    The follower count is read from its rollup; the script adds `change` (1,
+    0 or -1) to the following count it already shows rather than recounting.
+    """
+
+    return dict(followers=follower_count(follow_id), following_change=change)
 
 
-@app.route("/users/follow/<int:follow_id>", methods=["POST"])
+@views.route("/users/follow/<int:follow_id>", methods=["POST"])
+@limiter.limit("follow")
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -206,14 +812,39 @@ def add_follow(follow_id):
         flash("Cannot follow yourself.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    cached_or_404(User, follow_id)
+    followed = db.session.execute(
+        pg_insert(Follows)
+        .values(user_following_id=g.user.id, user_being_followed_id=follow_id)
+        .on_conflict_do_nothing()
+    ).rowcount
+    if followed:
+        record_daily("follows")
+        record_followers(follow_id, 1)
+    enqueue(
+        "refresh_suggestions",
+        {"user_id": g.user.id},
+        key=f"refresh_suggestions:{g.user.id}",
+    )
     db.session.commit()
+    follow_graph = app_state().follow_graph
+    if follow_graph is not None:
+        follow_graph.record(g.user.id, follow_id)
+
+    if wants_json():
+        return jsonify(
+            is_following=True,
+            user_id=follow_id,
+            follower_id=g.user.id,
+            action=f"/users/stop-following/{follow_id}",
+            **follow_counts(follow_id, 1 if followed else 0),
+        )
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route("/users/stop-following/<int:follow_id>", methods=["POST"])
+@views.route("/users/stop-following/<int:follow_id>", methods=["POST"])
+@limiter.limit("follow")
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -221,50 +852,91 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    unfollowed = Follows.query.filter_by(
+        user_following_id=g.user.id, user_being_followed_id=follow_id
+    ).delete()
+    if unfollowed:
+        record_followers(follow_id, -1)
     db.session.commit()
+    follow_graph = app_state().follow_graph
+    if follow_graph is not None:
+        follow_graph.record(g.user.id, follow_id, following=False)
+
+    if wants_json():
+        return jsonify(
+            is_following=False,
+            user_id=follow_id,
+            follower_id=g.user.id,
+            action=f"/users/follow/{follow_id}",
+            **follow_counts(follow_id, -1 if unfollowed else 0),
+        )
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route("/users/add_like/<int:msg_id>", methods=["POST"])
+def like_response(msg, liked, likes):
+    """JSON for the like button, or the redirect a plain form expects."""
+
+    if wants_json():
+        action = "remove_like" if liked else "add_like"
+        query = request.query_string.decode()
+        return jsonify(
+            liked=liked,
+            likes=likes,
+            action=f"/users/{action}/{msg.id}" + (f"?{query}" if query else ""),
+        )
+
+    return redirect(request.args.get("redirect") or "/")
+
+
+@views.route("/users/add_like/<int:msg_id>", methods=["POST"])
 def add_like_to_post(msg_id):
     """User likes a message"""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    redirect_to = request.args.get("redirect")
 
-    liked_message = Message.query.get(msg_id)
+    liked_message = cached_or_404(Message, msg_id)
     if liked_message.user_id == g.user.id:
         flash("Cannot like your own posts.", "danger")
         return redirect("/")
 
-    g.user.likes.append(liked_message)
+    # one row, rather than loading every like through g.user.likes
+    liked = db.session.execute(
+        pg_insert(Likes)
+        .values(user_id=g.user.id, message_id=msg_id)
+        .on_conflict_do_nothing()
+    ).rowcount
+    if liked:
+        record_daily("likes")
+        record_likes(msg_id, 1)
+        record_liked(g.user.id, 1)
     db.session.commit()
-    # print(redirect_to)
+    likes = like_count(msg_id)
+    record_trending(liked_message, likes)
 
-    return redirect(redirect_to)
+    return like_response(liked_message, True, likes)
 
 
-@app.route("/users/remove_like/<int:msg_id>", methods=["POST"])
+@views.route("/users/remove_like/<int:msg_id>", methods=["POST"])
 def remove_like_from_post(msg_id):
     """User unlikes a message on user's likes page"""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    redirect_to = request.args.get("redirect")
-
-    liked_message = Message.query.get(msg_id)
-    g.user.likes.remove(liked_message)
+    liked_message = cached_or_404(Message, msg_id)
+    if Likes.query.filter_by(user_id=g.user.id, message_id=msg_id).delete():
+        record_likes(msg_id, -1)
+        record_liked(g.user.id, -1)
     db.session.commit()
+    likes = like_count(msg_id)
+    record_trending(liked_message, likes)
 
-    return redirect(redirect_to)
+    return like_response(liked_message, False, likes)
 
 
-@app.route("/users/profile", methods=["GET", "POST"])
+@views.route("/users/profile", methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -273,6 +945,8 @@ def profile():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    from forms import EditUserForm
+
     form = EditUserForm(obj=g.user)
     print(form.username)
     if form.validate_on_submit():
@@ -298,12 +972,90 @@ def profile():
         g.user.bio = form.bio.data
         g.user.location = form.location.data
         db.session.commit()
+        app_state().object_cache.invalidate(User, g.user.id)
+        app_state().page_cache.invalidate(f"/users/{g.user.id}")
         return redirect(f"/users/{g.user.id}")
 
     return render_template("users/edit.html", form=form)
 
 
-@app.route("/users/delete", methods=["POST"])
+@views.route("/users/export")
+def export_status():
+    """Offer a download of the current user's data, or say it's on its way."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    path = export_path(current_app.config["EXPORT_DIR"], g.user.id)
+    pending = Job.query.filter(
+        Job.idempotency_key == f"export_user:{g.user.id}",
+        Job.status.in_(["pending", "running"]),
+    ).count()
+
+    return render_template(
+        "users/export.html",
+        ready_at=(
+            datetime.utcfromtimestamp(os.path.getmtime(path))
+            if os.path.exists(path)
+            else None
+        ),
+        pending=pending,
+    )
+
+
+@views.route("/users/export", methods=["POST"])
+def export_data():
+    """Export the current user's data as a ZIP.
+
+    Small accounts get the archive streamed back straight away; bigger ones
+    are exported by a background job, for download from export_status().
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    if export_rows(g.user.id) <= current_app.config["EXPORT_INLINE_MAX_ROWS"]:
+        chunks = stream_zip(
+            export_files(g.user.id, current_app.config["STREAM_CHUNK_ROWS"])
+        )
+        return Response(
+            stream_with_context(chunks),
+            mimetype="application/zip",
+            headers={
+                "Content-Disposition": 'attachment; filename="warbler-export.zip"'
+            },
+        )
+
+    enqueue("export_user", {"user_id": g.user.id}, key=f"export_user:{g.user.id}")
+    db.session.commit()
+    flash("Your export is being prepared. It will be ready to download here.", "info")
+    return redirect("/users/export")
+
+
+@views.route("/users/export/download")
+def export_download():
+    """The current user's prepared export; Range requests resume a download."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    path = export_path(current_app.config["EXPORT_DIR"], g.user.id)
+    if not os.path.exists(path):
+        abort(404)
+
+    return send_file(
+        path,
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name="warbler-export.zip",
+        conditional=True,
+    )
+
+
+@views.route("/users/delete", methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -313,9 +1065,17 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    # cascading the delete through every message, like and follow is done
+    # by a background job (or inline, which expires g.user)
+    user_id = g.user.id
+    enqueue("delete_user", {"user_id": user_id}, key=f"delete_user:{user_id}")
     db.session.commit()
 
+    path = export_path(current_app.config["EXPORT_DIR"], user_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+    # the job drops the user from the caches once the rows are gone
     return redirect("/signup")
 
 
@@ -323,7 +1083,68 @@ def delete_user():
 # Messages routes:
 
 
-@app.route("/messages/new", methods=["GET", "POST"])
+def post_message(user, text):
+    """Save a new message by `user` and set off everything that follows it."""
+
+    msg = Message(text=text, user_id=user.id)
+    db.session.add(msg)
+    db.session.flush()
+    enqueue("index_messages", {"ids": [msg.id]}, key=f"index_messages:{msg.id}")
+    notify(db.session, message_event(msg, user))
+    record_daily("messages")
+    record_posted(user.id, msg.id)
+    db.session.commit()
+    app_state().page_cache.invalidate(f"/users/{user.id}")
+    record_trending(msg)
+
+    return msg
+
+
+def post_messages(user, texts):
+    """Save a batch of messages by `user` with one multi-row INSERT.
+
+    What post_message() sets off happens once for the whole batch: one
+    index job, one statement sending every message live, oldest first, and
+    one follower count for the trending boards. Returns rows in the order of
+    readmodels.MESSAGE_COLUMNS, oldest first.
+    """
+
+    values = [dict(id=next_id(), text=text, user_id=user.id) for text in texts]
+    timestamps = dict(
+        db.session.execute(
+            pg_insert(Message).values(values).returning(Message.id, Message.timestamp)
+        ).all()
+    )
+    rows = [
+        (
+            value["id"],
+            value["text"],
+            timestamps[value["id"]],
+            user.id,
+            user.username,
+            user.image_url,
+        )
+        for value in values
+    ]
+
+    ids = [row[0] for row in rows]
+    enqueue("index_messages", {"ids": ids}, key=f"index_messages:{ids[0]}")
+    notify_many(db.session, [message_event(MessageRow(*row), user) for row in rows])
+    record_daily("messages", len(rows))
+    record_posted(user.id, ids[-1])
+    db.session.commit()
+    app_state().page_cache.invalidate(f"/users/{user.id}")
+
+    # new messages have no likes yet, and all have the same author
+    followers = follower_count(user.id)
+    for msg_id, _, timestamp, *_ in rows:
+        trending.record(msg_id, unix_time(timestamp), 0, followers)
+
+    return rows
+
+
+@views.route("/messages/new", methods=["GET", "POST"])
+@limiter.limit("post", when=posting)
 def messages_add():
     """Add a message:
 
@@ -334,27 +1155,57 @@ def messages_add():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    from forms import MessageForm
+
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
-        db.session.commit()
+        post_message(g.user, form.text.data)
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template("messages/new.html", form=form)
 
 
-@app.route("/messages/<int:message_id>", methods=["GET"])
+@views.route("/messages/search")
+@limiter.limit("search", when=searching)
+def messages_search():
+    """Search messages by text.
+
+    Takes a 'q' param with words, "quoted phrases" or prefix* terms, and an
+    optional 'cursor' param for the next page of results.
+    """
+
+    q = request.args.get("q", "")
+    messages, next_cursor = search_messages(q, request.args.get("cursor"))
+
+    return render_template(
+        "messages/search.html", q=q, messages=messages, next_cursor=next_cursor
+    )
+
+
+@views.route("/tags/<tag>")
+def tags_show(tag):
+    """Show messages using a hashtag, newest first."""
+
+    messages, next_before = tagged_messages(tag, request.args.get("before", type=int))
+    return render_template(
+        "tags/show.html", tag=tag.lower(), messages=messages, next_before=next_before
+    )
+
+
+@views.route("/messages/<int:message_id>", methods=["GET"])
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get_or_404(message_id)
-    return render_template("messages/show.html", message=msg)
+    def render():
+        msg = cached_or_404(Message, message_id)
+        return render_template("messages/show.html", message=msg)
+
+    return public_page(f"/messages/{message_id}", render)
 
 
-@app.route("/messages/<int:message_id>/delete", methods=["POST"])
+@views.route("/messages/<int:message_id>/delete", methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -362,46 +1213,333 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get(message_id)
+    msg = cached_or_404(Message, message_id)
 
     if g.user.id != msg.user_id:
         flash("You can only delete your own messages.", "danger")
         return redirect("/")
 
+    # before the delete cascades away the likes it counts
+    forget_message(message_id)
     db.session.delete(msg)
     db.session.commit()
+    app_state().object_cache.invalidate(Message, message_id)
+    app_state().page_cache.invalidate(f"/messages/{message_id}")
+    app_state().page_cache.invalidate(f"/users/{g.user.id}")
+    trending.discard(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
 
+##############################################################################
+# Trending messages
+
+
+def unix_time(timestamp):
+    """Seconds since the epoch for a naive UTC datetime."""
+
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def render_fragment(template, next_before, **context):
+    """Render just the list items of one page, for infinite scroll.
+
+    The cursor for the page after it goes in an X-Next-Before header.
+    """
+
+    resp = make_response(render_template(template, **context))
+    if next_before:
+        resp.headers["X-Next-Before"] = str(next_before)
+    return resp
+
+
+def liked_ids(messages):
+    """Ids of the `messages` the current user has liked, in one query."""
+
+    ids = [msg.id for msg in messages if not getattr(msg, "archived", False)]
+    if not g.user or not ids:
+        return set()
+
+    return {
+        message_id
+        for (message_id,) in db.session.query(Likes.message_id).filter(
+            Likes.user_id == g.user.id, Likes.message_id.in_(ids)
+        )
+    }
+
+
+def record_trending(msg, likes=0):
+    """Re-score one message, with `likes` likes, after a post or like.
+
+    The author's follower count is read from its rollup.
+    """
+
+    trending.record(
+        msg.id, unix_time(msg.timestamp), likes, follower_count(msg.user_id)
+    )
+
+
+def seed_trending():
+    """Rebuild the trending boards from the database.
+
+    Each worker only sees the likes it served itself, so the boards are
+    re-seeded every TRENDING_RESEED_SECONDS rather than on every request.
+    """
+
+    widest = max(board.window for board in trending.boards.values())
+    cutoff = datetime.utcnow() - timedelta(seconds=widest)
+
+    # the rollups hold the counts, rather than grouping likes and follows
+    rows = (
+        db.session.query(
+            Message.id,
+            Message.timestamp,
+            func.coalesce(LikeCount.likes, 0),
+            func.coalesce(FollowerCount.followers, 0),
+        )
+        .outerjoin(LikeCount, LikeCount.message_id == Message.id)
+        .outerjoin(FollowerCount, FollowerCount.user_id == Message.user_id)
+        .filter(Message.id >= id_for(cutoff))
+    )
+
+    trending.seed(
+        (msg_id, unix_time(timestamp), likes, followers)
+        for msg_id, timestamp, likes, followers in rows
+    )
+
+
+@views.route("/trending")
+def trending_messages():
+    """Show the highest scoring recent messages for a time window."""
+
+    window = request.args.get("window", "day")
+    if window not in trending.boards:
+        abort(404)
+
+    if (
+        trending.seeded_at is None
+        or time.time() - trending.seeded_at > current_app.config["TRENDING_RESEED_SECONDS"]
+    ):
+        seed_trending()
+
+    ids = trending.top(window)
+    found = {msg.id: msg for msg in Message.query.filter(Message.id.in_(ids))}
+    messages = [found[msg_id] for msg_id in ids if msg_id in found]
+
+    return render_template(
+        "messages/trending.html",
+        messages=messages,
+        window=window,
+        windows=trending.boards,
+    )
+
+
+##############################################################################
+# Live timeline
+
+
+def message_event(msg, user):
+    """What SSE clients need to render a new message."""
+
+    return {
+        # snowflake ids don't fit in a JavaScript number
+        "id": str(msg.id),
+        "user_id": user.id,
+        "username": user.username,
+        "image_url": user.image_url,
+        "text": msg.text,
+        "date": msg.timestamp.strftime("%d %B %Y"),
+    }
+
+
+@views.route("/stream")
+def stream():
+    """Server-sent events with new messages from the users g.user follows."""
+
+    if not g.user:
+        abort(401)
+
+    subscription = broker.subscribe(get_following_ids(g.user))
+    app_state().bridge.start()
+    heartbeat = current_app.config["SSE_HEARTBEAT_SECONDS"]
+
+    def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                payload = subscription.get(heartbeat)
+                if payload is None:
+                    yield ": heartbeat\n\n"
+                else:
+                    yield f"event: message\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+@views.route("/timeline/new")
+def timeline_new():
+    """How many messages from followed users are newer than `since`, as JSON.
+
+    Polled by the home page; see timeline.py for why this stays cheap.
+    """
+
+    if not g.user:
+        abort(401)
+
+    since = request.args.get("since", 0, type=int)
+    follow_graph = app_state().follow_graph
+    following_ids = (
+        follow_graph.following_ids(g.user.id) if follow_graph is not None else None
+    )
+    count = new_message_count(g.user.id, since, following_ids)
+    return jsonify(count=count, more=count >= COUNT_CAP)
+
+
+##############################################################################
+# Metrics
+
+
+@views.route("/metrics/jobs")
+def jobs_metrics():
+    """Job queue depth, throughput and lag as JSON."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    return jsonify(queue_metrics())
+
+
+@views.route("/metrics/cache")
+def cache_metrics():
+    """Object and page cache hit rates, and how this worker warmed up, as JSON."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    return jsonify(
+        dict(app_state().object_cache.metrics(), pages=app_state().page_cache.metrics(), startup=startup)
+    )
+
+
+@views.route("/metrics/ratelimit")
+def ratelimit_metrics():
+    """Requests let through and turned away by the rate limits, as JSON."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    return jsonify(limiter.metrics())
+
+
+@views.route("/admin/stats")
+def admin_stats():
+    """Activity per day and the most followed users and liked messages.
+
+    Only reads the rollup tables kept by rollups.py, never the tables they
+    count.
+    """
+
+    if not g.user or g.user.username not in current_app.config["ADMIN_USERNAMES"]:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    days = min(request.args.get("days", 14, type=int), 90)
+    return render_template(
+        "admin/stats.html",
+        days=days,
+        counts=daily_counts(days),
+        most_followed=most_followed(),
+        most_liked=most_liked(),
+    )
+
+
 ##############################################################################
 # Homepage and error pages
 
 
-@app.route("/")
+@views.route("/")
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: most recent messages of followed_users, a page at a time
     """
 
     if g.user:
-        # messages = Message.query.order_by(Message.timestamp.desc()).limit(100).all()
-        following_ids = [user.id for user in g.user.following]
-        messages = (
-            Message.query.filter(Message.user_id.in_(following_ids))
-            .order_by(Message.timestamp.desc())
-            .limit(100)
-            .all()
+        page_size = current_app.config["TIMELINE_PAGE_SIZE"]
+        before = request.args.get("before", type=int)
+
+        following_ids = get_following_ids(g.user)
+        messages = message_rows(
+            Message.user_id.in_(list(following_ids)), before=before, limit=page_size
         )
+        next_before = messages[-1].id if len(messages) == page_size else None
+
+        # later pages skip the layout, the user card and the suggestions
+        if request.args.get("fragment"):
+            return render_fragment(
+                "messages/_timeline_items.html",
+                next_before,
+                messages=messages,
+                liked_ids=liked_ids(messages),
+            )
 
-        return render_template("home.html", messages=messages)
+        # suggestions are precomputed by recommendations.py; drop any the
+        # user has followed since the last run
+        suggestions = [
+            suggestion.suggested_user
+            for suggestion in Suggestion.query.filter_by(user_id=g.user.id)
+            .options(db.joinedload(Suggestion.suggested_user))
+            .order_by(Suggestion.rank)
+            .all()
+            if suggestion.suggested_user_id not in following_ids
+        ][:5]
+
+        # the "N new warbles" count starts from the newest message shown, or
+        # from now on an empty first page; older pages don't poll or listen
+        if before:
+            newest_id = None
+        elif messages:
+            newest_id = messages[0].id
+        else:
+            newest_id = id_for(datetime.utcnow()) - 1
+
+        return render_template(
+            "home.html",
+            counts=profile_counts(g.user.id),
+            newest_id=newest_id,
+            poll_seconds=current_app.config["TIMELINE_POLL_SECONDS"],
+            messages=messages,
+            next_before=next_before,
+            suggestions=suggestions,
+            liked_ids=liked_ids(messages),
+        )
 
     else:
         return render_template("home-anon.html")
 
 
+@views.app_errorhandler(429)
+def too_many_requests(error):
+    """Rate limited (see ratelimit.py); the browser script gets JSON."""
+
+    if wants_json():
+        resp = jsonify(error="Too many requests.")
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(error.retry_after)
+        return resp
+    return error
+
+
 ##############################################################################
 # Turn off all caching in Flask
 #   (useful for dev; in production, this kind of stuff is typically
@@ -410,7 +1548,7 @@ def homepage():
 # https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
 
 
-@app.after_request
+@views.after_app_request
 def add_header(req):
     """Add non-caching headers on every request."""
 
@@ -419,3 +1557,4 @@ def add_header(req):
     req.headers["Expires"] = "0"
     req.headers["Cache-Control"] = "public, max-age=0"
     return req
+
@@ -0,0 +1,127 @@
+"""Benchmark the personal data export against loading the relationships.
+
+Seeds one big account, then exports it twice: once the way the templates
+read data (user.messages, user.likes and the follow relationships loaded
+into memory, then zipped) and once through export.py's streamed ZIP.
+Reports time and peak Python memory (tracemalloc) for each. It rebuilds
+the tables in the test database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_export.py
+"""
+
+import csv
+import io
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from app import create_app  # noqa: E402
+from export import export_files, stream_zip  # noqa: E402
+from models import db, Follows, Likes, Message, User  # noqa: E402
+from snowflake import next_id  # noqa: E402
+
+app = create_app("testing")
+
+MESSAGES = 100_000
+OTHERS = 2_000
+LIKES = 20_000
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com", password="x")
+            for i in range(1, OTHERS + 2)
+        ],
+    )
+    db.session.execute(
+        Message.__table__.insert(),
+        [
+            dict(
+                id=next_id(),
+                text="Warble " * 15,
+                # user 1's own messages, then user 2's for user 1 to like
+                user_id=1 if i < MESSAGES else 2,
+                timestamp=datetime.utcnow(),
+            )
+            for i in range(MESSAGES + LIKES)
+        ],
+    )
+    liked = db.session.query(Message.id).filter(Message.user_id == 2)
+    db.session.execute(
+        Likes.__table__.insert(),
+        [dict(user_id=1, message_id=msg_id) for (msg_id,) in liked],
+    )
+    db.session.execute(
+        Follows.__table__.insert(),
+        [
+            dict(user_following_id=i, user_being_followed_id=1)
+            for i in range(2, OTHERS + 2)
+        ]
+        + [
+            dict(user_following_id=1, user_being_followed_id=i)
+            for i in range(2, OTHERS + 2)
+        ],
+    )
+    db.session.commit()
+
+
+def relationships_export(user_id):
+    """Everything loaded through the ORM, written to an in-memory ZIP."""
+
+    user = db.session.get(User, user_id)
+    files = {
+        "messages.csv": [(m.id, m.timestamp.isoformat(), m.text) for m in user.messages],
+        "likes.csv": [(m.id, m.user.username, m.text) for m in user.likes],
+        "following.csv": [(u.id, u.username) for u in user.following],
+        "followers.csv": [(u.id, u.username) for u in user.followers],
+    }
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, rows in files.items():
+            text = io.StringIO()
+            csv.writer(text).writerows(rows)
+            archive.writestr(name, text.getvalue())
+    return len(out.getvalue())
+
+
+def streamed_export(user_id):
+    return sum(len(chunk) for chunk in stream_zip(export_files(user_id)))
+
+
+def measure(export):
+    """(seconds, peak MiB, ZIP bytes)."""
+
+    db.session.remove()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = export(1)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+    return elapsed, peak / 2**20, size
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        seed()
+
+        print(f"{MESSAGES} messages, {LIKES} likes, {OTHERS} followers and following\n")
+        print(f"{'path':<15} {'seconds':>8} {'peak MiB':>9} {'ZIP KiB':>8}")
+        for name, export in (
+            ("relationships", relationships_export),
+            ("streamed", streamed_export),
+        ):
+            seconds, peak, size = measure(export)
+            print(f"{name:<15} {seconds:>8.2f} {peak:>9.1f} {size / 1024:>8.0f}")
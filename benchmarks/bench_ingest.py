@@ -0,0 +1,96 @@
+"""Benchmark posting a batch of messages one at a time against in bulk.
+
+Posts the same BATCH messages through post_message() in a loop (what an
+integration driving the form does, minus the HTTP round trips) and then
+through post_messages(), with jobs run inline. Reports wall time, time per
+message and the number of SQL statements each way. It rebuilds the tables
+in the test database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_ingest.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, post_message, post_messages  # noqa: E402
+from models import db, Follows, Message, User  # noqa: E402
+
+app = create_app("testing")
+app.config["JOBS_EAGER"] = True
+
+BATCH = 200
+FOLLOWERS = 100
+ROUNDS = 3
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com", password="x")
+            for i in range(1, FOLLOWERS + 2)
+        ],
+    )
+    db.session.execute(
+        Follows.__table__.insert(),
+        [
+            dict(user_following_id=i, user_being_followed_id=1)
+            for i in range(2, FOLLOWERS + 2)
+        ],
+    )
+    db.session.commit()
+
+
+def one_at_a_time(user, texts):
+    for text in texts:
+        post_message(user, text)
+
+
+def measure(post, texts):
+    """(ms for the whole batch, SQL statements run)."""
+
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        best = None
+        for _ in range(ROUNDS):
+            Message.query.delete()
+            db.session.commit()
+            statements = 0
+            user = User.query.get(1)
+
+            start = time.perf_counter()
+            post(user, texts)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    return best, statements
+
+
+if __name__ == "__main__":
+    texts = [f"Automated warble number {i} #bench @user{i % 50 + 2}" for i in range(BATCH)]
+
+    with app.test_request_context():
+        seed()
+
+        print(f"{BATCH} messages, best of {ROUNDS}\n")
+        print(f"{'path':<16} {'ms':>9} {'ms/msg':>8} {'statements':>11}")
+        for name, post in (("one at a time", one_at_a_time), ("batch", post_messages)):
+            ms, statements = measure(post, texts)
+            print(f"{name:<16} {ms:>9.1f} {ms / BATCH:>8.3f} {statements:>11}")
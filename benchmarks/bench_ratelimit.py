@@ -0,0 +1,104 @@
+"""Benchmark the cost of rate limiting a request.
+
+Times `LocalBuckets.take()` on its own (one busy client, many distinct
+clients, and several threads sharing the buckets), then the same bare
+Flask view served with and without `limiter.limit()` through the test
+client. The difference per request is what the limit adds. No database
+is involved.
+
+    python benchmarks/bench_ratelimit.py
+"""
+
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask, g
+
+from ratelimit import LocalBuckets, limiter
+
+CALLS = 200_000
+CLIENTS = 100_000
+THREADS = 8
+REQUESTS = 5_000
+RATE, BURST = 1_000_000, 1_000_000
+
+
+def per_call_us(seconds, calls):
+    return seconds / calls * 1_000_000
+
+
+def report(label, us):
+    print(f"{label:<28} {us:7.2f} us")
+
+
+def bench_take():
+    buckets = LocalBuckets()
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        buckets.take("one", RATE, BURST)
+    report("take(), one client", per_call_us(time.perf_counter() - start, CALLS))
+
+    buckets = LocalBuckets()
+    keys = [f"ip:{i}" for i in range(CLIENTS)]
+    start = time.perf_counter()
+    for i in range(CALLS):
+        buckets.take(keys[i % CLIENTS], RATE, BURST)
+    report(f"take(), {CLIENTS} clients", per_call_us(time.perf_counter() - start, CALLS))
+
+    buckets = LocalBuckets()
+
+    def worker(n):
+        for i in range(CALLS // THREADS):
+            buckets.take(f"ip:{n}:{i % 1000}", RATE, BURST)
+
+    threads = [Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(f"take(), {THREADS} threads", per_call_us(time.perf_counter() - start, CALLS))
+
+
+def bench_requests():
+    app = Flask(__name__)
+    app.config["RATELIMIT_ENABLED"] = True
+    app.config["RATELIMIT_URL"] = None
+    app.config["RATE_LIMITS"] = {"bench": f"{BURST}/second"}
+    limiter.init_app(app)
+
+    @app.before_request
+    def anonymous():
+        g.user = None
+
+    @app.route("/plain")
+    def plain():
+        return "ok"
+
+    @app.route("/limited")
+    @limiter.limit("bench")
+    def limited():
+        return "ok"
+
+    client = app.test_client()
+    timings = {}
+    for path in ("/plain", "/limited", "/plain", "/limited"):
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get(path)
+        # keep the second, warmed up, run of each
+        timings[path] = per_call_us(time.perf_counter() - start, REQUESTS)
+
+    report("request, no limit", timings["/plain"])
+    report("request, limited", timings["/limited"])
+    report("overhead per request", timings["/limited"] - timings["/plain"])
+
+
+if __name__ == "__main__":
+    bench_take()
+    print()
+    bench_requests()
@@ -0,0 +1,126 @@
+"""Benchmark ORM hydration against the read-model projections.
+
+Loads the same home-timeline page and user list both ways and reports the
+CPU time per load and the memory held by the result. It rebuilds the tables
+in the test database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_readmodels.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from app import create_app  # noqa: E402
+from models import db, Message, User  # noqa: E402
+from readmodels import message_rows, user_cards, user_cards_query  # noqa: E402
+from snowflake import next_id  # noqa: E402
+
+app = create_app("testing")
+
+USERS = 1_000
+MESSAGES_PER_USER = 20
+PAGE = 100
+ROUNDS = 50
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(
+                id=i,
+                username=f"user{i}",
+                email=f"user{i}@example.com",
+                password="x",
+                bio="A bio of a reasonable length for a user card. " * 2,
+            )
+            for i in range(1, USERS + 1)
+        ],
+    )
+    db.session.execute(
+        Message.__table__.insert(),
+        [
+            dict(id=next_id(), text="Warble " * 15, user_id=user_id, timestamp=datetime.utcnow())
+            for user_id in range(1, USERS + 1)
+            for _ in range(MESSAGES_PER_USER)
+        ],
+    )
+    db.session.commit()
+
+
+def orm_timeline(ids):
+    return (
+        Message.query.filter(Message.user_id.in_(ids))
+        .options(db.joinedload(Message.user))
+        .order_by(Message.id.desc())
+        .limit(PAGE)
+        .all()
+    )
+
+
+def rows_timeline(ids):
+    return message_rows(Message.user_id.in_(ids), limit=PAGE)
+
+
+def orm_users():
+    return User.query.order_by(User.id).all()
+
+
+def rows_users():
+    return list(user_cards(user_cards_query().order_by(User.id)))
+
+
+def measure(load, render):
+    """(ms of CPU per load, KiB still held by one result)."""
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        render(load())
+        db.session.remove()
+    cpu_ms = (time.process_time() - start) / ROUNDS * 1000
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = load()
+    render(result)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    db.session.remove()
+    del result
+
+    return cpu_ms, held / 1024
+
+
+def touch_messages(messages):
+    for msg in messages:
+        (msg.id, msg.text, msg.timestamp, msg.user.id, msg.user.username, msg.user.image_url)
+
+
+def touch_users(users):
+    for user in users:
+        (user.id, user.username, user.image_url, user.header_image_url, user.bio)
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        seed()
+        ids = list(range(1, USERS + 1, 3))
+
+        print(f"{'page':<22} {'path':<6} {'cpu ms':>8} {'held KiB':>9}")
+        for name, orm, rows, touch in (
+            (f"timeline ({PAGE} msgs)", lambda: orm_timeline(ids), lambda: rows_timeline(ids), touch_messages),
+            (f"user list ({USERS})", orm_users, rows_users, touch_users),
+        ):
+            for path, load in (("orm", orm), ("rows", rows)):
+                cpu_ms, held = measure(load, touch)
+                print(f"{name:<22} {path:<6} {cpu_ms:>8.2f} {held:>9.1f}")
@@ -0,0 +1,97 @@
+"""Benchmark the "who to follow" batch scoring.
+
+Builds a follows graph of USERS users who each follow FOLLOWING (then four
+times as many) others, mostly popular accounts, and times scoring a sample
+of users with recommendations.suggest_for(), then the whole batch across
+PROCESSES workers. A user's cost grows with the square of how many they
+follow; the batch runs offline, outside any request, so the dict loop is
+fine while it takes seconds. If NumPy and SciPy are installed the sample is
+also scored as a sparse matrix product (a chunk of rows of A times A), to
+check when vectorizing would pay for the extra dependencies:
+
+    python benchmarks/bench_recommendations.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from graph import CSRGraph  # noqa: E402
+from recommendations import compute_suggestions, suggest_for  # noqa: E402
+
+USERS = 20_000
+FOLLOWING = 30
+SAMPLE = 2_000
+TOP = 10
+CHUNK = 500
+PROCESSES = 4
+
+
+def build_graph(following):
+    rng = random.Random(0)
+    # a few accounts are followed by nearly everyone, most by a handful
+    weights = [1 / rank for rank in range(1, USERS + 1)]
+    edges = set()
+    for src in range(1, USERS + 1):
+        for dst in rng.choices(range(1, USERS + 1), weights, k=following):
+            if dst != src:
+                edges.add((src, dst))
+    return CSRGraph.from_edges(edges)
+
+
+def loop_us(graph):
+    start = time.perf_counter()
+    for i in range(SAMPLE):
+        suggest_for(graph, i, TOP)
+    return (time.perf_counter() - start) / SAMPLE * 1e6
+
+
+def sparse_us(graph):
+    try:
+        import numpy as np
+        from scipy.sparse import csr_matrix
+    except ImportError:
+        return None
+
+    n = len(graph)
+    adjacency = csr_matrix(
+        (
+            np.ones(len(graph.indices), dtype=np.int32),
+            np.frombuffer(graph.indices, dtype=np.int64),
+            np.frombuffer(graph.indptr, dtype=np.int64),
+        ),
+        shape=(n, n),
+    )
+
+    start = time.perf_counter()
+    for chunk in range(0, SAMPLE, CHUNK):
+        rows = adjacency[chunk : chunk + CHUNK]
+        counts = (rows @ adjacency).toarray()
+        counts[rows.nonzero()] = 0
+        counts[np.arange(len(counts)), np.arange(chunk, chunk + len(counts))] = 0
+        top = np.argpartition(-counts, TOP, axis=1)[:, :TOP]
+        np.take_along_axis(counts, top, axis=1)
+    return (time.perf_counter() - start) / SAMPLE * 1e6
+
+
+def batch_s(graph):
+    start = time.perf_counter()
+    for _ in compute_suggestions(graph, TOP, PROCESSES, CHUNK):
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"{USERS} users, top {TOP}, sample of {SAMPLE}\n")
+    print(f"{'following':>10} {'loop us/user':>13} {'sparse us/user':>15} {'batch s':>9}")
+    for following in (FOLLOWING, FOLLOWING * 4):
+        graph = build_graph(following)
+        sparse = sparse_us(graph)
+        sparse = "n/a" if sparse is None else f"{sparse:.1f}"
+        print(
+            f"{following:>10} {loop_us(graph):>13.1f} {sparse:>15}"
+            f" {batch_s(graph):>9.2f}"
+        )
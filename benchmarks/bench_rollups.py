@@ -0,0 +1,147 @@
+"""Benchmark the admin stats read from rollups against GROUP BYs on demand.
+
+Seeds USERS users, MESSAGES messages over the last DAYS days, and random
+follows and likes, then times what /admin/stats needs (per-day counts, most
+followed users, most liked messages) computed straight from messages,
+follows and likes, and read from the rollup tables. Also times the extra
+upserts a like costs on the write path. It rebuilds the tables in the test
+database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_rollups.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from sqlalchemy import cast, Date  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Follows, Likes, Message, User  # noqa: E402
+from partitions import create_partitions  # noqa: E402
+from rollups import (  # noqa: E402
+    daily_counts,
+    most_followed,
+    most_liked,
+    rebuild,
+    record_daily,
+    record_likes,
+)
+from snowflake import id_for  # noqa: E402
+
+app = create_app("testing")
+
+USERS = 2000
+MESSAGES = 200000
+FOLLOWS = 100000
+LIKES = 200000
+DAYS = 14
+ROUNDS = 5
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        create_partitions(connection, now - timedelta(days=DAYS))
+
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com", password="x")
+            for i in range(1, USERS + 1)
+        ],
+    )
+
+    message_ids = []
+    rows = []
+    for i in range(MESSAGES):
+        # evenly spread, so every message gets its own millisecond
+        when = now - timedelta(seconds=i * DAYS * 86400 / MESSAGES)
+        msg_id = id_for(when)
+        message_ids.append(msg_id)
+        rows.append(
+            dict(id=msg_id, text="x", timestamp=when, user_id=rng.randint(1, USERS))
+        )
+    db.session.execute(Message.__table__.insert(), rows)
+
+    pairs = {
+        (rng.randint(1, USERS), rng.randint(1, USERS)) for _ in range(FOLLOWS)
+    }
+    db.session.execute(
+        Follows.__table__.insert(),
+        [
+            dict(user_following_id=a, user_being_followed_id=b)
+            for a, b in pairs
+            if a != b
+        ],
+    )
+
+    likes = {(rng.randint(1, USERS), rng.choice(message_ids)) for _ in range(LIKES)}
+    db.session.execute(
+        Likes.__table__.insert(),
+        [dict(user_id=user_id, message_id=msg_id) for user_id, msg_id in likes],
+    )
+
+    rebuild()
+    db.session.commit()
+
+
+def on_demand():
+    first = datetime.utcnow().date() - timedelta(days=DAYS - 1)
+    for column in (Message.timestamp, Follows.created_at, Likes.created_at):
+        day = cast(column, Date)
+        db.session.query(day, db.func.count()).filter(day >= first).group_by(
+            day
+        ).all()
+
+    followers = db.func.count().label("followers")
+    db.session.query(Follows.user_being_followed_id, followers).group_by(
+        Follows.user_being_followed_id
+    ).order_by(followers.desc()).limit(10).all()
+
+    likes = db.func.count().label("likes")
+    db.session.query(Likes.message_id, likes).group_by(Likes.message_id).order_by(
+        likes.desc()
+    ).limit(10).all()
+
+
+def from_rollups():
+    daily_counts(DAYS)
+    most_followed()
+    most_liked()
+
+
+def write_path():
+    record_daily("likes")
+    record_likes(1, 1)
+    db.session.rollback()
+
+
+def best_ms(fn, rounds=ROUNDS):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        seed()
+
+        print(f"{MESSAGES} messages, {FOLLOWS} follows, {LIKES} likes, best of {ROUNDS}\n")
+        print(f"{'stats page':<22} {'ms':>9}")
+        print(f"{'GROUP BY on demand':<22} {best_ms(on_demand):>9.2f}")
+        print(f"{'rollups':<22} {best_ms(from_rollups):>9.2f}")
+        print(f"\n{'upserts per like':<22} {best_ms(write_path, 50):>9.2f}")
@@ -0,0 +1,93 @@
+"""Benchmark request coalescing under a burst.
+
+A burst of concurrent requests for one cold key either each run the slow
+load (a stand-in for a profile query plus render, through a connection
+pool of POOL_SIZE) or share one run through SingleFlight. Once the render is stale, RenderCache keeps answering from
+the old copy while a single request re-renders it.
+
+    python benchmarks/bench_singleflight.py
+"""
+
+import os
+import sys
+import time
+from statistics import median
+from threading import Barrier, BoundedSemaphore, Lock, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache import RenderCache, SingleFlight
+
+LOAD_SECONDS = 0.05
+POOL_SIZE = 10
+BURST = 200
+
+
+class SlowLoad:
+    """Sleeps like a query would and counts how often it ran."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = Lock()
+        self._pool = BoundedSemaphore(POOL_SIZE)
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        with self._pool:
+            time.sleep(LOAD_SECONDS)
+        return "<html>...</html>"
+
+
+def burst(fn, threads=BURST):
+    """Run `fn` from `threads` threads at once; (wall, median, worst) seconds."""
+
+    barrier = Barrier(threads + 1)
+    latencies = []
+
+    def worker():
+        barrier.wait()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    workers = [Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, median(latencies), max(latencies)
+
+
+def report(name, load, timings):
+    wall, p50, worst = (seconds * 1000 for seconds in timings)
+    print(f"{name:<24} {load.calls:>6} {wall:>8.0f} {p50:>7.1f} {worst:>9.0f}")
+
+
+def main():
+    print(
+        f"{BURST} concurrent requests, {LOAD_SECONDS * 1000:.0f} ms per load, "
+        f"pool of {POOL_SIZE}"
+    )
+    print(f"{'strategy':<24} {'loads':>6} {'wall ms':>8} {'p50 ms':>7} {'worst ms':>9}")
+
+    load = SlowLoad()
+    report("no coalescing", load, burst(load))
+
+    load = SlowLoad()
+    flight = SingleFlight()
+    report("single flight", load, burst(lambda: flight.do("/users/1", load)))
+
+    # a stale render: one request revalidates, the rest are served at once
+    load = SlowLoad()
+    pages = RenderCache(fresh=0.001, stale=60)
+    pages.get("/users/1", load)
+    time.sleep(0.01)
+    load.calls = 0
+    report("stale-while-revalidate", load, burst(lambda: pages.get("/users/1", load)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark worker start-up with and without a cache snapshot.
+
+A "old" worker caches every user and a set of hot messages, then writes a
+snapshot. Two new workers then replay the same skewed stream of lookups,
+one starting cold and one attached to the snapshot. Reported per worker:
+time to attach, time for the stream, database misses, and how many lookups
+it took to reach the warm hit rate. Rebuilds the tables in the test
+database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_snapshot.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from app import create_app  # noqa: E402
+from cache import LRUCache, ObjectCache  # noqa: E402
+from models import db, Message, User  # noqa: E402
+from snapshot import Snapshot, write_snapshot  # noqa: E402
+from snowflake import next_id  # noqa: E402
+
+app = create_app("testing")
+
+USERS = 2_000
+MESSAGES = 10_000
+LOOKUPS = 5_000
+WARM_HIT_RATE = 0.8
+WINDOW = 200
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com", password="x")
+            for i in range(1, USERS + 1)
+        ],
+    )
+    message_ids = [next_id() for _ in range(MESSAGES)]
+    db.session.execute(
+        Message.__table__.insert(),
+        [
+            dict(id=msg_id, text="Warble " * 15, user_id=i % USERS + 1, timestamp=datetime.utcnow())
+            for i, msg_id in enumerate(message_ids)
+        ],
+    )
+    db.session.commit()
+    return message_ids
+
+
+def lookup_stream(message_ids):
+    """Skewed (Pareto) mix of user and message lookups, like real traffic."""
+
+    rng = random.Random(42)
+    stream = []
+    for _ in range(LOOKUPS):
+        rank = min(int(rng.paretovariate(0.4)) - 1, MESSAGES - 1)
+        if rng.random() < 0.5:
+            stream.append((User, rank % USERS + 1))
+        else:
+            stream.append((Message, message_ids[rank]))
+    return stream
+
+
+def replay(cache, stream):
+    """(ms for the stream, database misses, lookups until warm)."""
+
+    warm_after = None
+    recent = []
+    start = time.perf_counter()
+    for i, (model, ident) in enumerate(stream, 1):
+        misses = cache.stats["misses"]
+        cache.get(db.session, model, ident)
+        recent.append(cache.stats["misses"] == misses)
+        if len(recent) > WINDOW:
+            recent.pop(0)
+        if warm_after is None and len(recent) == WINDOW and sum(recent) / WINDOW >= WARM_HIT_RATE:
+            warm_after = i
+        if i % 100 == 0:
+            db.session.remove()
+    elapsed = (time.perf_counter() - start) * 1000
+    db.session.remove()
+    return elapsed, cache.stats["misses"], warm_after
+
+
+if __name__ == "__main__":
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        message_ids = seed()
+        stream = lookup_stream(message_ids)
+        path = os.path.join(directory, "cache.snapshot")
+
+        old = ObjectCache(LRUCache(maxsize=20_000, ttl=600))
+        replay(old, stream)
+        start = time.perf_counter()
+        write_snapshot(path, {"objects": old.dump()})
+        write_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"snapshot: {len(old.local)} rows, {os.path.getsize(path) / 1024:.0f} KiB, "
+            f"written in {write_ms:.1f} ms"
+        )
+
+        print(f"{'worker':<10} {'attach ms':>9} {'stream ms':>9} {'db misses':>9} {'warm after':>10}")
+        for name in ("cold", "snapshot"):
+            cache = ObjectCache(LRUCache(maxsize=20_000, ttl=600))
+            start = time.perf_counter()
+            if name == "snapshot":
+                cache.attach(Snapshot(path))
+            attach_ms = (time.perf_counter() - start) * 1000
+            elapsed, misses, warm_after = replay(cache, stream)
+            print(f"{name:<10} {attach_ms:>9.2f} {elapsed:>9.0f} {misses:>9} {str(warm_after):>10}")
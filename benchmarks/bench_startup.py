@@ -0,0 +1,76 @@
+"""Benchmark cold start for each config profile.
+
+Each run is a fresh interpreter that imports app.py and calls
+create_app() for one profile, so nothing is shared between runs. Reported
+per profile (median of RUNS): time to import app.py, time for
+create_app(), modules loaded, and the total wall time of the process. No
+database connection is made.
+
+    python benchmarks/bench_startup.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from statistics import median
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+RUNS = 7
+PROFILES = ("development", "testing", "production")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(sys.argv[1])
+booted = time.perf_counter()
+print(json.dumps(dict(
+    import_ms=(imported - start) * 1000,
+    boot_ms=(booted - imported) * 1000,
+    modules=len(sys.modules),
+)))
+"""
+
+
+def cold_start(profile):
+    """One fresh process booting `profile`: its timings, plus total wall time."""
+
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "bench-startup")
+
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, profile],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(out.stdout)
+    result["process_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    print(f"{RUNS} cold starts per profile (median)\n")
+    print(
+        f"{'profile':<12} {'import ms':>10} {'boot ms':>8} "
+        f"{'process ms':>11} {'modules':>8}"
+    )
+
+    for profile in PROFILES:
+        runs = [cold_start(profile) for _ in range(RUNS)]
+        stat = {key: median(run[key] for run in runs) for key in runs[0]}
+        print(
+            f"{profile:<12} {stat['import_ms']:>10.1f} {stat['boot_ms']:>8.1f} "
+            f"{stat['process_ms']:>11.1f} {stat['modules']:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark the "N new warbles" poll against counting over messages.
+
+Seeds USERS users who each follow FOLLOWING others and MESSAGES messages,
+then times one poll from the newest message as the home page sends it:
+counting the followed users' newer messages with a query over `messages`,
+and timeline.new_message_count(), which reads latest_posts first. Both run
+once with nothing new and once after NEW fresh posts. It rebuilds the
+tables in the test database first, so don't point it at real data:
+
+    DATABASE_URL=postgresql:///warbler_test python benchmarks/bench_timeline.py
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("DATABASE_URL", "postgresql:///warbler_test")
+
+from app import create_app, post_message  # noqa: E402
+from models import db, Follows, Message, User  # noqa: E402
+from partitions import create_partitions  # noqa: E402
+from snowflake import id_for  # noqa: E402
+from timeline import backfill, new_message_count  # noqa: E402
+
+app = create_app("testing")
+app.config["JOBS_EAGER"] = True
+
+USERS = 5000
+FOLLOWING = 200
+MESSAGES = 500000
+NEW = 5
+ROUNDS = 20
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        create_partitions(connection, now - timedelta(days=30))
+
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com", password="x")
+            for i in range(1, USERS + 1)
+        ],
+    )
+    db.session.execute(
+        Follows.__table__.insert(),
+        [
+            dict(user_following_id=1, user_being_followed_id=followed)
+            for followed in rng.sample(range(2, USERS + 1), FOLLOWING)
+        ],
+    )
+    db.session.execute(
+        Message.__table__.insert(),
+        [
+            # evenly spread, so every message gets its own millisecond
+            dict(
+                id=id_for(now - timedelta(seconds=i * 30 * 86400 / MESSAGES)),
+                text="x",
+                user_id=rng.randint(2, USERS),
+            )
+            for i in range(MESSAGES)
+        ],
+    )
+    backfill()
+    db.session.commit()
+
+
+def scan(user_id, since):
+    followed = db.session.query(Follows.user_being_followed_id).filter(
+        Follows.user_following_id == user_id
+    )
+    return (
+        db.session.query(db.func.count(Message.id))
+        .filter(Message.user_id.in_(followed.scalar_subquery()), Message.id > since)
+        .scalar()
+    )
+
+
+def best_ms(fn, *args):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    with app.test_request_context():
+        seed()
+        since = db.session.query(db.func.max(Message.id)).scalar()
+
+        print(f"{MESSAGES} messages, following {FOLLOWING}, best of {ROUNDS}\n")
+        print(f"{'poll':<22} {'scan ms':>9} {'index ms':>9}")
+        print(
+            f"{'nothing new':<22} {best_ms(scan, 1, since):>9.2f}"
+            f" {best_ms(new_message_count, 1, since):>9.2f}"
+        )
+
+        author = db.session.query(Follows.user_being_followed_id).first()[0]
+        for i in range(NEW):
+            post_message(db.session.get(User, author), f"New {i}")
+        assert scan(1, since) == new_message_count(1, since) == NEW
+        print(
+            f"{f'{NEW} new':<22} {best_ms(scan, 1, since):>9.2f}"
+            f" {best_ms(new_message_count, 1, since):>9.2f}"
+        )
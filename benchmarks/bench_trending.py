@@ -0,0 +1,55 @@
+"""Benchmark the trending board.
+
+Per-operation cost should grow with log K for updates and with K for reads,
+and should not depend on how many messages have been seen in total.
+
+    python benchmarks/bench_trending.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from trending import TrendingBoard
+
+NOW = 1_700_000_000
+UPDATES = 200_000
+READS = 2_000
+
+
+def bench(k):
+    rng = random.Random(k)
+    board = TrendingBoard(k=k, window=7 * 24 * 60 * 60, half_life=6 * 60 * 60)
+    events = [
+        (rng.randrange(UPDATES // 4), NOW - rng.randrange(86400), rng.randrange(50), rng.randrange(5000))
+        for _ in range(UPDATES)
+    ]
+
+    start = time.perf_counter()
+    for msg_id, created, likes, followers in events:
+        board.update(msg_id, created, likes, followers, NOW)
+    update_us = (time.perf_counter() - start) / UPDATES * 1e6
+
+    start = time.perf_counter()
+    for _ in range(READS):
+        board.top(NOW)
+    read_us = (time.perf_counter() - start) / READS * 1e6
+
+    # a like between every read forces the ranking to be rebuilt
+    start = time.perf_counter()
+    for msg_id, created, likes, followers in events[:READS]:
+        board.update(msg_id, created, likes + 1, followers, NOW)
+        board.top(NOW)
+    busy_us = (time.perf_counter() - start) / READS * 1e6
+
+    return update_us, read_us, busy_us
+
+
+if __name__ == "__main__":
+    print(f"{'K':>6} {'update us':>10} {'read us':>10} {'read us/K':>10} {'update+read us':>15}")
+    for k in (10, 100, 1_000, 10_000):
+        update_us, read_us, busy_us = bench(k)
+        print(f"{k:>6} {update_us:>10.2f} {read_us:>10.1f} {read_us / k:>10.3f} {busy_us:>15.1f}")
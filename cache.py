@@ -0,0 +1,480 @@
+"""Read-through cache for user and message lookups.
+
+Rows are cached as plain dicts of column values, never as ORM instances,
+so a cached row can be handed to any session: `ObjectCache.get()` rebuilds
+the instance and attaches it with ``session.merge(load=False)``, which
+skips the SELECT entirely. Relationships still lazy-load as usual, and so
+do the UNCACHED_COLUMNS (password hashes and emails), which are left out.
+
+There are two levels:
+
+- `LRUCache`, per process, bounded by item count and TTL (backed by a
+  snapshot of another worker's cache when one is attached, see snapshot.py;
+  a snapshot row is served only until it would have expired in the worker
+  that wrote it);
+- an optional shared backend (`RedisBackend` when CACHE_URL is set, which
+  needs the `redis` package, or `LocalBackend` as a stand-in for tests).
+
+Keys are version-stamped with a hash of the model's columns, so a deploy
+that changes a table never reads rows cached in the old shape, and with a
+per-table generation that `invalidate_all()` bumps after bulk deletes.
+
+Every worker has its own LRU, so invalidations are also announced (over
+Postgres NOTIFY in the app, see `announce`) and each other worker drops its
+copy when it hears of them with `forget()`.
+
+Misses go through a `SingleFlight`, so a burst of requests for the same
+cold row runs one query. `RenderCache` does the same for whole rendered
+pages, and keeps serving the last render while one request re-renders it
+(stale-while-revalidate).
+"""
+
+import hashlib
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from threading import Event, Lock
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+KEY_PREFIX = "warbler:v2"
+
+# never copied into the caches (or snapshots, or Redis); they are loaded
+# from the database on the rare page that reads them
+UNCACHED_COLUMNS = frozenset({"password", "email"})
+
+
+class LRUCache:
+    """Thread-safe LRU dict whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """(key, value) pairs that have not expired, oldest use first."""
+
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires) in self._data.items() if expires >= now
+            ]
+
+    def expiring_items(self):
+        """(key, value, expiry as unix time) for entries that have not expired."""
+
+        now = time.monotonic()
+        wall = time.time()
+        with self._lock:
+            return [
+                (key, value, wall + expires - now)
+                for key, (value, expires) in self._data.items()
+                if expires >= now
+            ]
+
+
+class LocalBackend:
+    """In-process stand-in for a shared backend.
+
+    Values are pickled like they would be over the wire, so tests exercise
+    the same round trip as `RedisBackend`.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._counters = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return pickle.loads(entry[0])
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (pickle.dumps(value), time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    """Shared backend on Redis (``pip install redis``)."""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        data = self.client.get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value), ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def counter(self, key):
+        return int(self.client.get(key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for its result (or exception) instead of running it again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self.stats = dict(runs=0, coalesced=0)
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["runs"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class RenderCache:
+    """Rendered pages, fresh for `fresh` seconds and then stale for `stale`.
+
+    A fresh page is served as is. Once it goes stale, the next request
+    re-renders it while concurrent requests keep getting the stale copy;
+    with no copy at all, concurrent requests wait on a single render.
+    """
+
+    def __init__(self, maxsize=1000, fresh=5, stale=60):
+        self.fresh = fresh
+        self.pages = LRUCache(maxsize, fresh + stale)
+        self.flight = SingleFlight()
+        self.stats = dict(fresh_hits=0, stale_hits=0)
+
+    def get(self, key, render):
+        """The page for `key`, calling `render()` only when it has to."""
+
+        entry = self.pages.get(key)
+        if entry is not None:
+            page, rendered_at = entry
+            if time.monotonic() - rendered_at < self.fresh:
+                self.stats["fresh_hits"] += 1
+                return page
+            if self.flight.in_flight(key):
+                self.stats["stale_hits"] += 1
+                return page
+
+        return self.flight.do(key, lambda: self._render(key, render))
+
+    def invalidate(self, key):
+        self.pages.delete(key)
+
+    def clear(self):
+        self.pages.clear()
+
+    def metrics(self):
+        return dict(self.stats, **self.flight.stats, pages=len(self.pages))
+
+    def _render(self, key, render):
+        page = render()
+        self.pages.set(key, (page, time.monotonic()))
+        return page
+
+
+def schema_version(model):
+    """Short hash of a model's table name and column names."""
+
+    columns = ",".join(column.key for column in inspect(model).column_attrs)
+    digest = hashlib.sha1(f"{model.__tablename__}:{columns}".encode())
+    return digest.hexdigest()[:8]
+
+
+class ObjectCache:
+    """Read-through cache of rows by primary key, in front of a session."""
+
+    def __init__(self, local, shared=None, shared_ttl=300, announce=None):
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        # announce(payload) tells the other workers about an invalidation
+        self.announce = announce
+        self.origin = uuid.uuid4().hex
+        self._generations = {}
+        self._versions = {}
+        self.flight = SingleFlight()
+        self.snapshot = None
+        self._masked = set()
+        self._from_snapshot = set()
+        self.stats = dict(
+            local_hits=0, snapshot_hits=0, shared_hits=0, misses=0, invalidations=0
+        )
+
+    def get(self, session, model, ident):
+        """The `model` row with primary key `ident`, or None."""
+
+        state = self.local.get(self._key(model, ident))
+        if state is not None:
+            self.stats["local_hits"] += 1
+            return self._attach(session, model, state)
+
+        if self.shared is not None:
+            self._sync_generation(model)
+        key = self._key(model, ident)
+
+        if self.shared is not None:
+            state = self.shared.get(key)
+            if state is not None:
+                self.stats["shared_hits"] += 1
+                self.local.set(key, state)
+                self._from_snapshot.discard(key)
+                return self._attach(session, model, state)
+
+        state = self._from_snapshot_entry(key)
+        if state is not None:
+            self.stats["snapshot_hits"] += 1
+            return self._attach(session, model, state)
+
+        # concurrent misses for the same row wait on one query
+        loaded = {}
+        state = self.flight.do(key, lambda: self._load(session, model, ident, loaded))
+        if "obj" in loaded:
+            return loaded["obj"]
+        return None if state is None else self._attach(session, model, state)
+
+    def invalidate(self, model, ident):
+        """Drop one row, after it has been updated or deleted."""
+
+        self._drop_local(self._key(model, ident))
+        if self.shared is not None:
+            self.shared.delete(self._key(model, ident))
+        self.stats["invalidations"] += 1
+        self._announce(model, ident)
+
+    def attach(self, snapshot):
+        """Serve rows from a `snapshot.Snapshot` on local and shared misses.
+
+        Each row is only served until it would have expired from the cache
+        of the worker that wrote the snapshot, so rows changed by another
+        worker are no staler than they would be in that worker's own LRU.
+        """
+
+        self.snapshot = snapshot
+        self._masked.clear()
+        self._from_snapshot.clear()
+
+    def dump(self):
+        """{key: (row, expiry as unix time)}, for `snapshot.write_snapshot`.
+
+        Rows this cache only took from an attached snapshot are left out, so
+        a row is never passed from snapshot to snapshot without a reload.
+        """
+
+        return {
+            key: (state, expires_at)
+            for key, state, expires_at in self.local.expiring_items()
+            if key not in self._from_snapshot
+        }
+
+    def invalidate_all(self, model):
+        """Orphan every cached `model` row by moving to a new generation."""
+
+        if self.shared is not None:
+            self._generations[model] = self.shared.incr(self._generation_key(model))
+        else:
+            self._generations[model] = self._generations.get(model, 0) + 1
+        self.stats["invalidations"] += 1
+        self._announce(model)
+
+    def forget(self, payload):
+        """Apply an invalidation announced by another worker.
+
+        A single row is dropped from this worker's LRU; a whole table moves
+        to the shared generation, or without a shared backend to a new one
+        of this worker's own.
+        """
+
+        if payload["origin"] == self.origin:
+            return
+        model = next(
+            (m for m in self._versions if m.__tablename__ == payload["table"]), None
+        )
+        if model is None:
+            # nothing of that table has been cached here
+            return
+
+        if "ident" in payload:
+            self._drop_local(self._key(model, payload["ident"]))
+        elif self.shared is not None:
+            self._sync_generation(model)
+        else:
+            self._generations[model] = self._generations.get(model, 0) + 1
+
+    def metrics(self):
+        """Hit and miss counts, and the overall hit rate."""
+
+        hits = (
+            self.stats["local_hits"]
+            + self.stats["snapshot_hits"]
+            + self.stats["shared_hits"]
+        )
+        lookups = hits + self.stats["misses"]
+        return dict(
+            self.stats,
+            lookups=lookups,
+            coalesced=self.flight.stats["coalesced"],
+            local_items=len(self.local),
+            hit_rate=round(hits / lookups, 4) if lookups else None,
+        )
+
+    def _drop_local(self, key):
+        self.local.delete(key)
+        if self.snapshot is not None:
+            self._masked.add(key)
+
+    def _announce(self, model, ident=None):
+        if self.announce is None:
+            return
+        payload = {"origin": self.origin, "table": model.__tablename__}
+        if ident is not None:
+            payload["ident"] = ident
+        self.announce(payload)
+
+    def _key(self, model, ident):
+        version = self._versions.get(model)
+        if version is None:
+            version = self._versions[model] = schema_version(model)
+        generation = self._generations.get(model, 0)
+        return f"{KEY_PREFIX}:{model.__tablename__}:{version}:{generation}:{ident}"
+
+    def _generation_key(self, model):
+        return f"{KEY_PREFIX}:{model.__tablename__}:generation"
+
+    def _sync_generation(self, model):
+        self._generations[model] = self.shared.counter(self._generation_key(model))
+
+    def _from_snapshot_entry(self, key):
+        """The snapshot's row for `key` if it is still fresh, promoted locally."""
+
+        if self.snapshot is None or key in self._masked:
+            return None
+        entry = self.snapshot.get("objects", key)
+        if entry is None:
+            return None
+
+        state, expires_at = entry
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return None
+        self.local.set(key, state, remaining)
+        self._from_snapshot.add(key)
+        return state
+
+    def _load(self, session, model, ident, loaded):
+        self.stats["misses"] += 1
+        obj = session.get(model, ident)
+        if obj is None:
+            return None
+
+        loaded["obj"] = obj
+        state = {
+            attr.key: getattr(obj, attr.key)
+            for attr in inspect(model).column_attrs
+            if attr.key not in UNCACHED_COLUMNS
+        }
+        key = self._key(model, ident)
+        self.local.set(key, state)
+        self._from_snapshot.discard(key)
+        if self.shared is not None:
+            self.shared.set(key, state, self.shared_ttl)
+        return state
+
+    def _attach(self, session, model, state):
+        obj = model(**state)
+        make_transient_to_detached(obj)
+        return session.merge(obj, load=False)
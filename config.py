@@ -0,0 +1,170 @@
+"""Configuration profiles for `app.create_app`.
+
+`Config` holds the defaults every profile shares; the profiles only
+override what differs. Settings that change per deploy are read from
+environment variables.
+"""
+
+import os
+
+
+class Config:
+    """Defaults shared by every profile."""
+
+    # Get DB_URI from environ variable (useful for production/testing) or,
+    # if not set there, use development local db.
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "postgresql:///warbler")
+
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    # unset falls back to secret_word.py, except in production
+    SECRET_KEY = os.environ.get("SECRET_KEY")
+    SECRET_KEY_FROM_FILE = True
+
+    # install Flask-DebugToolbar (it only shows when app.debug is on)
+    DEBUG_TOOLBAR = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    TRENDING_RESEED_SECONDS = 300
+
+    # Memory-mapped follow graph shared by all workers; unset to read follows
+    # through the ORM relationships instead.
+    FOLLOW_GRAPH_PATH = os.environ.get("FOLLOW_GRAPH_PATH")
+
+    # where partitions.py writes archived months of messages
+    ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+
+    # refuse to make message ids without a worker id assigned to this
+    # process (see snowflake.py)
+    REQUIRE_WORKER_ID = False
+
+    # run jobs inline rather than leaving them to workers (see jobs.py);
+    # only development and testing default to eager
+    JOBS_EAGER = os.environ.get("JOBS_EAGER", "1") == "1"
+    JOB_QUEUE_LIMITS = {"default": 4, "graph": 1}
+
+    SSE_HEARTBEAT_SECONDS = 15
+
+    # how often the home page asks for the "N new warbles" count
+    TIMELINE_POLL_SECONDS = 30
+
+    # messages per page on the home timeline and profiles; later pages are
+    # fetched as fragments while scrolling
+    TIMELINE_PAGE_SIZE = 20
+
+    # users per page on the followers / following pages
+    FOLLOWS_PAGE_SIZE = 50
+
+    # rows fetched per query round trip on the streamed list pages, and how
+    # much rendered HTML is gathered before each write
+    STREAM_CHUNK_ROWS = 500
+    STREAM_BUFFER_SIZE = 8192
+
+    # user and message lookups (see cache.py); CACHE_URL points at a shared
+    # Redis, "local" uses an in-process stand-in, unset means per-process only
+    CACHE_URL = os.environ.get("CACHE_URL")
+    CACHE_MAX_ITEMS = 10000
+    # tell the other workers (over Postgres NOTIFY) when a cached row changes,
+    # so their own LRUs drop it too
+    CACHE_ANNOUNCE_INVALIDATIONS = True
+    CACHE_TTL_SECONDS = 60
+    CACHE_SHARED_TTL_SECONDS = 300
+
+    # pages as rendered for logged-out visitors are served as is while fresh,
+    # then stale for a while longer as one request re-renders them
+    PAGE_CACHE_MAX_PAGES = 1000
+    PAGE_CACHE_FRESH_SECONDS = 5
+    PAGE_CACHE_STALE_SECONDS = 60
+
+    # workers rewrite this snapshot of their caches every CACHE_SNAPSHOT_SECONDS
+    # and new workers attach to it at boot (see snapshot.py)
+    CACHE_SNAPSHOT_PATH = os.environ.get("CACHE_SNAPSHOT_PATH")
+    CACHE_SNAPSHOT_SECONDS = 60
+    CACHE_SNAPSHOT_MAX_AGE = 300
+
+    # the object cache counts as warm once this share of lookups are hits
+    CACHE_WARM_HIT_RATE = 0.8
+
+    # personal data exports (see export.py): accounts with up to
+    # EXPORT_INLINE_MAX_ROWS messages, likes and follows stream straight to
+    # the browser; bigger ones are written to EXPORT_DIR by a job and
+    # downloaded from there
+    EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+    EXPORT_INLINE_MAX_ROWS = 10000
+
+    # token buckets per user, or per address when logged out (see
+    # ratelimit.py); RATELIMIT_URL points at a shared Redis so all workers
+    # count together, unset counts per process. Login attempts also take from
+    # a slower bucket per username tried from each address; one per username
+    # alone would let anyone lock any account out.
+    RATELIMIT_ENABLED = True
+    RATELIMIT_URL = os.environ.get("RATELIMIT_URL")
+    RATE_LIMITS = {
+        "login": "10/minute",
+        "login_username": "30/hour",
+        "post": "30/minute",
+        "ingest": "10/minute",
+        "follow": "60/minute",
+        "search": "60/minute",
+    }
+
+    # how many reverse proxies in front of the app to trust for the client
+    # address and scheme (X-Forwarded-For / -Proto); 0 trusts none
+    PROXY_FIX_HOPS = 0
+
+    # usernames that can see /admin/stats, comma separated
+    ADMIN_USERNAMES = frozenset(
+        name.strip()
+        for name in os.environ.get("ADMIN_USERNAMES", "").split(",")
+        if name.strip()
+    )
+
+
+class DevelopmentConfig(Config):
+    """`flask run` on a laptop."""
+
+    DEBUG_TOOLBAR = True
+
+
+class TestingConfig(Config):
+    """The unittest suite."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        "DATABASE_URL", "postgresql:///warbler_test"
+    )
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+
+
+class ProductionConfig(Config):
+    """gunicorn workers (see wsgi.py)."""
+
+    SECRET_KEY_FROM_FILE = False
+    REQUIRE_WORKER_ID = True
+    PROXY_FIX_HOPS = int(os.environ.get("PROXY_FIX_HOPS", "1"))
+    JOBS_EAGER = os.environ.get("JOBS_EAGER", "0") == "1"
+
+
+PROFILES = {
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+    "production": ProductionConfig,
+}
+
+
+def add_config_argument(parser):
+    """Give a maintenance command's `parser` a --config profile option.
+
+    These commands run beside the production workers, so like wsgi.py they
+    default to production (or $WARBLER_CONFIG when set); pass
+    ``--config development`` on a laptop.
+    """
+
+    parser.add_argument(
+        "--config",
+        choices=sorted(PROFILES),
+        default=os.environ.get("WARBLER_CONFIG", "production"),
+        help="config profile (default: $WARBLER_CONFIG, else production)",
+    )
@@ -0,0 +1,186 @@
+"""Personal data exports: a ZIP of a user's profile, messages, likes and follows.
+
+The archive is produced as a stream of bytes, never held whole in memory:
+each table is read with ``yield_per`` (a server-side cursor on Postgres,
+so rows arrive a chunk at a time), written to CSV in BLOCK_SIZE pieces,
+and compressed into the ZIP as it goes. zipfile writes to a sink that
+can't seek, so every entry carries its sizes in a trailing data
+descriptor and the archive can be sent before its end is known.
+
+Small accounts stream straight to the browser. Bigger ones are written to
+EXPORT_DIR by the export_user job (see jobs.py) and downloaded from there,
+with Range support so a dropped download resumes where it stopped.
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+
+from models import db, Follows, Likes, Message, User
+from partitions import all_archived_messages
+
+BLOCK_SIZE = 64 * 1024
+
+PROFILE_COLUMNS = (
+    "id",
+    "username",
+    "email",
+    "image_url",
+    "header_image_url",
+    "bio",
+    "location",
+)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back what has been written since last asked."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def csv_blocks(header, rows):
+    """CSV text for `header` and `rows`, in blocks of about BLOCK_SIZE."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= BLOCK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_zip(files):
+    """ZIP bytes, in chunks of about BLOCK_SIZE, for (name, text blocks) pairs."""
+
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, blocks in files:
+            with archive.open(name, "w", force_zip64=True) as entry:
+                for block in blocks:
+                    entry.write(block.encode("utf-8"))
+                    if sink.size >= BLOCK_SIZE:
+                        yield sink.drain()
+    yield sink.drain()
+
+
+def export_rows(user_id):
+    """How many rows an export of `user_id` has (live messages, likes, follows)."""
+
+    def count(column):
+        return (
+            db.session.query(db.func.count())
+            .filter(column == user_id)
+            .scalar_subquery()
+        )
+
+    return db.session.query(
+        count(Message.user_id)
+        + count(Likes.user_id)
+        + count(Follows.user_following_id)
+        + count(Follows.user_being_followed_id)
+    ).scalar()
+
+
+def export_files(user_id, chunk_rows=500):
+    """(file name, text blocks) for each file in `user_id`'s export."""
+
+    user = db.session.get(User, user_id)
+    profile = {column: getattr(user, column) for column in PROFILE_COLUMNS}
+    yield "profile.json", [json.dumps(profile, indent=2)]
+
+    def messages():
+        live = (
+            db.session.query(Message.id, Message.timestamp, Message.text)
+            .filter(Message.user_id == user_id)
+            .order_by(Message.id.desc())
+            .yield_per(chunk_rows)
+        )
+        for msg_id, timestamp, text in live:
+            yield msg_id, timestamp.isoformat(), text, "no"
+        for msg in all_archived_messages(user_id):
+            yield msg.id, msg.timestamp.isoformat(), msg.text, "yes"
+
+    yield "messages.csv", csv_blocks(
+        ("id", "timestamp", "text", "archived"), messages()
+    )
+
+    likes = (
+        db.session.query(
+            Likes.message_id, Likes.created_at, User.username, Message.text
+        )
+        .join(Message, Message.id == Likes.message_id)
+        .join(User, User.id == Message.user_id)
+        .filter(Likes.user_id == user_id)
+        .order_by(Likes.created_at.desc(), Likes.id.desc())
+        .yield_per(chunk_rows)
+    )
+    yield "likes.csv", csv_blocks(
+        ("message_id", "liked_at", "author", "text"),
+        (
+            (msg_id, liked_at.isoformat(), author, text)
+            for msg_id, liked_at, author, text in likes
+        ),
+    )
+
+    for name, other, this in (
+        ("following.csv", Follows.user_being_followed_id, Follows.user_following_id),
+        ("followers.csv", Follows.user_following_id, Follows.user_being_followed_id),
+    ):
+        follows = (
+            db.session.query(User.id, User.username, Follows.created_at)
+            .join(Follows, other == User.id)
+            .filter(this == user_id)
+            .order_by(Follows.created_at.desc(), other.desc())
+            .yield_per(chunk_rows)
+        )
+        yield name, csv_blocks(
+            ("user_id", "username", "since"),
+            (
+                (other_id, username, since.isoformat())
+                for other_id, username, since in follows
+            ),
+        )
+
+
+def export_path(directory, user_id):
+    return os.path.abspath(os.path.join(directory, f"{user_id}.zip"))
+
+
+def write_export(user_id, directory, chunk_rows=500):
+    """Write `user_id`'s export to `directory`, replacing any older one atomically."""
+
+    os.makedirs(directory, exist_ok=True)
+    path = export_path(directory, user_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in stream_zip(export_files(user_id, chunk_rows)):
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    return path
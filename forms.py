@@ -3,11 +3,15 @@ from wtforms import StringField, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Email, Length
 import email_validator
 
+from models import MESSAGE_LENGTH
+
 
 class MessageForm(FlaskForm):
     """Form for adding/editing messages."""
 
-    text = TextAreaField("text", validators=[DataRequired()])
+    text = TextAreaField(
+        "text", validators=[DataRequired(), Length(max=MESSAGE_LENGTH)]
+    )
 
 
 class UserAddForm(FlaskForm):
@@ -0,0 +1,323 @@
+"""Compressed sparse row (CSR) adjacency for the follows graph.
+
+User ids are mapped to dense positions through a sorted `nodes` array.
+Row `i` holds the positions that node `i` points at, sorted, in
+``indices[indptr[i]:indptr[i + 1]]``.
+
+Run `python graph.py compact` periodically (e.g. from cron) to fold the
+follow/unfollow log back into a fresh snapshot.
+"""
+
+import argparse
+import fcntl
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+class CSRGraph:
+    """Read-only directed graph in CSR form."""
+
+    def __init__(self, nodes, indptr, indices):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None):
+        """Build a graph from (source user id, target user id) pairs.
+
+        `nodes` can list extra user ids that have no edges at all.
+        """
+
+        edges = list(edges)
+        ids = set(nodes or ())
+        for src, dst in edges:
+            ids.add(src)
+            ids.add(dst)
+        node_array = array("q", sorted(ids))
+        position = {user_id: i for i, user_id in enumerate(node_array)}
+
+        rows = [[] for _ in node_array]
+        for src, dst in edges:
+            rows[position[src]].append(position[dst])
+
+        indptr = array("q", [0])
+        indices = array("q")
+        for row in rows:
+            row.sort()
+            indices.extend(row)
+            indptr.append(len(indices))
+
+        return cls(node_array, indptr, indices)
+
+    def index(self, user_id):
+        """Dense position of `user_id`, or None if it is not in the graph."""
+
+        i = bisect_left(self.nodes, user_id)
+        if i < len(self.nodes) and self.nodes[i] == user_id:
+            return i
+        return None
+
+    def row(self, i):
+        """Sorted positions that node `i` points at."""
+
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+    def has_edge(self, i, j):
+        """Does node `i` point at node `j`? Binary search over row `i`."""
+
+        start, end = self.indptr[i], self.indptr[i + 1]
+        k = bisect_left(self.indices, j, start, end)
+        return k < end and self.indices[k] == j
+
+
+MAGIC = b"WGRAPH01"
+HEADER = struct.Struct("<8sqq")
+
+
+def write_arrays(path, generation, arrays):
+    """Atomically write int64 `arrays` to `path` as one snapshot file."""
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, generation, len(arrays)))
+        f.write(array("q", [len(a) for a in arrays]).tobytes())
+        for a in arrays:
+            f.write(array("q", a).tobytes())
+    os.replace(tmp_path, path)
+
+
+def map_arrays(path):
+    """Memory-map a snapshot file; returns (generation, [memoryview, ...]).
+
+    The views point straight into the shared page cache, so every process
+    mapping the same file shares one copy of the arrays.
+    """
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, generation, count = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a follow graph snapshot")
+
+    view = memoryview(mapped)
+    offset = HEADER.size
+    lengths = view[offset : offset + 8 * count].cast("q")
+    offset += 8 * count
+
+    arrays = []
+    for length in lengths:
+        arrays.append(view[offset : offset + 8 * length].cast("q"))
+        offset += 8 * length
+    return generation, arrays
+
+
+@contextmanager
+def file_lock(path, operation):
+    """Hold an flock (LOCK_SH or LOCK_EX) on `path` for the block."""
+
+    with open(path, "a") as f:
+        fcntl.flock(f, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class FollowGraph:
+    """Follows graph served from a memory-mapped snapshot plus a delta log.
+
+    The snapshot holds CSR arrays for both directions (follower -> followed
+    and followed -> follower) and is rebuilt from the `follows` table by
+    `compact()`. Follow and unfollow writes are appended to a per-generation
+    log that every process replays on `refresh()`, so all workers see them
+    without rebuilding anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = None
+        self.following = None
+        self.followers = None
+        self._stat = None
+        self._log_offset = 0
+        self._out = {}
+        self._in = {}
+
+    @property
+    def log_path(self):
+        return f"{self.path}.{self.generation}.log"
+
+    def compact(self, load_edges, if_missing=False):
+        """Write a new snapshot from the (follower id, followed id) pairs
+        `load_edges()` returns; with `if_missing`, only if there is none yet.
+
+        `load_edges` should read the `follows` table. Compactions are
+        serialized by a lock file, so workers booting together build the
+        first snapshot once. Writes are logged after they commit, so the
+        table holds everything logged before it is read; what is logged
+        while it is read is carried over into the new generation's log
+        (replaying a write the snapshot already has is harmless). Appends
+        to the log are held off while the generations are swapped.
+
+        Returns whether a new snapshot was written.
+        """
+
+        with file_lock(f"{self.path}.compact.lock", fcntl.LOCK_EX):
+            current = self._current_generation()
+            if if_missing and current is not None:
+                self.refresh()
+                return False
+
+            old_log = f"{self.path}.{current}.log"
+            try:
+                mark = os.path.getsize(old_log)
+            except FileNotFoundError:
+                mark = 0
+
+            edges = list(load_edges())
+            following = CSRGraph.from_edges(edges)
+            followers = CSRGraph.from_edges((b, a) for a, b in edges)
+            generation = (current or 0) + 1
+
+            with file_lock(f"{self.path}.log.lock", fcntl.LOCK_EX):
+                try:
+                    with open(old_log, "rb") as log:
+                        log.seek(mark)
+                        tail = log.read()
+                except FileNotFoundError:
+                    tail = b""
+                with open(f"{self.path}.{generation}.log", "wb") as log:
+                    log.write(tail)
+
+                write_arrays(
+                    self.path,
+                    generation,
+                    [
+                        following.nodes, following.indptr, following.indices,
+                        followers.nodes, followers.indptr, followers.indices,
+                    ],
+                )
+                if os.path.exists(old_log):
+                    os.remove(old_log)
+
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """Pick up a new snapshot and any log entries written since last time."""
+
+        stat = os.stat(self.path)
+        if self._stat is None or (stat.st_ino, stat.st_mtime_ns) != self._stat:
+            generation, arrays = map_arrays(self.path)
+            self.generation = generation
+            self.following = CSRGraph(*arrays[:3])
+            self.followers = CSRGraph(*arrays[3:])
+            self._stat = (stat.st_ino, stat.st_mtime_ns)
+            self._log_offset = 0
+            self._out.clear()
+            self._in.clear()
+
+        try:
+            with open(self.log_path, "rb") as log:
+                log.seek(self._log_offset)
+                data = log.read()
+        except FileNotFoundError:
+            return
+
+        # only replay whole lines; a partial write is picked up next time
+        data = data[: data.rfind(b"\n") + 1]
+        self._log_offset += len(data)
+        for line in data.splitlines():
+            op, follower, followed = line.split()
+            self._apply(op == b"+", int(follower), int(followed))
+
+    def record(self, follower_id, followed_id, following=True):
+        """Log a committed follow (or unfollow) for every process to replay.
+
+        The write is applied here too so this process reads its own writes
+        before it next replays the log (replaying it again is harmless).
+        """
+
+        op = "+" if following else "-"
+        # a compaction can't swap generations between the refresh and the
+        # append, so the write never lands in a log that is being removed
+        with file_lock(f"{self.path}.log.lock", fcntl.LOCK_SH):
+            self.refresh()
+            with open(self.log_path, "a") as log:
+                log.write(f"{op} {follower_id} {followed_id}\n")
+        self._apply(following, follower_id, followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        """Does `follower_id` follow `followed_id`?"""
+
+        delta = self._out.get(follower_id, {}).get(followed_id)
+        if delta is not None:
+            return delta
+
+        i = self.following.index(follower_id)
+        j = self.following.index(followed_id)
+        return i is not None and j is not None and self.following.has_edge(i, j)
+
+    def following_ids(self, user_id):
+        """Ids of the users `user_id` follows."""
+
+        return self._neighbours(self.following, self._out, user_id)
+
+    def follower_ids(self, user_id):
+        """Ids of the users following `user_id`."""
+
+        return self._neighbours(self.followers, self._in, user_id)
+
+    def _neighbours(self, graph, deltas, user_id):
+        i = graph.index(user_id)
+        ids = set() if i is None else {graph.nodes[j] for j in graph.row(i)}
+
+        for other_id, present in deltas.get(user_id, {}).items():
+            if present:
+                ids.add(other_id)
+            else:
+                ids.discard(other_id)
+
+        return ids
+
+    def _apply(self, following, follower_id, followed_id):
+        self._out.setdefault(follower_id, {})[followed_id] = following
+        self._in.setdefault(followed_id, {})[follower_id] = following
+
+    def _current_generation(self):
+        try:
+            with open(self.path, "rb") as f:
+                magic, generation, _ = HEADER.unpack(f.read(HEADER.size))
+        except FileNotFoundError:
+            return None
+        return generation if magic == MAGIC else None
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Maintain the follow graph.")
+    parser.add_argument("command", choices=["compact"])
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    import app as warbler
+
+    app = warbler.create_app(args.config)
+    follow_graph = app.extensions["warbler"].follow_graph
+    if follow_graph is None:
+        sys.exit("FOLLOW_GRAPH_PATH is not set.")
+
+    with app.app_context():
+        follow_graph.compact(warbler.follow_edges)
+    print(f"Wrote generation {follow_graph.generation} to {follow_graph.path}.")
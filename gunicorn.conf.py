@@ -0,0 +1,32 @@
+"""gunicorn settings, read by ``gunicorn wsgi:app`` from this directory.
+
+Every worker needs its own snowflake worker id (see snowflake.py). The
+master gives each new worker the lowest slot no live worker holds. A
+worker's id is WORKER_ID_BASE + slot, so give each host or container its
+own WORKER_ID_BASE, spaced at least `workers` apart.
+
+Every open home page holds a /stream connection (see pubsub.py), so workers
+are threaded: each connection takes a thread waiting on its queue, not a
+whole worker. With gthread the timeout only restarts a worker whose main
+loop stops, so streams can stay open longer than it.
+"""
+
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 100))
+timeout = 60
+# open streams are cut off this long after a restart begins
+graceful_timeout = 20
+
+
+def pre_fork(server, worker):
+    taken = {getattr(other, "slot", None) for other in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    from snowflake import assign_worker_id
+
+    assign_worker_id(int(os.environ.get("WORKER_ID_BASE", 0)) + worker.slot)
@@ -0,0 +1,364 @@
+"""A small durable job queue stored in the `jobs` table.
+
+Routes call `enqueue()` inside their own transaction, so a job only becomes
+visible to workers if the request commits. Workers claim jobs with
+``SELECT ... FOR UPDATE SKIP LOCKED``; a per-queue advisory lock makes the
+running-job count and the claim atomic so each queue's concurrency limit
+holds across every worker process. Failed jobs are retried with exponential
+backoff up to `max_attempts`. A running job's `locked_at` is refreshed every
+HEARTBEAT_SECONDS, so only jobs whose worker has died for longer than
+VISIBILITY_TIMEOUT are put back on the queue.
+
+An idempotency key allows at most one pending job per key, so enqueueing
+the same work twice before a worker gets to it runs it once.
+
+With JOBS_EAGER set (the default in development and testing) jobs run
+inline as soon as they are enqueued. Production leaves them to workers,
+which like the other maintenance commands load the production profile
+unless given --config (or $WARBLER_CONFIG):
+
+    python jobs.py worker --processes 4
+"""
+
+import argparse
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+from multiprocessing import Process
+from threading import Event, Thread
+
+from flask import current_app
+from sqlalchemy import and_, event, func, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert
+
+from export import write_export
+from models import db, Job, Message, User
+from recommendations import refresh_user_suggestions
+from rollups import forget_user
+from tags import index_messages
+
+_tasks = {}
+
+POLL_SECONDS = 1
+HEARTBEAT_SECONDS = 60
+VISIBILITY_TIMEOUT = timedelta(minutes=10)
+
+
+def task(name, queue="default", max_attempts=5):
+    """Register a function as a job handler. It gets the payload as kwargs
+    and should not commit; the runner commits when it returns."""
+
+    def register(fn):
+        _tasks[name] = (fn, queue, max_attempts)
+        return fn
+
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Queue job `name` in the current transaction."""
+
+    fn, queue, max_attempts = _tasks[name]
+    payload = payload or {}
+
+    if current_app.config.get("JOBS_EAGER"):
+        fn(**payload)
+        return
+
+    statement = (
+        insert(Job.__table__)
+        .values(
+            queue=queue,
+            name=name,
+            payload=payload,
+            idempotency_key=key,
+            max_attempts=max_attempts,
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        .on_conflict_do_nothing(
+            index_elements=["idempotency_key"],
+            index_where=Job.status == "pending",
+        )
+    )
+    db.session.execute(statement)
+
+
+def after_commit(fn):
+    """Call `fn()` once the current transaction commits (never, on rollback).
+
+    For tasks whose side effects outside the database, such as cache
+    invalidations, must not run before their writes are visible.
+    """
+
+    db.session.info.setdefault("after_commit", []).append(fn)
+
+
+@event.listens_for(db.session, "after_commit")
+def _run_after_commit(session):
+    for fn in session.info.pop("after_commit", ()):
+        fn()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _drop_after_commit(session):
+    session.info.pop("after_commit", None)
+
+
+def claim(limits):
+    """Claim the next runnable job from the queues in `limits`, or None.
+
+    `limits` maps queue name to the most jobs that may run at once.
+    """
+
+    now = datetime.utcnow()
+    sweep(now)
+
+    for queue, limit in limits.items():
+        db.session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {"key": f"jobs:{queue}"},
+        )
+        running = Job.query.filter_by(queue=queue, status="running").count()
+        if running >= limit:
+            db.session.commit()
+            continue
+
+        job = (
+            Job.query.filter(
+                Job.queue == queue, Job.status == "pending", Job.run_at <= now
+            )
+            .order_by(Job.run_at, Job.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.session.commit()
+            continue
+
+        job.status = "running"
+        job.locked_at = now
+        job.attempts += 1
+        db.session.commit()
+        return job
+
+    return None
+
+
+def sweep(now):
+    """Put jobs left running by a worker that died back on the queue.
+
+    A dead job whose key already has a pending job is marked failed rather
+    than requeued: the pending one does the same work, and a second pending
+    row for the key would break the idempotency index.
+    """
+
+    stale = and_(Job.status == "running", Job.locked_at < now - VISIBILITY_TIMEOUT)
+    try:
+        Job.query.filter(stale, _has_pending_duplicate()).update(
+            {
+                "status": "failed",
+                "finished_at": now,
+                "last_error": "Worker died; a pending job with the same key replaces it",
+            },
+            synchronize_session=False,
+        )
+        Job.query.filter(stale, ~_has_pending_duplicate()).update(
+            {"status": "pending"}, synchronize_session=False
+        )
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        logging.exception("Could not requeue stale jobs")
+
+
+def _has_pending_duplicate():
+    pending = db.aliased(Job)
+    return (
+        db.session.query(pending.id)
+        .filter(
+            pending.status == "pending",
+            pending.idempotency_key == Job.idempotency_key,
+        )
+        .exists()
+    )
+
+
+class _Heartbeat:
+    """Refresh a running job's `locked_at` from a thread until stopped."""
+
+    def __init__(self, engine, job_id):
+        self.engine = engine
+        self.job_id = job_id
+        self._stop = Event()
+        self._thread = Thread(target=self._beat, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        Job.__table__.update()
+                        .where(Job.id == self.job_id, Job.status == "running")
+                        .values(locked_at=datetime.utcnow())
+                    )
+            except SQLAlchemyError:
+                logging.exception("Heartbeat for job %s failed", self.job_id)
+
+
+def run(job):
+    """Run a claimed job and record how it went."""
+
+    fn, _, _ = _tasks[job.name]
+    try:
+        with _Heartbeat(db.engine, job.id):
+            fn(**job.payload)
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = "pending"
+            job.run_at = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+        db.session.commit()
+
+
+def work(limits, burst=False):
+    """Claim and run jobs until stopped (or, with `burst`, until none are left)."""
+
+    while True:
+        job = claim(limits)
+        if job is not None:
+            run(job)
+        elif burst:
+            return
+        else:
+            time.sleep(POLL_SECONDS)
+
+
+def queue_metrics():
+    """Per-queue counts, throughput over the last minute and lag in seconds."""
+
+    now = datetime.utcnow()
+    metrics = {}
+
+    counts = db.session.query(Job.queue, Job.status, func.count()).group_by(
+        Job.queue, Job.status
+    )
+    for queue, status, count in counts:
+        metrics.setdefault(queue, {})[status] = count
+
+    done = (
+        db.session.query(Job.queue, func.count())
+        .filter(Job.status == "done", Job.finished_at >= now - timedelta(minutes=1))
+        .group_by(Job.queue)
+    )
+    for queue, count in done:
+        metrics[queue]["done_last_minute"] = count
+
+    oldest = (
+        db.session.query(Job.queue, func.min(Job.run_at))
+        .filter(Job.status == "pending", Job.run_at <= now)
+        .group_by(Job.queue)
+    )
+    for queue, run_at in oldest:
+        metrics[queue]["lag_seconds"] = (now - run_at).total_seconds()
+
+    for queue in metrics.values():
+        queue.setdefault("done_last_minute", 0)
+        queue.setdefault("lag_seconds", 0)
+
+    return metrics
+
+
+##############################################################################
+# Tasks
+
+
+@task("index_messages")
+def index_messages_task(ids):
+    index_messages(Message.query.filter(Message.id.in_(ids)).all())
+
+
+@task("refresh_suggestions", queue="graph")
+def refresh_suggestions_task(user_id):
+    refresh_user_suggestions(user_id)
+
+
+@task("export_user")
+def export_user_task(user_id):
+    write_export(
+        user_id,
+        current_app.config["EXPORT_DIR"],
+        current_app.config["STREAM_CHUNK_ROWS"],
+    )
+
+
+@task("delete_user", max_attempts=3)
+def delete_user_task(user_id):
+    forget_user(user_id)
+    # a bulk delete lets the database's ON DELETE CASCADE remove messages,
+    # likes and follows instead of loading them through the relationships
+    User.query.filter_by(id=user_id).delete(synchronize_session=False)
+    # requests until then may cache the rows again, so only drop them after
+    after_commit(lambda: forget_deleted_user(user_id))
+
+
+def forget_deleted_user(user_id):
+    """Drop a deleted user, and the messages that went with them, from the caches."""
+
+    state = current_app.extensions["warbler"]
+    state.object_cache.invalidate(User, user_id)
+    # the messages are not worth finding one by one
+    state.object_cache.invalidate_all(Message)
+    state.page_cache.invalidate(f"/users/{user_id}")
+
+
+def _worker(config, limits):
+    from app import create_app
+
+    with create_app(config).app_context():
+        work(limits)
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Run job queue workers.")
+    parser.add_argument("command", choices=["worker", "metrics"])
+    parser.add_argument("--processes", type=int, default=1)
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    if args.command == "metrics":
+        with app.app_context():
+            print(queue_metrics())
+    else:
+        limits = app.config["JOB_QUEUE_LIMITS"]
+        workers = [
+            Process(target=_worker, args=(args.config, limits))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
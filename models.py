@@ -1,13 +1,16 @@
 """SQLAlchemy models for Warbler."""
 
-from datetime import datetime
-
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 
+from snowflake import next_id
+
 bcrypt = Bcrypt()
 db = SQLAlchemy()
 
+# longest message text; MessageForm and the API validate against it too
+MESSAGE_LENGTH = 140
+
 
 class Follows(db.Model):
     """Connection of a follower <-> followed_user."""
@@ -26,12 +29,38 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.text("(now() at time zone 'utc')"),
+    )
+
+    # newest-first followers / following pages, keyed by (time, other user)
+    __table_args__ = (
+        db.Index(
+            'ix_follows_followed_created',
+            'user_being_followed_id', 'created_at', 'user_following_id',
+        ),
+        db.Index(
+            'ix_follows_following_created',
+            'user_following_id', 'created_at', 'user_being_followed_id',
+        ),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
 
     __tablename__ = 'likes' 
 
+    # one like per user per message; the old unique message_id only ever
+    # let a single user like any given message
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'message_id'),
+        # newest-first liked pages, keyed by (time, like id)
+        db.Index('ix_likes_user_created', 'user_id', 'created_at', 'id'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -43,9 +72,183 @@ class Likes(db.Model):
     )
 
     message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        index=True
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.text("(now() at time zone 'utc')"),
+    )
+
+
+class MessageTag(db.Model):
+    """A hashtag used in a message."""
+
+    __tablename__ = 'message_tags'
+
+    tag = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+
+class Mention(db.Model):
+    """A user @mentioned in a message."""
+
+    __tablename__ = 'mentions'
+
+    user_id = db.Column(
         db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
+        primary_key=True,
+    )
+
+
+class Suggestion(db.Model):
+    """Precomputed "who to follow" suggestion, see recommendations.py."""
+
+    __tablename__ = 'suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    suggested_user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    common_count = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    suggested_user = db.relationship(
+        'User',
+        foreign_keys=[suggested_user_id],
+    )
+
+
+class DailyCount(db.Model):
+    """Events of one kind on one day, kept up to date by rollups.py.
+
+    Every write bumps today's row, so each count is spread over a few
+    slots to keep concurrent transactions from queueing on one row lock.
+    """
+
+    __tablename__ = 'daily_counts'
+
+    day = db.Column(
+        db.Date,
+        primary_key=True,
+    )
+
+    metric = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    slot = db.Column(
+        db.SmallInteger,
+        primary_key=True,
+    )
+
+    count = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+
+class FollowerCount(db.Model):
+    """A user's follower count, kept up to date by rollups.py."""
+
+    __tablename__ = 'follower_counts'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    followers = db.Column(
+        db.BigInteger,
+        nullable=False,
+        index=True,
+    )
+
+
+class LikeCount(db.Model):
+    """A message's like count, kept up to date by rollups.py."""
+
+    __tablename__ = 'like_counts'
+
+    # no foreign key: old message partitions are archived and dropped
+    message_id = db.Column(
+        db.BigInteger,
+        primary_key=True,
+    )
+
+    likes = db.Column(
+        db.BigInteger,
+        nullable=False,
+        index=True,
+    )
+
+
+class LikedCount(db.Model):
+    """How many messages a user has liked, kept up to date by rollups.py."""
+
+    __tablename__ = 'liked_counts'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    liked = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+
+class LatestPost(db.Model):
+    """Id of each user's newest message, kept up to date by timeline.py."""
+
+    __tablename__ = 'latest_posts'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.BigInteger,
+        nullable=False,
     )
 
 
@@ -115,18 +318,31 @@ class User(db.Model):
         secondary="likes"
     )
 
+    @property
+    def follow_graph(self):
+        """The app's graph.FollowGraph, if FOLLOW_GRAPH_PATH is configured."""
+
+        state = db.get_app().extensions.get("warbler")
+        return state.follow_graph if state is not None else None
+
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
+        if self.follow_graph is not None:
+            return self.follow_graph.is_following(other_user.id, self.id)
+
         found_user_list = [user for user in self.followers if user == other_user]
         return len(found_user_list) == 1
 
     def is_following(self, other_user):
         """Is this user following `other_use`?"""
 
+        if self.follow_graph is not None:
+            return self.follow_graph.is_following(self.id, other_user.id)
+
         found_user_list = [user for user in self.following if user == other_user]
         return len(found_user_list) == 1
 
@@ -175,20 +391,24 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    # time-sortable snowflake id (see snowflake.py), so timelines can
+    # order and paginate by primary key
     id = db.Column(
-        db.Integer,
+        db.BigInteger,
         primary_key=True,
+        autoincrement=False,
+        default=next_id,
     )
 
     text = db.Column(
-        db.String(140),
+        db.String(MESSAGE_LENGTH),
         nullable=False,
     )
 
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        server_default=db.text("(now() at time zone 'utc')"),
     )
 
     user_id = db.Column(
@@ -199,6 +419,131 @@ class Message(db.Model):
 
     user = db.relationship('User')
 
+    # GIN index used by search.py; Postgres maintains it on insert/delete
+    __table_args__ = (
+        db.Index(
+            'ix_messages_text_search',
+            db.func.to_tsvector('english', text),
+            postgresql_using='gin',
+        ),
+        db.Index('ix_messages_user_id_id', user_id, id),
+        # monthly partitions are managed by partitions.py
+        {'postgresql_partition_by': 'RANGE (id)'},
+    )
+
+    # read the server-side timestamp back with RETURNING on insert
+    __mapper_args__ = {'eager_defaults': True}
+
+
+class ArchivedSegment(db.Model):
+    """A month of messages moved out of the database into a segment file."""
+
+    __tablename__ = 'archived_segments'
+
+    name = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    lower_id = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+    upper_id = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+    path = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    message_count = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+
+class Job(db.Model):
+    """Deferred work for the background workers, see jobs.py."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    queue = db.Column(
+        db.Text,
+        nullable=False,
+        default='default',
+    )
+
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    payload = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict,
+    )
+
+    idempotency_key = db.Column(
+        db.Text,
+    )
+
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='pending',
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    max_attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=5,
+    )
+
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.text("(now() at time zone 'utc')"),
+    )
+
+    locked_at = db.Column(
+        db.DateTime,
+    )
+
+    finished_at = db.Column(
+        db.DateTime,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    __table_args__ = (
+        db.Index('ix_jobs_queue_status_run_at', queue, status, run_at),
+        # one pending job per key; finished jobs don't block new ones
+        db.Index(
+            'ix_jobs_idempotency_key',
+            idempotency_key,
+            unique=True,
+            postgresql_where=(status == 'pending'),
+        ),
+    )
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
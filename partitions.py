@@ -0,0 +1,299 @@
+"""Monthly range partitions of the messages table and cold archive segments.
+
+`messages` is partitioned by RANGE (id). Message ids are snowflake ids, so
+each month maps to a contiguous id range and old months can be dropped as
+whole partitions. A DEFAULT partition catches anything outside the monthly
+partitions (e.g. old imported data) so inserts never fail.
+
+Old months are archived with:
+
+    python partitions.py archive --before 2023-01
+
+which writes each partition to a read-only segment file of one gzip block
+per user, plus a JSON index of where each user's block starts, and then
+drops the partition. users_show() falls back to these segments when someone
+pages back past the oldest live message.
+"""
+
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from models import db, Message, Likes, MessageTag, Mention, ArchivedSegment
+from rollups import forget_likes
+from snowflake import id_for
+
+DEFAULT_PARTITION = "messages_default"
+MONTHS_AHEAD = 3
+
+_ensured_month = None
+_segment_indexes = {}
+
+
+def month_start(when):
+    """First moment of the month containing naive UTC datetime `when`."""
+
+    return datetime(when.year, when.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"messages_{month.year:04d}_{month.month:02d}"
+
+
+def month_bounds(month):
+    """[lower, upper) message ids for the month starting at `month`."""
+
+    return id_for(month), id_for(add_months(month, 1))
+
+
+def create_partitions(connection, since, months_ahead=MONTHS_AHEAD):
+    """Create monthly partitions from `since` through `months_ahead` months out.
+
+    A month is skipped if the default partition already holds rows in its
+    range, since Postgres would refuse to create it.
+    """
+
+    month = month_start(since)
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    created = []
+
+    while month <= last:
+        name = partition_name(month)
+        lower, upper = month_bounds(month)
+
+        exists = connection.execute(
+            text("SELECT to_regclass(:name)"), {"name": name}
+        ).scalar()
+        clash = connection.execute(
+            text(
+                f"SELECT 1 FROM {DEFAULT_PARTITION} "
+                "WHERE id >= :lower AND id < :upper LIMIT 1"
+            ),
+            {"lower": lower, "upper": upper},
+        ).scalar()
+
+        if not exists and not clash:
+            connection.execute(
+                text(
+                    f"CREATE TABLE {name} PARTITION OF messages "
+                    f"FOR VALUES FROM ({lower}) TO ({upper})"
+                )
+            )
+            created.append(name)
+
+        month = add_months(month, 1)
+
+    return created
+
+
+@event.listens_for(Message.__table__, "after_create")
+def create_initial_partitions(target, connection, **kw):
+    connection.execute(
+        text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
+    )
+    create_partitions(connection, add_months(month_start(datetime.utcnow()), -1))
+
+
+def ensure_partitions():
+    """Keep partitions MONTHS_AHEAD months ahead; cheap after the first call each month."""
+
+    global _ensured_month
+
+    this_month = month_start(datetime.utcnow())
+    if _ensured_month == this_month:
+        return
+
+    with db.engine.begin() as connection:
+        # every worker does this on its first request; take turns
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('messages'))"))
+        create_partitions(connection, this_month)
+    _ensured_month = this_month
+
+
+def live_partitions():
+    """Names of the monthly partitions currently attached to `messages`."""
+
+    rows = db.session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'messages'::regclass ORDER BY c.relname"
+        )
+    )
+    return [name for (name,) in rows if name != DEFAULT_PARTITION]
+
+
+def write_segment(name, directory):
+    """Write partition `name` to a segment file; returns (path, message count)."""
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.seg")
+    index = {}
+
+    rows = db.session.execute(
+        text(f"SELECT id, user_id, text, timestamp FROM {name} ORDER BY user_id, id DESC")
+    )
+
+    with open(path, "wb") as segment:
+
+        def flush(user_id, lines):
+            block = gzip.compress("\n".join(lines).encode("utf-8"))
+            index[str(user_id)] = [segment.tell(), len(block), len(lines)]
+            segment.write(block)
+
+        user_id, lines = None, []
+        for msg_id, msg_user_id, msg_text, timestamp in rows:
+            if msg_user_id != user_id and lines:
+                flush(user_id, lines)
+                lines = []
+            user_id = msg_user_id
+            lines.append(
+                json.dumps(
+                    dict(id=msg_id, user_id=msg_user_id, text=msg_text,
+                         timestamp=timestamp.isoformat())
+                )
+            )
+        if lines:
+            flush(user_id, lines)
+
+    with open(f"{path}.idx.json", "w") as index_file:
+        json.dump(index, index_file)
+
+    os.chmod(path, 0o444)
+    os.chmod(f"{path}.idx.json", 0o444)
+
+    return path, sum(count for _, _, count in index.values())
+
+
+def archive(before, directory):
+    """Archive and drop every monthly partition that ends on or before `before`."""
+
+    archived = []
+
+    for name in live_partitions():
+        month = datetime.strptime(name, "messages_%Y_%m")
+        if add_months(month, 1) > month_start(before):
+            continue
+
+        lower, upper = month_bounds(month)
+        path, count = write_segment(name, directory)
+
+        # the archived likes no longer show on their users' liked pages
+        forget_likes(Likes.message_id >= lower, Likes.message_id < upper)
+        # rows referencing archived messages would block the detach
+        for model in (Likes, MessageTag, Mention):
+            model.query.filter(
+                model.message_id >= lower, model.message_id < upper
+            ).delete(synchronize_session=False)
+
+        db.session.add(
+            ArchivedSegment(
+                name=name, lower_id=lower, upper_id=upper, path=path,
+                message_count=count,
+            )
+        )
+        db.session.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+
+        archived.append((name, count))
+
+    return archived
+
+
+class ArchivedMessage:
+    """A read-only message served from an archive segment."""
+
+    __slots__ = ("id", "user_id", "text", "timestamp")
+
+    archived = True
+
+    def __init__(self, id, user_id, text, timestamp):
+        self.id = id
+        self.user_id = user_id
+        self.text = text
+        self.timestamp = datetime.fromisoformat(timestamp)
+
+
+def _segment_index(path):
+    if path not in _segment_indexes:
+        with open(f"{path}.idx.json") as index_file:
+            _segment_indexes[path] = json.load(index_file)
+    return _segment_indexes[path]
+
+
+def _user_block(segment, user_id):
+    """`user_id`'s messages in one segment, newest first."""
+
+    entry = _segment_index(segment.path).get(str(user_id))
+    if not entry:
+        return []
+
+    offset, length, _ = entry
+    with open(segment.path, "rb") as f:
+        f.seek(offset)
+        lines = gzip.decompress(f.read(length)).decode("utf-8").splitlines()
+
+    return [ArchivedMessage(**json.loads(line)) for line in lines]
+
+
+def archived_messages(user_id, before=None, limit=100):
+    """A user's archived messages older than id `before`, newest first."""
+
+    segments = ArchivedSegment.query.order_by(ArchivedSegment.upper_id.desc())
+    if before:
+        segments = segments.filter(ArchivedSegment.lower_id < before)
+
+    found = []
+    for segment in segments:
+        for msg in _user_block(segment, user_id):
+            if before is None or msg.id < before:
+                found.append(msg)
+                if len(found) == limit:
+                    return found
+
+    return found
+
+
+def all_archived_messages(user_id):
+    """Every archived message by `user_id`, newest first, a segment at a time."""
+
+    segments = ArchivedSegment.query.order_by(ArchivedSegment.upper_id.desc()).all()
+    for segment in segments:
+        yield from _user_block(segment, user_id)
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Manage message partitions.")
+    add_config_argument(parser)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("ensure")
+    archive_parser = subcommands.add_parser("archive")
+    archive_parser.add_argument("--before", required=True, help="YYYY-MM")
+    archive_parser.add_argument("--directory", default=None)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        if args.command == "ensure":
+            ensure_partitions()
+            print("\n".join(live_partitions()))
+        else:
+            before = datetime.strptime(args.before, "%Y-%m")
+            directory = args.directory or app.config["ARCHIVE_DIR"]
+            for name, count in archive(before, directory):
+                print(f"Archived {name} ({count} messages).")
@@ -0,0 +1,161 @@
+"""In-process pub/sub for new messages, bridged across workers by Postgres.
+
+messages_add() sends ``pg_notify('warbles', ...)`` in its own transaction,
+so a notification only goes out if the message commits. Each worker that
+has SSE clients runs one `PostgresBridge` thread that LISTENs on that
+channel and hands each notification to the local `Broker`, which fans it
+out to the queues of the clients following the author.
+
+Connected clients just wait on a queue, so the app runs on threaded
+gunicorn workers (see gunicorn.conf.py) rather than one sync worker per
+connection.
+"""
+
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+CHANNEL = "warbles"
+
+
+class Subscription:
+    """One connected client: the authors it follows and its inbox."""
+
+    def __init__(self, author_ids, maxsize=100):
+        self.author_ids = set(author_ids)
+        self.queue = queue.Queue(maxsize)
+
+    def get(self, timeout):
+        """Next payload, or None if nothing arrives within `timeout` seconds."""
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Routes published messages to the subscriptions following their author."""
+
+    def __init__(self):
+        self._by_author = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, author_ids):
+        subscription = Subscription(author_ids)
+        with self._lock:
+            for author_id in subscription.author_ids:
+                self._by_author.setdefault(author_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for author_id in subscription.author_ids:
+                subscribers = self._by_author.get(author_id, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._by_author.pop(author_id, None)
+
+    def publish(self, payload):
+        """Deliver `payload` (a dict with a "user_id") to its author's followers."""
+
+        with self._lock:
+            subscribers = list(self._by_author.get(payload["user_id"], ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(payload)
+            except queue.Full:
+                # a client that stopped reading just misses updates
+                pass
+
+
+def libpq_dsn(database_uri):
+    """A SQLAlchemy database URL (``postgresql+psycopg2://...``) for psycopg2."""
+
+    url = make_url(database_uri).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class PostgresBridge:
+    """Background thread turning Postgres notifications into local calls.
+
+    Each notification's payload is passed to `deliver`, such as a broker's
+    `publish`.
+    """
+
+    def __init__(self, deliver, dsn, channel=CHANNEL):
+        self.deliver = deliver
+        self.dsn = dsn
+        self.channel = channel
+        self._started = False
+        self._listening = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, wait=True):
+        """Start listening (once per process).
+
+        With `wait`, returns once LISTEN is active (or after 5 seconds).
+        """
+
+        with self._lock:
+            if not self._started:
+                threading.Thread(target=self._run, daemon=True).start()
+                self._started = True
+        if wait:
+            self._listening.wait(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except psycopg2.Error:
+                logging.exception("Lost the %s listener; reconnecting", self.channel)
+                time.sleep(1)
+
+    def _listen(self):
+        connection = psycopg2.connect(self.dsn)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        self._listening.set()
+
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                self.deliver(json.loads(notify.payload))
+
+
+def notify(session, payload, channel=CHANNEL):
+    """Queue a notification that Postgres sends when `session` commits.
+
+    `session` can also be a Connection, to notify in its transaction.
+    """
+
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": json.dumps(payload)},
+    )
+
+
+def notify_many(session, payloads, channel=CHANNEL):
+    """Like `notify`, for each of `payloads` in order, in one statement."""
+
+    session.execute(
+        text(
+            "SELECT pg_notify(:channel, payload)"
+            " FROM unnest(CAST(:payloads AS text[])) WITH ORDINALITY AS p(payload, n)"
+            " ORDER BY n"
+        ),
+        {"channel": channel, "payloads": [json.dumps(p) for p in payloads]},
+    )
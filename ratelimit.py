@@ -0,0 +1,167 @@
+"""Per-client token bucket rate limits.
+
+Each limited route names a bucket ("login", "post", ...) with a limit from
+RATE_LIMITS such as "10/minute": a client may make up to 10 requests in a
+burst, and gets one more every 6 seconds after that. Clients are the
+logged-in user, or the remote address for anonymous requests (taken from
+X-Forwarded-For behind PROXY_FIX_HOPS trusted proxies); a view can key its
+bucket on something else instead, as login does on the username tried
+from each address. Once a
+bucket is empty the view is not called; the client gets a 429 with a
+Retry-After header saying when the next token is due.
+
+Buckets live in one of two backends, as in cache.py:
+
+- `LocalBuckets`, per process (and the stand-in for tests), bounded by
+  number of clients; a bucket that falls out simply starts full again;
+- `RedisBuckets` when RATELIMIT_URL is set (needs the `redis` package), so
+  every worker takes from the same buckets. The refill-and-take is one Lua
+  script, so concurrent workers can't both spend the last token.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from threading import Lock
+
+from flask import abort, current_app, g, request
+
+KEY_PREFIX = "warbler:ratelimit"
+
+PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+
+@lru_cache(maxsize=None)
+def parse_limit(spec):
+    """(tokens per second, burst) for a limit like "10/minute"."""
+
+    count, _, period = spec.partition("/")
+    burst = int(count)
+    return burst / PERIODS[period.strip()], burst
+
+
+class LocalBuckets:
+    """Token buckets in this process, at most `maxsize` of them."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token from `key`: (allowed, seconds until the next token)."""
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+# KEYS[1] bucket hash; ARGV rate, burst. Uses the server's clock so workers
+# on different hosts agree, and expires buckets once they would be full.
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(bucket[1]) or burst
+local stamp = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker, on Redis (``pip install redis``)."""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self._take(keys=[key], args=[rate, burst])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+def client_identity():
+    """Whose bucket a request takes from: the logged-in user, else the address."""
+
+    user = getattr(g, "user", None)
+    if user:
+        return f"user:{user.id}"
+    return f"ip:{request.remote_addr}"
+
+
+class RateLimiter:
+    """Applies the RATE_LIMITS of the current app to decorated views."""
+
+    def __init__(self):
+        self.backend = LocalBuckets()
+        self.stats = dict(allowed=0, limited=0)
+
+    def init_app(self, app):
+        """Pick the backend for `app`'s RATELIMIT_URL."""
+
+        url = app.config["RATELIMIT_URL"]
+        self.backend = RedisBuckets(url) if url else LocalBuckets()
+
+    def hit(self, name, identity):
+        """Spend one of `identity`'s `name` tokens; seconds to wait, or 0."""
+
+        rate, burst = parse_limit(current_app.config["RATE_LIMITS"][name])
+        allowed, retry_after = self.backend.take(
+            f"{KEY_PREFIX}:{name}:{identity}", rate, burst
+        )
+        self.stats["allowed" if allowed else "limited"] += 1
+        return retry_after
+
+    def limit(self, name, when=None, key=client_identity):
+        """Decorate a view so it takes from the `name` bucket.
+
+        If given, `when()` decides per request whether the limit applies
+        (for instance only to POSTs). `key()` names whose bucket it is; by
+        default the client's.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if current_app.config["RATELIMIT_ENABLED"] and (
+                    when is None or when()
+                ):
+                    retry_after = self.hit(name, key())
+                    if retry_after:
+                        abort(429, retry_after=math.ceil(retry_after))
+                return view(*args, **kwargs)
+
+            return wrapped
+
+        return decorator
+
+    def metrics(self):
+        return dict(self.stats)
+
+
+limiter = RateLimiter()
@@ -0,0 +1,98 @@
+"""Read-only row projections for list pages.
+
+The timelines and user lists only show a handful of columns, so instead of
+hydrating full `User` / `Message` instances (with identity-map entries,
+attribute state and lazy-load hooks for each) they select just those
+columns and wrap each row in a small ``__slots__`` object. The objects have
+the same attribute names as the models, so templates render them unchanged,
+but they are plain values: nothing is tracked by the session.
+"""
+
+from models import db, Message, User
+
+
+class UserRow:
+    """The author fields shown next to a message."""
+
+    __slots__ = ("id", "username", "image_url")
+
+    def __init__(self, id, username, image_url):
+        self.id = id
+        self.username = username
+        self.image_url = image_url
+
+
+class UserCard:
+    """The fields shown on a user card in user lists."""
+
+    __slots__ = ("id", "username", "image_url", "header_image_url", "bio")
+
+    def __init__(self, id, username, image_url, header_image_url, bio):
+        self.id = id
+        self.username = username
+        self.image_url = image_url
+        self.header_image_url = header_image_url
+        self.bio = bio
+
+
+class MessageRow:
+    """A live message with its author."""
+
+    __slots__ = ("id", "text", "timestamp", "user_id", "user")
+
+    archived = False
+
+    def __init__(self, id, text, timestamp, user_id, username, image_url):
+        self.id = id
+        self.text = text
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.user = UserRow(user_id, username, image_url)
+
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.text,
+    Message.timestamp,
+    Message.user_id,
+    User.username,
+    User.image_url,
+)
+
+USER_CARD_COLUMNS = (
+    User.id,
+    User.username,
+    User.image_url,
+    User.header_image_url,
+    User.bio,
+)
+
+
+def message_rows(*criteria, before=None, limit=20):
+    """Newest-first MessageRows matching `criteria`, older than `before`."""
+
+    query = (
+        db.session.query(*MESSAGE_COLUMNS)
+        .join(User, User.id == Message.user_id)
+        .filter(*criteria)
+    )
+    if before:
+        query = query.filter(Message.id < before)
+
+    return [
+        MessageRow(*row) for row in query.order_by(Message.id.desc()).limit(limit)
+    ]
+
+
+def user_cards_query(*extra_columns):
+    """Query for UserCard columns, plus `extra_columns` after them."""
+
+    return db.session.query(*USER_CARD_COLUMNS, *extra_columns)
+
+
+def user_cards(rows):
+    """UserCards from rows of `user_cards_query()` (extra columns ignored)."""
+
+    size = len(USER_CARD_COLUMNS)
+    for row in rows:
+        yield UserCard(*row[:size])
@@ -0,0 +1,147 @@
+"""Batch job for "who to follow" suggestions.
+
+Candidates for a user are the accounts followed by the accounts they follow
+(two hops in the follows graph), ranked by how many of those paths lead to
+them. The job loads `follows` once into a CSR graph, scores users in chunks
+across worker processes and replaces the `suggestions` table, so the home
+page only has to read a user's precomputed rows. Scoring is a plain dict
+count per user; benchmarks/bench_recommendations.py measures it (and a
+SciPy sparse product, where installed) at realistic follow counts.
+
+Run it like:
+
+    python recommendations.py --top 10 --processes 4
+"""
+
+import argparse
+from heapq import nlargest
+from multiprocessing import Pool
+
+from graph import CSRGraph
+
+_graph = None
+
+
+def suggest_for(graph, i, top):
+    """Top (position, common count) candidates for the node at position `i`."""
+
+    following = graph.row(i)
+    counts = {}
+    for j in following:
+        for k in graph.row(j):
+            counts[k] = counts.get(k, 0) + 1
+
+    counts.pop(i, None)
+    for j in following:
+        counts.pop(j, None)
+
+    return nlargest(top, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _suggest_chunk(args):
+    start, end, top = args
+    return [
+        (i, suggest_for(_graph, i, top)) for i in range(start, end)
+    ]
+
+
+def compute_suggestions(graph, top=10, processes=None, chunk_size=500):
+    """Yield (user_id, rank, suggested_user_id, common_count) for every user."""
+
+    chunks = [
+        (start, min(start + chunk_size, len(graph)), top)
+        for start in range(0, len(graph), chunk_size)
+    ]
+
+    with Pool(processes, initializer=_init_worker, initargs=(graph,)) as pool:
+        for results in pool.imap_unordered(_suggest_chunk, chunks):
+            for i, candidates in results:
+                for rank, (k, common) in enumerate(candidates):
+                    yield graph.nodes[i], rank, graph.nodes[k], common
+
+
+def refresh_suggestions(top=10, processes=None, chunk_size=500):
+    """Recompute every user's suggestions and replace the stored ones."""
+
+    from models import db, Follows, Suggestion
+
+    edges = db.session.query(
+        Follows.user_following_id, Follows.user_being_followed_id
+    )
+    graph = CSRGraph.from_edges(edges)
+
+    rows = [
+        dict(user_id=user_id, rank=rank, suggested_user_id=suggested, common_count=common)
+        for user_id, rank, suggested, common in compute_suggestions(
+            graph, top, processes, chunk_size
+        )
+    ]
+
+    Suggestion.query.delete()
+    db.session.bulk_insert_mappings(Suggestion, rows)
+    db.session.commit()
+
+    return len(rows)
+
+
+def refresh_user_suggestions(user_id, top=10):
+    """Recompute one user's suggestions with a SQL 2-hop count.
+
+    Used after the user follows someone, between full batch runs.
+    """
+
+    from models import db, Follows, Suggestion
+
+    first = db.aliased(Follows)
+    second = db.aliased(Follows)
+    already = db.session.query(Follows.user_being_followed_id).filter(
+        Follows.user_following_id == user_id
+    )
+    common = db.func.count().label("common")
+
+    candidates = (
+        db.session.query(second.user_being_followed_id, common)
+        .join(first, first.user_being_followed_id == second.user_following_id)
+        .filter(
+            first.user_following_id == user_id,
+            second.user_being_followed_id != user_id,
+            second.user_being_followed_id.notin_(already),
+        )
+        .group_by(second.user_being_followed_id)
+        .order_by(common.desc(), second.user_being_followed_id)
+        .limit(top)
+        .all()
+    )
+
+    Suggestion.query.filter_by(user_id=user_id).delete()
+    db.session.bulk_insert_mappings(
+        Suggestion,
+        [
+            dict(user_id=user_id, rank=rank, suggested_user_id=suggested, common_count=count)
+            for rank, (suggested, count) in enumerate(candidates)
+        ],
+    )
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        count = refresh_suggestions(args.top, args.processes, args.chunk_size)
+    print(f"Stored {count} suggestions.")
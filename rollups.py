@@ -0,0 +1,309 @@
+"""Running totals behind the admin stats page.
+
+Counting messages, signups, follows and likes per day, or followers per
+user, with a GROUP BY over the big tables gets slower as they grow. Instead
+the write paths in app.py bump a few small rollup tables in the same
+transaction as the write, and /admin/stats only ever reads those:
+
+- daily_counts: events per (day, metric), where metric is one of METRICS.
+  Today's row would be updated by every write, so each day's count is
+  spread over ROLLUP_SLOTS rows, picked at random, and summed on read.
+- follower_counts: followers per user.
+- like_counts: likes per message.
+- liked_counts: messages liked per user.
+
+The like and follow buttons and the profile header read the last three
+back instead of counting.
+
+If the rollups drift (or predate a write path), recompute them with:
+
+    python rollups.py rebuild
+
+Users carry no signup date, so rebuilding keeps the existing signup counts,
+and days whose messages are already archived keep their message counts.
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import cast, Date
+from sqlalchemy.dialects.postgresql import insert
+
+from models import (
+    db,
+    DailyCount,
+    FollowerCount,
+    Follows,
+    LikeCount,
+    LikedCount,
+    Likes,
+    Message,
+    User,
+)
+
+METRICS = ("messages", "signups", "follows", "likes")
+
+ROLLUP_SLOTS = 8
+
+
+def record_daily(metric, amount=1):
+    """Add `amount` to today's count of `metric`."""
+
+    stmt = insert(DailyCount).values(
+        day=datetime.utcnow().date(),
+        metric=metric,
+        slot=random.randrange(ROLLUP_SLOTS),
+        count=amount,
+    )
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DailyCount.day, DailyCount.metric, DailyCount.slot],
+            set_={"count": DailyCount.count + stmt.excluded["count"]},
+        )
+    )
+
+
+def record_followers(user_id, delta):
+    """Add `delta` (1 or -1) to `user_id`'s follower count."""
+
+    stmt = insert(FollowerCount).values(user_id=user_id, followers=delta)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[FollowerCount.user_id],
+            set_={"followers": FollowerCount.followers + stmt.excluded.followers},
+        )
+    )
+
+
+def record_likes(message_id, delta):
+    """Add `delta` (1 or -1) to `message_id`'s like count."""
+
+    stmt = insert(LikeCount).values(message_id=message_id, likes=delta)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LikeCount.message_id],
+            set_={"likes": LikeCount.likes + stmt.excluded.likes},
+        )
+    )
+
+
+def record_liked(user_id, delta):
+    """Add `delta` (1 or -1) to the number of messages `user_id` has liked."""
+
+    stmt = insert(LikedCount).values(user_id=user_id, liked=delta)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LikedCount.user_id],
+            set_={"liked": LikedCount.liked + stmt.excluded.liked},
+        )
+    )
+
+
+def follower_count(user_id):
+    """`user_id`'s followers, from the rollup."""
+
+    return (
+        db.session.query(FollowerCount.followers)
+        .filter(FollowerCount.user_id == user_id)
+        .scalar()
+        or 0
+    )
+
+
+def like_count(message_id):
+    """`message_id`'s likes, from the rollup."""
+
+    return (
+        db.session.query(LikeCount.likes)
+        .filter(LikeCount.message_id == message_id)
+        .scalar()
+        or 0
+    )
+
+
+def forget_likes(*criteria):
+    """Take the likes matching `criteria` back from their users' liked counts.
+
+    Call this before the likes are deleted, usually by a cascade.
+    """
+
+    taken = (
+        db.session.query(db.func.count())
+        .filter(Likes.user_id == LikedCount.user_id, *criteria)
+        .correlate(LikedCount)
+        .scalar_subquery()
+    )
+    likers = db.session.query(Likes.user_id).filter(*criteria).scalar_subquery()
+    LikedCount.query.filter(LikedCount.user_id.in_(likers)).update(
+        {LikedCount.liked: LikedCount.liked - taken},
+        synchronize_session=False,
+    )
+
+
+def forget_message(message_id):
+    """Drop the like count of a message about to be deleted."""
+
+    forget_likes(Likes.message_id == message_id)
+    LikeCount.query.filter_by(message_id=message_id).delete()
+
+
+def forget_user(user_id):
+    """Take back `user_id`'s follows and likes before the user is deleted.
+
+    The delete cascades through follows and likes in the database, which
+    the write paths never see.
+    """
+
+    followed = (
+        db.session.query(Follows.user_being_followed_id)
+        .filter(Follows.user_following_id == user_id)
+        .scalar_subquery()
+    )
+    FollowerCount.query.filter(FollowerCount.user_id.in_(followed)).update(
+        {FollowerCount.followers: FollowerCount.followers - 1},
+        synchronize_session=False,
+    )
+
+    liked = (
+        db.session.query(Likes.message_id)
+        .filter(Likes.user_id == user_id)
+        .scalar_subquery()
+    )
+    LikeCount.query.filter(LikeCount.message_id.in_(liked)).update(
+        {LikeCount.likes: LikeCount.likes - 1},
+        synchronize_session=False,
+    )
+
+    # their own messages are deleted with them
+    owned = (
+        db.session.query(Message.id)
+        .filter(Message.user_id == user_id)
+        .scalar_subquery()
+    )
+    forget_likes(Likes.message_id.in_(owned))
+    LikeCount.query.filter(LikeCount.message_id.in_(owned)).delete(
+        synchronize_session=False
+    )
+
+
+def daily_counts(days=14, today=None):
+    """{metric: [(day, count), ...]} for the last `days` days, oldest first."""
+
+    today = today or datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    totals = {
+        (day, metric): count
+        for day, metric, count in db.session.query(
+            DailyCount.day, DailyCount.metric, db.func.sum(DailyCount.count)
+        )
+        .filter(DailyCount.day >= first)
+        .group_by(DailyCount.day, DailyCount.metric)
+    }
+    dates = [first + timedelta(days=n) for n in range(days)]
+    return {
+        metric: [(day, totals.get((day, metric), 0)) for day in dates]
+        for metric in METRICS
+    }
+
+
+def most_followed(limit=10):
+    """[(user, followers), ...] for the users with the most followers."""
+
+    return (
+        db.session.query(User, FollowerCount.followers)
+        .join(FollowerCount, FollowerCount.user_id == User.id)
+        .filter(FollowerCount.followers > 0)
+        .order_by(FollowerCount.followers.desc(), User.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def most_liked(limit=10):
+    """[(message, likes), ...] for the live messages with the most likes."""
+
+    return (
+        db.session.query(Message, LikeCount.likes)
+        .join(LikeCount, LikeCount.message_id == Message.id)
+        .options(db.joinedload(Message.user))
+        .filter(LikeCount.likes > 0)
+        .order_by(LikeCount.likes.desc(), Message.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def rebuild():
+    """Recompute the rollups from the tables they summarize."""
+
+    FollowerCount.query.delete()
+    db.session.execute(
+        insert(FollowerCount).from_select(
+            ["user_id", "followers"],
+            db.session.query(
+                Follows.user_being_followed_id, db.func.count()
+            ).group_by(Follows.user_being_followed_id),
+        )
+    )
+
+    LikeCount.query.delete()
+    db.session.execute(
+        insert(LikeCount).from_select(
+            ["message_id", "likes"],
+            db.session.query(Likes.message_id, db.func.count()).group_by(
+                Likes.message_id
+            ),
+        )
+    )
+
+    LikedCount.query.delete()
+    db.session.execute(
+        insert(LikedCount).from_select(
+            ["user_id", "liked"],
+            db.session.query(Likes.user_id, db.func.count()).group_by(
+                Likes.user_id
+            ),
+        )
+    )
+
+    oldest_message = db.session.query(db.func.min(Message.timestamp)).scalar()
+    for metric, column in (
+        ("messages", Message.timestamp),
+        ("follows", Follows.created_at),
+        ("likes", Likes.created_at),
+    ):
+        stale = DailyCount.query.filter(DailyCount.metric == metric)
+        if metric == "messages":
+            if oldest_message is None:
+                continue
+            stale = stale.filter(DailyCount.day >= oldest_message.date())
+        stale.delete(synchronize_session=False)
+
+        day = cast(column, Date)
+        db.session.execute(
+            insert(DailyCount).from_select(
+                ["day", "metric", "slot", "count"],
+                db.session.query(
+                    day, db.literal(metric), db.literal(0), db.func.count()
+                ).group_by(day),
+            )
+        )
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Maintain the stats rollups.")
+    parser.add_argument("command", choices=["rebuild"])
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        rebuild()
+        db.session.commit()
+    print("Rebuilt the stats rollups.")
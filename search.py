@@ -0,0 +1,99 @@
+"""Full-text search over messages.
+
+Matching uses Postgres full-text search against the GIN expression index on
+``to_tsvector('english', messages.text)`` declared on `Message`, so Postgres
+keeps the index current as messages are added and deleted. Results are
+ordered by a score that mixes relevance with recency and paged with a
+(score, id) cursor, which stays stable because the score does not depend on
+the current time.
+"""
+
+import re
+
+from sqlalchemy import and_, extract, func, or_
+
+from models import db, Message
+
+SEARCH_CONFIG = "english"
+
+# a perfect relevance match is worth about this many days of recency
+RELEVANCE_WEIGHT = 10
+RECENCY_SECONDS = 30 * 24 * 60 * 60
+
+TERM = re.compile(r'"([^"]*)"|(\S+)')
+WORD = re.compile(r"\w+")
+
+
+def parse_query(q):
+    """Turn user input into a tsquery string, or None if nothing is searchable.
+
+    Quoted text is a phrase, a trailing * makes a prefix search and every
+    other word must appear:
+
+        parse_query('"big bird" warb*')  ->  '(big <-> bird) & warb:*'
+    """
+
+    parts = []
+    for phrase, word in TERM.findall(q):
+        if phrase:
+            words = WORD.findall(phrase)
+            if words:
+                parts.append("(" + " <-> ".join(words) + ")")
+        else:
+            words = WORD.findall(word)
+            if not words:
+                continue
+            prefix = ":*" if word.endswith("*") else ""
+            parts.extend(words[:-1])
+            parts.append(words[-1] + prefix)
+
+    return " & ".join(parts) or None
+
+
+def encode_cursor(score, msg_id):
+    return f"{score!r}_{msg_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        score, msg_id = cursor.split("_")
+        return float(score), int(msg_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_messages(q, cursor=None, limit=20):
+    """One page of messages matching `q`.
+
+    Returns (messages, next cursor or None).
+    """
+
+    tsquery = parse_query(q)
+    if tsquery is None:
+        return [], None
+
+    query = func.to_tsquery(SEARCH_CONFIG, tsquery)
+    vector = func.to_tsvector(SEARCH_CONFIG, Message.text)
+    score = (
+        func.ts_rank_cd(vector, query, 32) * RELEVANCE_WEIGHT
+        + extract("epoch", Message.timestamp) / RECENCY_SECONDS
+    ).label("score")
+
+    results = db.session.query(Message, score).filter(vector.op("@@")(query))
+
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        after_score, after_id = after
+        results = results.filter(
+            or_(score < after_score, and_(score == after_score, Message.id < after_id))
+        )
+
+    rows = results.order_by(score.desc(), Message.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_msg, last_score = rows[-1]
+        next_cursor = encode_cursor(last_score, last_msg.id)
+
+    return [msg for msg, _ in rows], next_cursor
@@ -1,20 +1,45 @@
 """Seed database with sample data from CSV Files."""
 
 from csv import DictReader
-from app import db
-from models import User, Message, Follows
+from datetime import datetime
+from app import create_app
+from models import db, User, Message, Follows
+from snowflake import id_for
+from partitions import create_partitions
+from rollups import rebuild
+from timeline import backfill
 
 
+create_app().app_context().push()
+
 db.drop_all()
 db.create_all()
 
+with open('generator/messages.csv') as messages:
+    # give old messages ids from their own timestamps so they sort by time
+    message_rows = list(DictReader(messages))
+    for sequence, row in enumerate(message_rows):
+        row['id'] = id_for(datetime.fromisoformat(row['timestamp'])) + sequence % 4096
+
+# monthly partitions back to the oldest sample message
+with db.engine.begin() as connection:
+    create_partitions(
+        connection,
+        min(datetime.fromisoformat(row['timestamp']) for row in message_rows),
+    )
+
 with open('generator/users.csv') as users:
     db.session.bulk_insert_mappings(User, DictReader(users))
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+db.session.bulk_insert_mappings(Message, message_rows)
 
 with open('generator/follows.csv') as follows:
     db.session.bulk_insert_mappings(Follows, DictReader(follows))
 
 db.session.commit()
+
+# follower counts and daily totals for /admin/stats
+rebuild()
+# each author's newest message, for the "N new warbles" count
+backfill()
+db.session.commit()
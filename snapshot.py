@@ -0,0 +1,97 @@
+"""Memory-mapped snapshots of the in-process caches.
+
+A worker that has been serving for a while periodically writes what it has
+cached (object cache rows and the trending boards) to one file; a worker
+that starts later maps that file instead of starting cold. The file is:
+
+    header   MAGIC, taken_at (unix time), index length
+    index    pickled {section: {key: (offset, length)}}
+    values   one pickle per entry
+
+Only the index is unpickled when a worker attaches. Values are read out of
+the mapping on first use, so attaching costs the same however large the
+snapshot is, and every worker on the box shares the same page cache copy.
+Like the follow graph snapshot (graph.py), files are replaced atomically.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import time
+
+MAGIC = b"WCACHE01"
+HEADER = struct.Struct("<8sdq")
+
+
+def write_snapshot(path, sections):
+    """Atomically write `sections` ({name: {key: value}}) to `path`."""
+
+    index = {}
+    blobs = []
+    offset = 0
+    for name, entries in sections.items():
+        section = index[name] = {}
+        for key, value in entries.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            section[key] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+
+    index_blob = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, time.time(), len(index_blob)))
+        f.write(index_blob)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.taken_at, index_length = HEADER.unpack_from(self._mapped, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a cache snapshot")
+
+        start = HEADER.size
+        self._index = pickle.loads(self._mapped[start : start + index_length])
+        self._values_start = start + index_length
+
+    @classmethod
+    def open(cls, path, max_age):
+        """The snapshot at `path` if it exists and is younger than `max_age`."""
+
+        try:
+            snapshot = cls(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        if snapshot.age() > max_age:
+            return None
+        return snapshot
+
+    def age(self):
+        return time.time() - self.taken_at
+
+    def __len__(self):
+        return sum(len(section) for section in self._index.values())
+
+    def get(self, section, key):
+        """The value stored under `key`, or None."""
+
+        location = self._index.get(section, {}).get(key)
+        if location is None:
+            return None
+
+        offset, length = location
+        start = self._values_start + offset
+        return pickle.loads(self._mapped[start : start + length])
+
+    def items(self, section):
+        for key in self._index.get(section, {}):
+            yield key, self.get(section, key)
@@ -0,0 +1,140 @@
+"""K-sortable 63-bit message ids, generated in-process.
+
+    | 41 bits: ms since EPOCH | 10 bits: worker id | 12 bits: sequence |
+
+Ids from one worker always increase, and ids from different workers sort
+by the millisecond they were made in, so ordering messages by id orders
+them by time. Each process needs its own worker id, or two processes can
+make the same id. Under gunicorn, gunicorn.conf.py calls
+`assign_worker_id()` in every worker after it forks. A single process can
+set WORKER_ID (0-1023) instead. Outside production, a process with neither
+falls back to an id derived from its pid. That is fine on a laptop, but
+pids repeat across hosts and containers.
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from threading import Lock
+
+EPOCH = datetime(2010, 1, 1, tzinfo=timezone.utc)
+EPOCH_MS = int(EPOCH.timestamp() * 1000)
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def assign_worker_id(worker_id):
+    """Give this process, and not its children, snowflake worker `worker_id`."""
+
+    if not 0 <= worker_id <= MAX_WORKER:
+        raise ValueError(f"worker id {worker_id} is outside 0-{MAX_WORKER}")
+    os.environ["WORKER_ID"] = str(worker_id)
+    os.environ["WORKER_ID_PID"] = str(os.getpid())
+
+
+def make_id(ms, worker_id=0, sequence=0):
+    """Pack a unix time in ms, worker id and sequence number into an id."""
+
+    return (
+        ((ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+        | ((worker_id & MAX_WORKER) << SEQUENCE_BITS)
+        | (sequence & MAX_SEQUENCE)
+    )
+
+
+def id_for(timestamp):
+    """Smallest id that could have been made at naive UTC `timestamp`.
+
+    Useful as a keyset bound: messages posted at or after `timestamp` have
+    ids >= id_for(timestamp).
+    """
+
+    ms = int(timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return make_id(ms)
+
+
+def id_time(msg_id):
+    """Naive UTC datetime an id was made at."""
+
+    ms = (msg_id >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None)
+
+
+class IdGenerator:
+    """Thread-safe snowflake id generator for one process."""
+
+    def __init__(self, worker_id=None, require_assigned=False):
+        self._fixed_worker_id = worker_id
+        # refuse the pid fallback (create_app sets this in production)
+        self.require_assigned = require_assigned
+        self._worker_id = None
+        self._pid = None
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = Lock()
+
+    @property
+    def worker_id(self):
+        # re-derive after a fork so gunicorn workers don't share an id
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            if self._fixed_worker_id is not None:
+                self._worker_id = self._fixed_worker_id
+            else:
+                self._worker_id = self._environ_worker_id()
+            self._last_ms = -1
+        return self._worker_id
+
+    def _environ_worker_id(self):
+        assigned_pid = os.environ.get("WORKER_ID_PID")
+        if assigned_pid is not None and int(assigned_pid) != self._pid:
+            # a forked child would make the same ids as its parent
+            raise RuntimeError(
+                f"WORKER_ID was assigned to process {assigned_pid}, not to "
+                f"this one ({self._pid}); call assign_worker_id() after forking"
+            )
+
+        if "WORKER_ID" in os.environ:
+            worker_id = int(os.environ["WORKER_ID"])
+            if not 0 <= worker_id <= MAX_WORKER:
+                raise ValueError(f"WORKER_ID {worker_id} is outside 0-{MAX_WORKER}")
+            return worker_id
+
+        if self.require_assigned:
+            raise RuntimeError(
+                "No snowflake worker id for this process: run under "
+                "gunicorn.conf.py or set WORKER_ID"
+            )
+        return self._pid % (MAX_WORKER + 1)
+
+    def next_id(self):
+        with self._lock:
+            worker_id = self.worker_id
+            ms = int(time.time() * 1000)
+
+            if ms < self._last_ms:
+                # clock went backwards; keep ids increasing
+                ms = self._last_ms
+
+            if ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    while ms <= self._last_ms:
+                        ms = int(time.time() * 1000)
+            else:
+                self._sequence = 0
+
+            self._last_ms = ms
+            return make_id(ms, worker_id, self._sequence)
+
+
+generator = IdGenerator()
+
+
+def next_id():
+    """Next message id for this process."""
+
+    return generator.next_id()
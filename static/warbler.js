@@ -0,0 +1,113 @@
+// Like and follow forms (marked with data-toggle-form) post in the
+// background and update the button and counters in place. Without
+// JavaScript, or if the request fails, they post and redirect as before.
+(function () {
+  if (!window.fetch) return;
+
+  function setCount(selector, value) {
+    document.querySelectorAll(selector).forEach(function (el) {
+      el.textContent = value;
+    });
+  }
+
+  function addToCount(selector, change) {
+    document.querySelectorAll(selector).forEach(function (el) {
+      el.textContent = parseInt(el.textContent, 10) + change;
+    });
+  }
+
+  function updateLike(button, data) {
+    button.classList.toggle("btn-primary", data.liked);
+    button.classList.toggle("btn-secondary", !data.liked);
+    button.title = data.likes + (data.likes === 1 ? " like" : " likes");
+  }
+
+  function updateFollow(button, data) {
+    button.textContent = data.is_following ? "Unfollow" : "Follow";
+    button.classList.toggle("btn-primary", data.is_following);
+    button.classList.toggle("btn-outline-primary", !data.is_following);
+    setCount('[data-followers-count="' + data.user_id + '"]', data.followers);
+    addToCount(
+      '[data-following-count="' + data.follower_id + '"]',
+      data.following_change
+    );
+  }
+
+  document.addEventListener("submit", function (event) {
+    var form = event.target;
+    var kind = form.getAttribute("data-toggle-form");
+    if (!kind) return;
+
+    event.preventDefault();
+    var button = form.querySelector("button");
+    button.disabled = true;
+
+    fetch(form.action, {
+      method: "POST",
+      headers: { Accept: "application/json" },
+      credentials: "same-origin",
+    })
+      .then(function (resp) {
+        if (!resp.ok) throw new Error(resp.statusText);
+        return resp.json();
+      })
+      .then(function (data) {
+        form.action = data.action;
+        if (kind === "like") {
+          updateLike(button, data);
+        } else {
+          updateFollow(button, data);
+        }
+        button.disabled = false;
+      })
+      .catch(function () {
+        form.submit();
+      });
+  });
+})();
+
+// Infinite scroll: when the "Older" link (#load-more) scrolls into view,
+// fetch the next page as a fragment of list items and append it to the
+// list named by data-fragment-list. The link keeps working without JS.
+(function () {
+  var more = document.getElementById("load-more");
+  if (!more || !window.fetch || !window.IntersectionObserver) return;
+
+  var list = document.getElementById(more.getAttribute("data-fragment-list"));
+  var loading = false;
+
+  function loadMore() {
+    if (loading) return;
+    loading = true;
+
+    var url = new URL(more.href);
+    url.searchParams.set("fragment", "1");
+
+    fetch(url, { credentials: "same-origin" })
+      .then(function (resp) {
+        if (!resp.ok) throw new Error(resp.statusText);
+        var next = resp.headers.get("X-Next-Before");
+        return resp.text().then(function (html) {
+          list.insertAdjacentHTML("beforeend", html);
+          if (next) {
+            url.searchParams.delete("fragment");
+            url.searchParams.set("before", next);
+            more.href = url;
+          } else {
+            observer.disconnect();
+            more.remove();
+          }
+          loading = false;
+        });
+      })
+      .catch(function () {
+        // leave the link for a normal page load
+        observer.disconnect();
+      });
+  }
+
+  var observer = new IntersectionObserver(function (entries) {
+    if (entries[0].isIntersecting) loadMore();
+  });
+  observer.observe(more);
+})();
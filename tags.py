@@ -0,0 +1,155 @@
+"""Hashtags and @mentions parsed out of message text.
+
+Tags and mentions are written to their own indexed tables when a message is
+posted, so the /tags/<tag> and /users/<id>/mentions pages never read message
+text. Messages posted before these tables existed can be indexed with:
+
+    python tags.py backfill --batch-size 1000
+
+The backfill records the last message id it finished in a checkpoint file
+and picks up from there if it is stopped and run again.
+"""
+
+import argparse
+import os
+import re
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Message, MessageTag, Mention, User
+
+HASHTAG = re.compile(r"(?<![\w#])#(\w+)")
+MENTION = re.compile(r"(?<![\w@])@(\w+)")
+
+
+def extract_tags(text):
+    """Lower-cased hashtags in `text`, without the '#', in order of use."""
+
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG.findall(text)))
+
+
+def extract_mentions(text):
+    """Usernames mentioned in `text`, without the '@', in order of use."""
+
+    return list(dict.fromkeys(MENTION.findall(text)))
+
+
+def index_messages(messages):
+    """Store the tags and mentions of `messages` (which must have ids).
+
+    Safe to call more than once for the same messages.
+    """
+
+    tag_rows = [
+        dict(tag=tag, message_id=msg.id)
+        for msg in messages
+        for tag in extract_tags(msg.text)
+    ]
+
+    mentioned = {msg.id: extract_mentions(msg.text) for msg in messages}
+    usernames = {name for names in mentioned.values() for name in names}
+    user_ids = dict(
+        db.session.query(User.username, User.id).filter(User.username.in_(usernames))
+        if usernames
+        else []
+    )
+    mention_rows = [
+        dict(user_id=user_ids[name], message_id=msg_id)
+        for msg_id, names in mentioned.items()
+        for name in names
+        if name in user_ids
+    ]
+
+    if tag_rows:
+        db.session.execute(
+            insert(MessageTag.__table__).values(tag_rows).on_conflict_do_nothing()
+        )
+    if mention_rows:
+        db.session.execute(
+            insert(Mention.__table__).values(mention_rows).on_conflict_do_nothing()
+        )
+
+
+def _page(query, message_id_column, before, limit):
+    """Keyset-paginate `query` newest first; returns (messages, next before)."""
+
+    if before:
+        query = query.filter(message_id_column < before)
+    ids = [
+        msg_id
+        for (msg_id,) in query.order_by(message_id_column.desc()).limit(limit + 1)
+    ]
+
+    next_before = ids[limit - 1] if len(ids) > limit else None
+    ids = ids[:limit]
+
+    found = {
+        msg.id: msg
+        for msg in Message.query.options(db.joinedload(Message.user)).filter(
+            Message.id.in_(ids)
+        )
+    }
+    return [found[msg_id] for msg_id in ids if msg_id in found], next_before
+
+
+def tagged_messages(tag, before=None, limit=20):
+    """Newest messages using `tag`, older than message id `before`."""
+
+    query = db.session.query(MessageTag.message_id).filter(MessageTag.tag == tag.lower())
+    return _page(query, MessageTag.message_id, before, limit)
+
+
+def mentioning_messages(user_id, before=None, limit=20):
+    """Newest messages mentioning `user_id`, older than message id `before`."""
+
+    query = db.session.query(Mention.message_id).filter(Mention.user_id == user_id)
+    return _page(query, Mention.message_id, before, limit)
+
+
+def backfill(batch_size=1000, checkpoint_path=".tags_backfill"):
+    """Index every existing message in batches, resuming from the checkpoint."""
+
+    after_id = 0
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as checkpoint:
+            after_id = int(checkpoint.read().strip() or 0)
+
+    done = 0
+    while True:
+        batch = (
+            Message.query.filter(Message.id > after_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+
+        index_messages(batch)
+        db.session.commit()
+
+        after_id = batch[-1].id
+        with open(checkpoint_path, "w") as checkpoint:
+            checkpoint.write(str(after_id))
+        done += len(batch)
+
+    return done
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Index tags and mentions.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", default=".tags_backfill")
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        count = backfill(args.batch_size, args.checkpoint)
+    print(f"Indexed {count} messages.")
@@ -0,0 +1,244 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import json
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, MessageTag, Follows, Likes
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from api import MAX_BATCH
+from jobs import enqueue
+
+app = create_app("testing")
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class ApiTestCase(TestCase):
+    """Test the /api/v1 endpoints"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        self.others = [
+            User.signup(
+                username=f"other{i}",
+                email=f"other{i}@test.com",
+                password="password",
+                image_url=None,
+            )
+            for i in range(3)
+        ]
+        db.session.commit()
+
+        self.testuser_id = self.testuser.id
+        self.other_ids = [u.id for u in self.others]
+
+        for other_id in self.other_ids:
+            db.session.add(
+                Follows(user_following_id=other_id, user_being_followed_id=self.testuser_id)
+            )
+        db.session.add(
+            Follows(user_following_id=self.testuser_id, user_being_followed_id=self.other_ids[0])
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def login(self, client):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+    def test_requires_login(self):
+        """Are private endpoints refused with a JSON 401?"""
+
+        resp = self.client.get("/api/v1/timeline")
+
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.get_json(), {"error": "Access unauthorized."})
+
+    def test_create_message(self):
+        """Can we post a message and get it back with a string id?"""
+
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/api/v1/messages", json={"text": "Hello API"})
+
+        self.assertEqual(resp.status_code, 201)
+        data = resp.get_json()["data"]
+        self.assertIsInstance(data["id"], str)
+        self.assertEqual(data["text"], "Hello API")
+        self.assertEqual(data["user"]["id"], self.testuser_id)
+        self.assertEqual(Message.query.get(int(data["id"])).text, "Hello API")
+
+    def test_create_message_invalid(self):
+        """Is missing or over-long text rejected?"""
+
+        with self.client as c:
+            self.login(c)
+            missing = c.post("/api/v1/messages", json={})
+            too_long = c.post("/api/v1/messages", json={"text": "x" * 141})
+
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(too_long.status_code, 400)
+        self.assertEqual(Message.query.count(), 0)
+
+    def test_create_messages_batch(self):
+        """Does a JSON batch go in at once, with one index job?"""
+
+        texts = [f"batch #bulk {i}" for i in range(5)]
+        with patch("app.enqueue", wraps=enqueue) as queued, self.client as c:
+            self.login(c)
+            resp = c.post(
+                "/api/v1/messages/batch",
+                json={"messages": [{"text": text} for text in texts]},
+            )
+
+        self.assertEqual(resp.status_code, 201)
+        data = resp.get_json()["data"]
+        self.assertEqual([msg["text"] for msg in data], texts)
+        self.assertEqual(Message.query.filter_by(user_id=self.testuser_id).count(), 5)
+        self.assertEqual(queued.call_count, 1)
+        self.assertEqual(MessageTag.query.filter_by(tag="bulk").count(), 5)
+
+    def test_create_messages_ndjson(self):
+        """Can a batch be sent as NDJSON?"""
+
+        body = "".join(json.dumps({"text": f"line {i}"}) + "\n" for i in range(3))
+        with self.client as c:
+            self.login(c)
+            resp = c.post(
+                "/api/v1/messages/batch",
+                data=body,
+                content_type="application/x-ndjson",
+            )
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.get_json()["data"]), 3)
+        self.assertEqual(Message.query.count(), 3)
+
+    def test_create_messages_invalid(self):
+        """Does one bad message reject the whole batch, saying which?"""
+
+        messages = [{"text": "fine"}, {"text": "x" * 141}, {}, "text"]
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/api/v1/messages/batch", json={"messages": messages})
+            too_many = c.post(
+                "/api/v1/messages/batch",
+                json={"messages": [{"text": "hi"}] * (MAX_BATCH + 1)},
+            )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(
+            [problem["index"] for problem in resp.get_json()["errors"]], [1, 2, 3]
+        )
+        self.assertEqual(too_many.status_code, 400)
+        self.assertEqual(Message.query.count(), 0)
+
+    def test_user_messages_pages(self):
+        """Do message pages follow the `before` cursor to the end?"""
+
+        for i in range(5):
+            db.session.add(Message(text=f"msg {i}", user_id=self.testuser_id))
+            db.session.flush()
+        db.session.commit()
+
+        texts = []
+        cursor = ""
+        while cursor is not None:
+            resp = self.client.get(
+                f"/api/v1/users/{self.testuser_id}/messages?limit=2&before={cursor}"
+            )
+            body = resp.get_json()
+            texts.extend(m["text"] for m in body["data"])
+            cursor = body["next_cursor"]
+
+        self.assertEqual(texts, [f"msg {i}" for i in reversed(range(5))])
+
+    def test_timeline(self):
+        """Does the timeline only hold messages from followed users?"""
+
+        db.session.add(Message(text="followed", user_id=self.other_ids[0]))
+        db.session.add(Message(text="not followed", user_id=self.other_ids[1]))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c)
+            resp = c.get("/api/v1/timeline")
+
+        self.assertEqual([m["text"] for m in resp.get_json()["data"]], ["followed"])
+
+    def test_likes(self):
+        """Are a user's liked messages listed?"""
+
+        msg = Message(text="liked", user_id=self.other_ids[0])
+        db.session.add(msg)
+        db.session.flush()
+        db.session.add(Likes(user_id=self.testuser_id, message_id=msg.id))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c)
+            resp = c.get(f"/api/v1/users/{self.testuser_id}/likes")
+
+        self.assertEqual([m["text"] for m in resp.get_json()["data"]], ["liked"])
+
+    def test_followers_pages(self):
+        """Do follower pages follow the `after` cursor?"""
+
+        with self.client as c:
+            self.login(c)
+            first = c.get(f"/api/v1/users/{self.testuser_id}/followers?limit=2").get_json()
+            second = c.get(
+                f"/api/v1/users/{self.testuser_id}/followers?limit=2&after={first['next_cursor']}"
+            ).get_json()
+
+        ids = [u["id"] for u in first["data"] + second["data"]]
+        self.assertEqual(ids, sorted(self.other_ids))
+        self.assertIsNone(second["next_cursor"])
+
+    def test_followers_ndjson(self):
+        """Can the whole follower list be streamed as NDJSON?"""
+
+        with self.client as c:
+            self.login(c)
+            resp = c.get(f"/api/v1/users/{self.testuser_id}/followers?format=ndjson")
+
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([r["username"] for r in rows], ["other0", "other1", "other2"])
+
+    def test_profile(self):
+        """Is a profile returned, and a missing user a JSON 404?"""
+
+        resp = self.client.get(f"/api/v1/users/{self.testuser_id}")
+        missing = self.client.get("/api/v1/users/0")
+
+        self.assertEqual(resp.get_json()["data"]["username"], "testuser")
+        self.assertNotIn("password", resp.get_json()["data"])
+        self.assertEqual(missing.status_code, 404)
@@ -0,0 +1,143 @@
+"""Application factory tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_app.py
+
+
+import argparse
+import os
+import subprocess
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from flask import request
+
+from app import app_state, create_app
+from config import add_config_argument, ProductionConfig, TestingConfig
+
+
+class CreateAppTestCase(TestCase):
+    """Test the config profiles"""
+
+    def test_testing_profile(self):
+        """Does the testing profile use the test database without the toolbar?"""
+
+        app = create_app("testing")
+
+        self.assertTrue(app.testing)
+        self.assertFalse(app.config["WTF_CSRF_ENABLED"])
+        self.assertTrue(app.config["SQLALCHEMY_DATABASE_URI"].endswith("warbler_test"))
+        self.assertNotIn("DEBUG_TB_ENABLED", app.config)
+        self.assertIn("views", app.blueprints)
+        self.assertIn("api", app.blueprints)
+
+    def test_development_profile(self):
+        """Does the development profile install the debug toolbar?"""
+
+        app = create_app("development")
+
+        self.assertIn("DEBUG_TB_ENABLED", app.config)
+        self.assertTrue(app.config["SECRET_KEY"])
+
+    def test_jobs_eager(self):
+        """Do only development and testing run jobs inline by default?"""
+
+        env = dict(os.environ)
+        env.pop("JOBS_EAGER", None)
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from config import PROFILES; "
+                "print([cls.JOBS_EAGER for cls in PROFILES.values()])",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(out.stdout.strip(), "[True, True, False]")
+
+    def test_production_needs_secret_key(self):
+        """Does the production profile refuse to start without SECRET_KEY?"""
+
+        class NoSecret(ProductionConfig):
+            SECRET_KEY = None
+
+        with self.assertRaises(RuntimeError):
+            create_app(NoSecret)
+
+    def test_proxy_fix(self):
+        """Is the client address taken from the trusted proxy's header?"""
+
+        self.assertEqual(ProductionConfig.PROXY_FIX_HOPS, 1)
+
+        class BehindProxy(TestingConfig):
+            PROXY_FIX_HOPS = 1
+
+        headers = {"X-Forwarded-For": "198.51.100.1, 203.0.113.7"}
+        environ = {"REMOTE_ADDR": "10.0.0.1"}
+
+        with create_app(BehindProxy).test_client() as c:
+            c.get("/login", headers=headers, environ_base=environ)
+            self.assertEqual(request.remote_addr, "203.0.113.7")
+
+        with create_app("testing").test_client() as c:
+            c.get("/login", headers=headers, environ_base=environ)
+            self.assertEqual(request.remote_addr, "10.0.0.1")
+
+    def test_state_per_app(self):
+        """Does each app keep its own caches?"""
+
+        first = create_app("testing")
+        second = create_app("testing")
+
+        self.assertIsNot(
+            first.extensions["warbler"].object_cache,
+            second.extensions["warbler"].object_cache,
+        )
+        with first.app_context():
+            self.assertIs(app_state(), first.extensions["warbler"])
+
+    def test_commands_default_to_production(self):
+        """Do maintenance commands load production unless told otherwise?"""
+
+        def parse(*args):
+            parser = argparse.ArgumentParser()
+            add_config_argument(parser)
+            return parser.parse_args(args).config
+
+        with patch.dict(os.environ):
+            os.environ.pop("WARBLER_CONFIG", None)
+            self.assertEqual(parse(), "production")
+            self.assertEqual(parse("--config", "testing"), "testing")
+            os.environ["WARBLER_CONFIG"] = "development"
+            self.assertEqual(parse(), "development")
+
+    def test_production_import_path(self):
+        """Does a production worker boot without the toolbar, forms or secret_word?"""
+
+        env = dict(os.environ, SECRET_KEY="production-secret")
+        env.pop("PYTHONPATH", None)
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, wsgi; "
+                "print(sorted({'flask_debugtoolbar', 'forms', 'secret_word'} "
+                "& set(sys.modules)))",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(out.stdout.strip(), "[]")
@@ -0,0 +1,570 @@
+"""Object cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_cache.py
+
+
+import os
+import tempfile
+import time
+from threading import Barrier, Event, Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, announce_invalidation, CACHE_CHANNEL, CURR_USER_KEY
+
+app = create_app("testing")
+from cache import (
+    LRUCache,
+    LocalBackend,
+    ObjectCache,
+    RenderCache,
+    SingleFlight,
+    schema_version,
+)
+from pubsub import PostgresBridge
+from snapshot import Snapshot, write_snapshot
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the in-process LRU"""
+
+    def test_evicts_least_recently_used(self):
+        """Is the least recently read entry dropped first?"""
+
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires(self):
+        """Do entries expire after the TTL?"""
+
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class SingleFlightTestCase(TestCase):
+    """Test request coalescing"""
+
+    def burst(self, fn, threads=20):
+        barrier = Barrier(threads)
+        results = []
+
+        def worker():
+            barrier.wait()
+            try:
+                results.append(fn())
+            except Exception as error:
+                results.append(error)
+
+        workers = [Thread(target=worker) for _ in range(threads)]
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        return results
+
+    def test_coalesces(self):
+        """Do concurrent calls for one key share a single run?"""
+
+        flight = SingleFlight()
+        calls = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.1)
+            return "row"
+
+        results = self.burst(lambda: flight.do("key", load))
+
+        self.assertEqual(results, ["row"] * 20)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats, {"runs": 1, "coalesced": 19})
+        self.assertFalse(flight.in_flight("key"))
+
+    def test_shares_errors(self):
+        """Does every waiting caller see the leader's exception?"""
+
+        flight = SingleFlight()
+
+        def load():
+            time.sleep(0.1)
+            raise KeyError("gone")
+
+        results = self.burst(lambda: flight.do("key", load), threads=5)
+
+        self.assertTrue(all(isinstance(result, KeyError) for result in results))
+
+    def test_serves_stale_while_revalidating(self):
+        """Is the stale page served while one request re-renders it?"""
+
+        pages = RenderCache(fresh=0.01, stale=60)
+        pages.get("page", lambda: "old")
+        time.sleep(0.02)
+
+        rendering = Event()
+        release = Event()
+
+        def slow_render():
+            rendering.set()
+            release.wait()
+            return "new"
+
+        leader = Thread(target=pages.get, args=("page", slow_render))
+        leader.start()
+        rendering.wait()
+
+        self.assertEqual(pages.get("page", lambda: "unused"), "old")
+        release.set()
+        leader.join()
+
+        self.assertEqual(pages.get("page", lambda: "unused"), "new")
+        self.assertEqual(pages.stats["stale_hits"], 1)
+        self.assertEqual(pages.stats["fresh_hits"], 1)
+
+
+class ObjectCacheTestCase(TestCase):
+    """Test read-through lookups against the database"""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+
+        user = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        db.session.commit()
+        self.user_id = user.id
+
+        self.shared = LocalBackend()
+        self.cache = ObjectCache(LRUCache(), self.shared)
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_read_through(self):
+        """Is a second lookup served from the cache without a query?"""
+
+        self.cache.get(db.session, User, self.user_id)
+        db.session.remove()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        db.event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            user = self.cache.get(db.session, User, self.user_id)
+            username = user.username
+        finally:
+            db.event.remove(db.engine, "before_cursor_execute", listener)
+
+        self.assertEqual(username, "testuser")
+        self.assertEqual(statements, [])
+        self.assertEqual(self.cache.stats["local_hits"], 1)
+        self.assertEqual(self.cache.stats["misses"], 1)
+
+    def test_secrets_not_cached(self):
+        """Are password hashes and emails kept out of the caches?"""
+
+        self.cache.get(db.session, User, self.user_id)
+        db.session.remove()
+
+        key = self.cache._key(User, self.user_id)
+        for state in (self.cache.local.get(key), self.shared.get(key)):
+            self.assertEqual(state["username"], "testuser")
+            self.assertNotIn("password", state)
+            self.assertNotIn("email", state)
+
+        # they still load from the database when read
+        user = self.cache.get(db.session, User, self.user_id)
+        self.assertEqual(user.email, "test@test.com")
+        self.assertTrue(user.password.startswith("$2b$"))
+
+    def test_shared_backend(self):
+        """Does a second process pick up rows cached by the first?"""
+
+        other = ObjectCache(LRUCache(), self.shared)
+
+        self.cache.get(db.session, User, self.user_id)
+        db.session.remove()
+        user = other.get(db.session, User, self.user_id)
+
+        self.assertEqual(user.username, "testuser")
+        self.assertEqual(other.stats["shared_hits"], 1)
+        self.assertEqual(other.metrics()["hit_rate"], 1.0)
+
+    def test_invalidate(self):
+        """Is an invalidated row read from the database again?"""
+
+        self.cache.get(db.session, User, self.user_id)
+        User.query.filter_by(id=self.user_id).update({"bio": "new bio"})
+        db.session.commit()
+        self.cache.invalidate(User, self.user_id)
+        db.session.remove()
+
+        self.assertEqual(self.cache.get(db.session, User, self.user_id).bio, "new bio")
+        self.assertEqual(self.cache.stats["misses"], 2)
+
+    def test_invalidate_all(self):
+        """Does a new generation orphan rows cached by every process?"""
+
+        other = ObjectCache(LRUCache(), self.shared)
+        other.get(db.session, User, self.user_id)
+        self.cache.get(db.session, User, self.user_id)
+
+        self.assertEqual(self.cache.stats["shared_hits"], 1)
+
+        other.invalidate_all(User)
+        db.session.remove()
+        # as if this process's copy had expired
+        self.cache.local.clear()
+        self.cache.get(db.session, User, self.user_id)
+
+        self.assertEqual(self.cache.stats["shared_hits"], 1)
+        self.assertEqual(self.cache.stats["misses"], 1)
+
+    def test_invalidations_reach_other_workers(self):
+        """Does a row changed by one worker drop out of another's LRU?"""
+
+        other = ObjectCache(LRUCache(), self.shared)
+        self.cache.announce = other.forget
+        other.announce = self.cache.forget
+
+        self.cache.get(db.session, User, self.user_id)
+        other.get(db.session, User, self.user_id)
+        User.query.filter_by(id=self.user_id).update({"username": "renamed"})
+        db.session.commit()
+        self.cache.invalidate(User, self.user_id)
+        db.session.remove()
+
+        self.assertEqual(other.get(db.session, User, self.user_id).username, "renamed")
+
+        User.query.filter_by(id=self.user_id).update({"username": "again"})
+        db.session.commit()
+        self.cache.invalidate_all(User)
+        db.session.remove()
+
+        self.assertEqual(other.get(db.session, User, self.user_id).username, "again")
+
+    def test_invalidations_over_postgres(self):
+        """Are invalidations carried between workers by NOTIFY?"""
+
+        other = ObjectCache(LRUCache())
+        bridge = PostgresBridge(other.forget, "dbname=warbler_test", CACHE_CHANNEL)
+        bridge.start()
+        self.cache.announce = announce_invalidation
+
+        other.get(db.session, User, self.user_id)
+        key = other._key(User, self.user_id)
+        self.assertIsNotNone(other.local.get(key))
+        with app.app_context():
+            self.cache.invalidate(User, self.user_id)
+
+        for _ in range(50):
+            if other.local.get(key) is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(other.local.get(key))
+
+    def test_bulk_delete_moves_every_worker_on(self):
+        """Does a bulk delete in a worker that cached nothing orphan the rows?"""
+
+        self.cache.get(db.session, User, self.user_id)
+        job_worker = ObjectCache(LRUCache(), self.shared)
+
+        with app.app_context(), patch.object(
+            app.extensions["warbler"], "object_cache", job_worker
+        ):
+            User.query.filter_by(id=self.user_id).delete(synchronize_session=False)
+            db.session.commit()
+
+        self.assertEqual(self.shared.counter(self.cache._generation_key(User)), 1)
+        self.assertEqual(self.shared.counter(self.cache._generation_key(Message)), 1)
+
+    def test_missing_row(self):
+        """Is a missing row None, and not cached?"""
+
+        self.assertIsNone(self.cache.get(db.session, User, 0))
+        self.assertEqual(len(self.cache.local), 0)
+
+    def test_schema_version(self):
+        """Do keys change with the columns of the table?"""
+
+        self.assertNotEqual(schema_version(User), schema_version(Message))
+        self.assertIn(schema_version(User), self.cache._key(User, 1))
+
+
+class SnapshotTestCase(TestCase):
+    """Test attaching a new worker's cache to a snapshot"""
+
+    def setUp(self):
+        User.query.delete()
+
+        user = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        db.session.commit()
+        self.user_id = user.id
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "cache.snapshot")
+
+    def tearDown(self):
+        db.session.rollback()
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        """Are sections read back lazily by key?"""
+
+        write_snapshot(self.path, {"objects": {"a": {"x": 1}}, "other": {"b": [2]}})
+        snapshot = Snapshot(self.path)
+
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(snapshot.get("objects", "a"), {"x": 1})
+        self.assertEqual(snapshot.get("other", "b"), [2])
+        self.assertIsNone(snapshot.get("objects", "b"))
+        self.assertLess(snapshot.age(), 5)
+
+    def test_open_skips_missing_and_old(self):
+        """Is a missing or too old snapshot ignored?"""
+
+        self.assertIsNone(Snapshot.open(self.path, max_age=60))
+
+        write_snapshot(self.path, {})
+        self.assertIsNone(Snapshot.open(self.path, max_age=-1))
+        self.assertIsNotNone(Snapshot.open(self.path, max_age=60))
+
+    def test_new_worker_starts_warm(self):
+        """Does a cache attached to a snapshot skip the database?"""
+
+        old = ObjectCache(LRUCache())
+        old.get(db.session, User, self.user_id)
+        write_snapshot(self.path, {"objects": old.dump()})
+        db.session.remove()
+
+        new = ObjectCache(LRUCache())
+        new.attach(Snapshot(self.path))
+        user = new.get(db.session, User, self.user_id)
+
+        self.assertEqual(user.username, "testuser")
+        self.assertEqual(new.stats["snapshot_hits"], 1)
+        self.assertEqual(new.stats["misses"], 0)
+
+        # the next lookup is served from the worker's own cache
+        new.get(db.session, User, self.user_id)
+        self.assertEqual(new.stats["local_hits"], 1)
+
+    def test_invalidate_masks_snapshot(self):
+        """Is an invalidated row no longer served from the snapshot?"""
+
+        old = ObjectCache(LRUCache())
+        old.get(db.session, User, self.user_id)
+        write_snapshot(self.path, {"objects": old.dump()})
+
+        new = ObjectCache(LRUCache())
+        new.attach(Snapshot(self.path))
+        new.invalidate(User, self.user_id)
+        db.session.remove()
+        new.get(db.session, User, self.user_id)
+
+        self.assertEqual(new.stats["snapshot_hits"], 0)
+        self.assertEqual(new.stats["misses"], 1)
+
+    def test_snapshot_rows_expire(self):
+        """Is a row changed by another worker reloaded once it would expire?"""
+
+        old = ObjectCache(LRUCache(ttl=0.2))
+        old.get(db.session, User, self.user_id)
+        write_snapshot(self.path, {"objects": old.dump()})
+
+        User.query.filter_by(id=self.user_id).update({"username": "renamed"})
+        db.session.commit()
+        db.session.remove()
+
+        new = ObjectCache(LRUCache())
+        new.attach(Snapshot(self.path))
+        self.assertEqual(new.get(db.session, User, self.user_id).username, "testuser")
+
+        time.sleep(0.3)
+        db.session.remove()
+        self.assertEqual(new.get(db.session, User, self.user_id).username, "renamed")
+        self.assertEqual(new.stats["snapshot_hits"], 1)
+        self.assertEqual(new.stats["misses"], 1)
+
+    def test_shared_before_snapshot(self):
+        """Does the shared cache win over the snapshot?"""
+
+        old = ObjectCache(LRUCache())
+        old.get(db.session, User, self.user_id)
+        write_snapshot(self.path, {"objects": old.dump()})
+        db.session.remove()
+
+        new = ObjectCache(LRUCache(), LocalBackend())
+        new.attach(Snapshot(self.path))
+        key = new._key(User, self.user_id)
+        new.shared.set(key, dict(old.local.get(key), username="shared"), 60)
+
+        self.assertEqual(new.get(db.session, User, self.user_id).username, "shared")
+        self.assertEqual(new.stats["shared_hits"], 1)
+        self.assertEqual(new.stats["snapshot_hits"], 0)
+
+    def test_dump_skips_snapshot_rows(self):
+        """Are rows taken from a snapshot left out of the next one?"""
+
+        old = ObjectCache(LRUCache())
+        old.get(db.session, User, self.user_id)
+        write_snapshot(self.path, {"objects": old.dump()})
+        db.session.remove()
+
+        new = ObjectCache(LRUCache())
+        new.attach(Snapshot(self.path))
+        new.get(db.session, User, self.user_id)
+        self.assertEqual(new.dump(), {})
+
+        # once reloaded from the database it is the worker's own again
+        new.invalidate(User, self.user_id)
+        db.session.remove()
+        new.get(db.session, User, self.user_id)
+        self.assertEqual(len(new.dump()), 1)
+
+
+class CacheViewsTestCase(TestCase):
+    """Test invalidation from the views"""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+        user = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_profile_edit_invalidates(self):
+        """Does an edited profile show up straight away?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.get(f"/users/{self.user_id}")
+            c.post(
+                "/users/profile",
+                data={
+                    "username": "renamed",
+                    "email": "test@test.com",
+                    "password": "testuser",
+                    "image_url": "",
+                    "header_image_url": "",
+                    "bio": "",
+                    "location": "",
+                },
+            )
+            html = c.get(f"/users/{self.user_id}").get_data(as_text=True)
+
+        self.assertIn("@renamed", html)
+
+    def test_message_delete_invalidates(self):
+        """Is a deleted message gone even though it was cached?"""
+
+        msg = Message(text="Delete me", user_id=self.user_id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            self.assertEqual(c.get(f"/messages/{msg_id}").status_code, 200)
+            c.post(f"/messages/{msg_id}/delete")
+
+            self.assertEqual(c.get(f"/messages/{msg_id}").status_code, 404)
+
+    def test_public_profile_page_cache(self):
+        """Is the logged-out profile page cached until the user posts?"""
+
+        self.client.get(f"/users/{self.user_id}")
+        # written behind the app's back, so nothing invalidates the page
+        db.session.add(Message(text="Sneaked in", user_id=self.user_id))
+        db.session.commit()
+
+        html = self.client.get(f"/users/{self.user_id}").get_data(as_text=True)
+        self.assertNotIn("Sneaked in", html)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            c.post("/messages/new", data={"text": "Posted"})
+
+        with app.test_client() as anon:
+            html = anon.get(f"/users/{self.user_id}").get_data(as_text=True)
+        self.assertIn("Sneaked in", html)
+        self.assertIn("Posted", html)
+
+    def test_unlike_keeps_pages(self):
+        """Do bulk deletes of likes leave the page cache alone?"""
+
+        msg = Message(text="Like me", user_id=self.user_id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        app.test_client().get(f"/users/{self.user_id}")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            before = c.get("/metrics/cache").get_json()["pages"]["pages"]
+            c.post(f"/users/add_like/{msg_id}")
+            c.post(f"/users/remove_like/{msg_id}")
+            after = c.get("/metrics/cache").get_json()["pages"]["pages"]
+
+        self.assertGreater(before, 0)
+        self.assertEqual(after, before)
+
+    def test_metrics(self):
+        """Are the cache counters exposed?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.get(f"/users/{self.user_id}")
+            data = c.get("/metrics/cache").get_json()
+
+        self.assertGreater(data["local_hits"], 0)
+        self.assertIn("hit_rate", data)
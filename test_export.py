@@ -0,0 +1,179 @@
+"""Personal data export tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_export.py
+
+
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from export import csv_blocks, export_rows, stream_zip
+
+app = create_app("testing")
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+def read_csv(archive, name):
+    return list(csv.reader(io.StringIO(archive.read(name).decode("utf-8"))))
+
+
+class StreamZipTestCase(TestCase):
+    """Test building the ZIP as a stream"""
+
+    def test_round_trip(self):
+        """Can zipfile read back what was streamed, in several chunks?"""
+
+        noise = random.Random(0)
+        rows = [
+            (i, f"comma, newline\n{noise.getrandbits(128):x}") for i in range(20000)
+        ]
+        chunks = list(
+            stream_zip(
+                [
+                    ("a.csv", csv_blocks(("id", "text"), rows)),
+                    ("b.json", ['{"b": 1}']),
+                ]
+            )
+        )
+
+        self.assertGreater(len(chunks), 2)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        self.assertEqual(archive.namelist(), ["a.csv", "b.json"])
+        self.assertEqual(read_csv(archive, "a.csv")[1:], [[str(i), t] for i, t in rows])
+        self.assertEqual(json.loads(archive.read("b.json")), {"b": 1})
+
+
+class ExportViewsTestCase(TestCase):
+    """Test the export pages"""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.export_dir = app.config["EXPORT_DIR"]
+        app.config["EXPORT_DIR"] = self.tmp.name
+
+        user = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        other = User.signup(
+            username="other",
+            email="other@test.com",
+            password="password",
+            image_url=None,
+        )
+        db.session.commit()
+        self.user_id = user.id
+        self.other_id = other.id
+
+        for i in range(3):
+            db.session.add(Message(text=f"Mine, {i}", user_id=self.user_id))
+            db.session.flush()
+        theirs = Message(text="Theirs", user_id=self.other_id)
+        db.session.add(theirs)
+        db.session.flush()
+        db.session.add(Likes(user_id=self.user_id, message_id=theirs.id))
+        db.session.add(
+            Follows(user_following_id=self.user_id, user_being_followed_id=self.other_id)
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        app.config["EXPORT_DIR"] = self.export_dir
+        app.config["EXPORT_INLINE_MAX_ROWS"] = 10000
+        self.tmp.cleanup()
+        db.session.rollback()
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def check_archive(self, data):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+
+        profile = json.loads(archive.read("profile.json"))
+        self.assertEqual(profile["username"], "testuser")
+        self.assertNotIn("password", profile)
+
+        messages = read_csv(archive, "messages.csv")
+        self.assertEqual(messages[0], ["id", "timestamp", "text", "archived"])
+        self.assertEqual([row[2] for row in messages[1:]], ["Mine, 2", "Mine, 1", "Mine, 0"])
+
+        likes = read_csv(archive, "likes.csv")
+        self.assertEqual([row[2:] for row in likes[1:]], [["other", "Theirs"]])
+
+        self.assertEqual(read_csv(archive, "following.csv")[1][1], "other")
+        self.assertEqual(read_csv(archive, "followers.csv")[1:], [])
+
+    def test_export_rows(self):
+        """Are live messages, likes and follows counted?"""
+
+        with app.app_context():
+            self.assertEqual(export_rows(self.user_id), 5)
+
+    def test_inline_export(self):
+        """Is a small account's export streamed straight back?"""
+
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/users/export")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, "application/zip")
+            self.assertTrue(resp.is_streamed)
+            self.check_archive(resp.get_data())
+
+    def test_background_export(self):
+        """Is a big account's export written by the job and resumable?"""
+
+        app.config["EXPORT_INLINE_MAX_ROWS"] = 1
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/users/export")
+            self.assertEqual(resp.status_code, 302)
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, f"{self.user_id}.zip")))
+
+            html = c.get("/users/export").get_data(as_text=True)
+            self.assertIn("/users/export/download", html)
+
+            whole = c.get("/users/export/download")
+            self.assertEqual(whole.status_code, 200)
+            self.check_archive(whole.get_data())
+
+            tail = c.get("/users/export/download", headers={"Range": "bytes=100-"})
+            self.assertEqual(tail.status_code, 206)
+            self.assertEqual(tail.get_data(), whole.get_data()[100:])
+
+    def test_download_missing(self):
+        """Is there nothing to download before an export has been made?"""
+
+        with self.client as c:
+            self.login(c)
+            self.assertEqual(c.get("/users/export/download").status_code, 404)
+
+    def test_export_logged_out(self):
+        """Are logged out visitors turned away?"""
+
+        resp = self.client.post("/users/export", follow_redirects=True)
+        self.assertIn("Access unauthorized", resp.get_data(as_text=True))
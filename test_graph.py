@@ -0,0 +1,160 @@
+"""Follow graph tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_graph.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Follows
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, follow_edges
+
+app = create_app("testing")
+from graph import FollowGraph
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the memory-mapped follow graph"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "follows.graph")
+
+        self.graph = FollowGraph(self.path)
+        self.graph.compact(lambda: [(1, 2), (1, 3), (2, 3)])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_snapshot(self):
+        """Can another process map the snapshot and query both directions?"""
+
+        other = FollowGraph(self.path)
+        other.refresh()
+
+        self.assertEqual(other.following_ids(1), {2, 3})
+        self.assertEqual(other.follower_ids(3), {1, 2})
+        self.assertTrue(other.is_following(1, 2))
+        self.assertFalse(other.is_following(2, 1))
+        self.assertFalse(other.is_following(9, 1))
+
+    def test_deltas(self):
+        """Are logged follows and unfollows replayed by other processes?"""
+
+        other = FollowGraph(self.path)
+        other.refresh()
+
+        self.graph.record(2, 1)
+        self.graph.record(1, 2, following=False)
+        other.refresh()
+
+        self.assertTrue(other.is_following(2, 1))
+        self.assertFalse(other.is_following(1, 2))
+        self.assertEqual(other.following_ids(1), {3})
+        self.assertEqual(other.follower_ids(1), {2})
+
+    def test_compact(self):
+        """Does compaction start a new generation with an empty log?"""
+
+        self.graph.record(3, 1)
+        old_log = self.graph.log_path
+        self.graph.compact(lambda: [(1, 3), (3, 1)])
+
+        self.assertEqual(self.graph.generation, 2)
+        self.assertFalse(os.path.exists(old_log))
+        self.assertEqual(self.graph.following_ids(1), {3})
+        self.assertEqual(self.graph.following_ids(3), {1})
+
+
+    def test_compact_carries_over_late_writes(self):
+        """Is a follow logged while the table is read kept in the new log?"""
+
+        other = FollowGraph(self.path)
+        other.refresh()
+
+        def load_edges():
+            # another worker commits and logs a follow mid-compaction
+            other.record(3, 2)
+            return [(1, 2), (1, 3), (2, 3)]
+
+        self.graph.compact(load_edges)
+        other.refresh()
+
+        self.assertEqual(other.generation, 2)
+        self.assertTrue(other.is_following(3, 2))
+        self.assertTrue(self.graph.is_following(3, 2))
+
+    def test_compact_if_missing(self):
+        """Does a booting worker leave an existing snapshot alone?"""
+
+        other = FollowGraph(self.path)
+        self.assertFalse(other.compact(lambda: [(5, 6)], if_missing=True))
+        self.assertEqual(other.generation, 1)
+        self.assertEqual(other.following_ids(1), {2, 3})
+
+
+class FollowGraphViewsTestCase(TestCase):
+    """Test follow routes with the follow graph enabled"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        Follows.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        self.testuser2 = User.signup(
+            username="testuser2",
+            email="test2@test.com",
+            password="testuser2",
+            image_url=None,
+        )
+        db.session.commit()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.graph = FollowGraph(os.path.join(self.tmp.name, "follows.graph"))
+        self.graph.compact(follow_edges)
+
+    def tearDown(self):
+        """Deletes any leftovers in db.session"""
+        db.session.rollback()
+        self.tmp.cleanup()
+
+    def test_follow_recorded(self):
+        """Does following through the route update the graph?"""
+
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        with patch.object(app.extensions["warbler"], "follow_graph", self.graph):
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = test_id
+
+                c.post(f"/users/follow/{test_id_2}")
+                self.assertTrue(self.graph.is_following(test_id, test_id_2))
+
+                resp = c.get(f"/users/{test_id_2}")
+                self.assertIn("Unfollow", resp.get_data(as_text=True))
+
+                c.post(f"/users/stop-following/{test_id_2}")
+                self.assertFalse(self.graph.is_following(test_id, test_id_2))
@@ -0,0 +1,224 @@
+"""Job queue tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_jobs.py
+
+
+import os
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, MessageTag, Job
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
+import jobs
+from jobs import task, enqueue, claim, run, work, queue_metrics
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+calls = []
+
+
+@task("test_flaky", queue="test", max_attempts=2)
+def flaky(fail):
+    calls.append(fail)
+    if fail:
+        raise ValueError("boom")
+
+
+@task("test_slow", queue="test")
+def slow(seconds):
+    time.sleep(seconds)
+
+
+class JobQueueTestCase(TestCase):
+    """Test enqueueing and running jobs with workers"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        Job.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        db.session.commit()
+        calls.clear()
+
+        app.config["JOBS_EAGER"] = False
+        self.client = app.test_client()
+
+        self.testuser = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        self.testuser2 = User.signup(
+            username="testuser2",
+            email="test2@test.com",
+            password="testuser2",
+            image_url=None,
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        """Deletes any leftovers in db.session"""
+        db.session.rollback()
+        app.config["JOBS_EAGER"] = True
+
+    def test_idempotency_key(self):
+        """Is a second pending job with the same key dropped?"""
+
+        with app.app_context():
+            enqueue("test_flaky", {"fail": False}, key="same")
+            enqueue("test_flaky", {"fail": False}, key="same")
+            db.session.commit()
+
+            self.assertEqual(Job.query.count(), 1)
+            work({"test": 1}, burst=True)
+            self.assertEqual(calls, [False])
+
+            # once that one has run, the key can be used again
+            enqueue("test_flaky", {"fail": False}, key="same")
+            db.session.commit()
+            self.assertEqual(Job.query.filter_by(status="pending").count(), 1)
+
+    def test_retry_then_fail(self):
+        """Are failing jobs retried and then marked failed?"""
+
+        with app.app_context():
+            enqueue("test_flaky", {"fail": True})
+            db.session.commit()
+
+            job = claim({"test": 1})
+            run(job)
+            self.assertEqual(job.status, "pending")
+            self.assertIn("boom", job.last_error)
+
+            job.run_at = db.func.now()
+            db.session.commit()
+            job = claim({"test": 1})
+            run(job)
+            self.assertEqual(job.status, "failed")
+            self.assertEqual(job.attempts, 2)
+            self.assertEqual(queue_metrics()["test"]["failed"], 1)
+
+    def test_concurrency_limit(self):
+        """Does a queue at its limit hand out no more jobs?"""
+
+        with app.app_context():
+            enqueue("test_flaky", {"fail": False})
+            enqueue("test_flaky", {"fail": False})
+            db.session.commit()
+
+            self.assertIsNotNone(claim({"test": 1}))
+            self.assertIsNone(claim({"test": 1}))
+            self.assertIsNotNone(claim({"test": 2}))
+
+    def test_requeue_dead_jobs(self):
+        """Are jobs from a dead worker requeued, unless already queued again?"""
+
+        with app.app_context():
+            enqueue("test_flaky", {"fail": False}, key="dead")
+            enqueue("test_flaky", {"fail": False}, key="replaced")
+            db.session.commit()
+            self.assertIsNotNone(claim({"test": 2}))
+            self.assertIsNotNone(claim({"test": 2}))
+
+            enqueue("test_flaky", {"fail": False}, key="replaced")
+            Job.query.update(
+                {"locked_at": datetime.utcnow() - timedelta(hours=1)},
+                synchronize_session=False,
+            )
+            db.session.commit()
+
+            jobs.sweep(datetime.utcnow())
+            statuses = {
+                (job.idempotency_key, job.status)
+                for job in Job.query.order_by(Job.id)
+            }
+            self.assertEqual(
+                statuses,
+                {("dead", "pending"), ("replaced", "failed"), ("replaced", "pending")},
+            )
+
+    def test_heartbeat(self):
+        """Does a long job keep its lock fresh while it runs?"""
+
+        heartbeat = jobs.HEARTBEAT_SECONDS
+        jobs.HEARTBEAT_SECONDS = 0.05
+        try:
+            with app.app_context():
+                enqueue("test_slow", {"seconds": 0.3})
+                db.session.commit()
+                job = claim({"test": 1})
+                claimed_at = job.locked_at
+                run(job)
+
+                db.session.expire_all()
+                self.assertEqual(job.status, "done")
+                self.assertGreater(job.locked_at, claimed_at)
+        finally:
+            jobs.HEARTBEAT_SECONDS = heartbeat
+
+    def test_deferred_routes(self):
+        """Do routes leave their side effects to the workers?"""
+
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            c.post("/messages/new", data={"text": "#queued"})
+            c.post(f"/users/follow/{test_id_2}")
+            self.assertEqual(MessageTag.query.count(), 0)
+            self.assertEqual(queue_metrics()["default"]["pending"], 1)
+
+            work(app.config["JOB_QUEUE_LIMITS"], burst=True)
+            self.assertEqual(MessageTag.query.one().tag, "queued")
+
+            c.post("/users/delete")
+            self.assertIsNotNone(User.query.get(test_id))
+            work(app.config["JOB_QUEUE_LIMITS"], burst=True)
+            self.assertIsNone(User.query.get(test_id))
+
+    def test_delete_forgets_cached_user(self):
+        """Is a user cached while the delete job runs dropped once it commits?"""
+
+        test_id = self.testuser.id
+        object_cache = app.extensions["warbler"].object_cache
+
+        with app.app_context():
+            jobs.delete_user_task(test_id)
+
+            # a request reading the user before the job commits
+            other = db.create_scoped_session()
+            self.assertIsNotNone(object_cache.get(other, User, test_id))
+            other.remove()
+
+            db.session.commit()
+            self.assertIsNone(object_cache.get(db.session, User, test_id))
+
+    def test_after_commit(self):
+        """Do after_commit callbacks wait for the commit, and skip rollbacks?"""
+
+        with app.app_context():
+            User.query.filter_by(id=self.testuser.id).update({"bio": "rolled back"})
+            jobs.after_commit(lambda: calls.append("rolled back"))
+            db.session.rollback()
+            User.query.filter_by(id=self.testuser.id).update({"bio": "committed"})
+            jobs.after_commit(lambda: calls.append("committed"))
+            self.assertEqual(calls, [])
+            db.session.commit()
+
+        self.assertEqual(calls, ["committed"])
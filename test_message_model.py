@@ -1,15 +1,22 @@
 """Message Model Tests"""
 
 import os
+import runpy
+from types import SimpleNamespace
 from unittest import TestCase
+from unittest.mock import patch
 
 from models import db, User, Message
 
 from datetime import datetime
 
+from snowflake import IdGenerator, assign_worker_id, id_for, id_time
+
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
 
-from app import app
+from app import create_app
+
+app = create_app("testing")
 
 db.drop_all()
 db.create_all()
@@ -49,3 +56,85 @@ class MessageModelTestCase(TestCase):
         self.assertEqual(m.user, self.testuser)
         self.assertEqual(m.text, "Test Message")
         self.assertEqual(type(m.timestamp), datetime)
+
+    def test_message_ids_sort_by_time(self):
+        """Do later messages get larger ids and their own timestamps?"""
+
+        first = Message(text="First")
+        self.testuser.messages.append(first)
+        db.session.commit()
+
+        second = Message(text="Second")
+        self.testuser.messages.append(second)
+        db.session.commit()
+
+        self.assertGreater(second.id, first.id)
+        self.assertLess(first.timestamp, second.timestamp)
+        self.assertAlmostEqual(
+            id_time(first.id).timestamp(), first.timestamp.timestamp(), delta=5
+        )
+
+
+class SnowflakeTestCase(TestCase):
+    """Test snowflake message ids"""
+
+    def test_ids_increase(self):
+        """Are ids from one generator strictly increasing?"""
+
+        generator = IdGenerator(worker_id=7)
+        ids = [generator.next_id() for _ in range(10000)]
+
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual((ids[0] >> 12) & 1023, 7)
+
+    def test_worker_id_from_assignment(self):
+        """Is an assigned worker id used, but refused by a forked child?"""
+
+        with patch.dict(os.environ):
+            assign_worker_id(42)
+            self.assertEqual(IdGenerator().worker_id, 42)
+
+            os.environ["WORKER_ID_PID"] = str(os.getpid() + 1)
+            with self.assertRaises(RuntimeError):
+                IdGenerator().next_id()
+
+    def test_worker_id_required(self):
+        """Does production refuse the pid fallback?"""
+
+        with patch.dict(os.environ):
+            os.environ.pop("WORKER_ID", None)
+            os.environ.pop("WORKER_ID_PID", None)
+            self.assertIsNotNone(IdGenerator().worker_id)
+            with self.assertRaises(RuntimeError):
+                IdGenerator(require_assigned=True).next_id()
+
+        with self.assertRaises(ValueError):
+            assign_worker_id(1024)
+
+    def test_gunicorn_slots(self):
+        """Does each gunicorn worker get a free slot, reused after it exits?"""
+
+        conf = runpy.run_path(os.path.join(os.path.dirname(__file__), "gunicorn.conf.py"))
+        server = SimpleNamespace(WORKERS={})
+        for pid in (101, 102, 103):
+            worker = SimpleNamespace()
+            conf["pre_fork"](server, worker)
+            server.WORKERS[pid] = worker
+        self.assertEqual([w.slot for w in server.WORKERS.values()], [0, 1, 2])
+
+        del server.WORKERS[102]
+        replacement = SimpleNamespace()
+        conf["pre_fork"](server, replacement)
+        self.assertEqual(replacement.slot, 1)
+
+        with patch.dict(os.environ, {"WORKER_ID_BASE": "100"}):
+            conf["post_fork"](server, replacement)
+            self.assertEqual(IdGenerator().worker_id, 101)
+
+    def test_id_for(self):
+        """Does id_for round-trip a timestamp to the millisecond?"""
+
+        when = datetime(2017, 1, 21, 11, 4, 53, 522000)
+
+        self.assertEqual(id_time(id_for(when)), when)
+        self.assertLess(id_for(when), IdGenerator(worker_id=0).next_id())
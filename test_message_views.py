@@ -8,7 +8,10 @@
 import os
 from unittest import TestCase
 
+from sqlalchemy import event
+
 from models import db, connect_db, Message, User, Likes
+from rollups import record_likes
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -20,7 +23,9 @@ os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
 
 # Now we can import app
 
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -87,6 +92,21 @@ class MessageViewTestCase(TestCase):
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
 
+    def test_add_message_too_long(self):
+        """Is a message over 140 characters sent back with an error?"""
+
+        test_id = self.testuser.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            resp = c.post("/messages/new", data={"text": "x" * 141})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("140", resp.get_data(as_text=True))
+            self.assertEqual(Message.query.count(), 0)
+
     def test_add_message_other_user(self):
         """Can a user not add a message for another user?"""
 
@@ -297,6 +317,64 @@ class MessageViewTestCase(TestCase):
             self.assertEqual(liked_message.id, like.message_id)
             self.assertEqual(test_id, like.user_id)
 
+    def test_like_json(self):
+        """Does a script's like get the like count and next action back?"""
+
+        test_id = self.testuser.id
+        msg = Message(text="Test Message")
+        self.testuser2.messages.append(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            resp = c.post(
+                f"/users/add_like/{msg_id}?redirect=/",
+                headers={"Accept": "application/json"},
+            )
+
+            self.assertEqual(
+                resp.get_json(),
+                {
+                    "liked": True,
+                    "likes": 1,
+                    "action": f"/users/remove_like/{msg_id}?redirect=/",
+                },
+            )
+
+            resp = c.post(
+                f"/users/remove_like/{msg_id}?redirect=/",
+                headers={"Accept": "application/json"},
+            )
+
+            self.assertFalse(resp.get_json()["liked"])
+            self.assertEqual(Likes.query.count(), 0)
+
+    def test_like_by_two_users(self):
+        """Can more than one user like the same message?"""
+
+        msg = Message(text="Test Message")
+        self.testuser2.messages.append(msg)
+        testuser3 = User.signup(
+            username="testuser3",
+            email="test3@test.com",
+            password="testuser3",
+            image_url=None,
+        )
+        db.session.commit()
+        msg_id = msg.id
+
+        for user_id in (self.testuser.id, testuser3.id):
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = user_id
+
+                c.post(f"/users/add_like/{msg_id}?redirect=/")
+
+        self.assertEqual(Likes.query.filter_by(message_id=msg_id).count(), 2)
+
     def test_unlike_route(self):
         """Can the user unlike another post?"""
 
@@ -304,6 +382,8 @@ class MessageViewTestCase(TestCase):
         msg = Message(text="Test Message")
         self.testuser2.messages.append(msg)
         self.testuser.likes.append(msg)
+        db.session.flush()
+        record_likes(msg.id, 1)
         db.session.commit()
 
         with self.client as c:
@@ -332,6 +412,8 @@ class MessageViewTestCase(TestCase):
         msg = Message(text="Test Message")
         self.testuser2.messages.append(msg)
         self.testuser.likes.append(msg)
+        db.session.flush()
+        record_likes(msg.id, 1)
         db.session.commit()
 
         with self.client as c:
@@ -381,3 +463,154 @@ class MessageViewTestCase(TestCase):
                 '<div class="alert alert-danger">Access unauthorized.</div>',
                 html,
             )
+
+    def test_trending_page(self):
+        """Does a liked message show up on the trending page?"""
+
+        test_id = self.testuser.id
+        msg = Message(text="Trending Message")
+        self.testuser2.messages.append(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            c.post(f"/users/add_like/{msg_id}?redirect=/")
+            resp = c.get("/trending?window=week")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("<p>Trending Message</p>", html)
+
+    def test_like_counts_nothing(self):
+        """Is a like scored from the rollups, without counting likes or follows?"""
+
+        test_id = self.testuser.id
+        msg = Message(text="Liked Message")
+        self.testuser2.messages.append(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            with app.app_context():
+                event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                resp = c.post(
+                    f"/users/add_like/{msg_id}", headers={"Accept": "application/json"}
+                )
+            finally:
+                with app.app_context():
+                    event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertEqual(resp.get_json()["likes"], 1)
+        self.assertFalse([s for s in statements if "count(" in s.lower()])
+
+    def test_trending_unknown_window(self):
+        """Is an unknown trending window a 404?"""
+
+        with self.client as c:
+            resp = c.get("/trending?window=decade")
+
+            self.assertEqual(resp.status_code, 404)
+
+    def test_search_messages(self):
+        """Can messages be found by word, prefix and phrase?"""
+
+        for text in ["Hello big bird", "Bird is big", "Goodbye world"]:
+            self.testuser.messages.append(Message(text=text))
+        db.session.commit()
+
+        with self.client as c:
+            html = c.get("/messages/search?q=bird").get_data(as_text=True)
+            self.assertIn("<p>Hello big bird</p>", html)
+            self.assertIn("<p>Bird is big</p>", html)
+            self.assertNotIn("<p>Goodbye world</p>", html)
+
+            html = c.get("/messages/search?q=goodb*").get_data(as_text=True)
+            self.assertIn("<p>Goodbye world</p>", html)
+            self.assertNotIn("<p>Hello big bird</p>", html)
+
+            html = c.get('/messages/search?q="big bird"').get_data(as_text=True)
+            self.assertIn("<p>Hello big bird</p>", html)
+            self.assertNotIn("<p>Bird is big</p>", html)
+
+    def test_search_messages_pages(self):
+        """Does the search cursor page through every match once?"""
+
+        from search import search_messages
+
+        for i in range(5):
+            self.testuser.messages.append(Message(text=f"Warble number {i}"))
+        db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            messages, cursor = search_messages("warble", cursor, limit=2)
+            seen.extend(msg.text for msg in messages)
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_home_timeline_fragments(self):
+        """Does the home page load a first page and serve the rest as fragments?"""
+
+        test_id = self.testuser.id
+        self.testuser.following.append(self.testuser2)
+        for i in range(25):
+            self.testuser2.messages.append(Message(text=f"Warble {i}"))
+            db.session.flush()
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            html = c.get("/").get_data(as_text=True)
+            self.assertIn("<p>Warble 24</p>", html)
+            self.assertIn("<p>Warble 5</p>", html)
+            self.assertNotIn("<p>Warble 4</p>", html)
+            self.assertIn('id="load-more"', html)
+
+            oldest = Message.query.filter_by(text="Warble 5").one().id
+            resp = c.get(f"/?fragment=1&before={oldest}")
+            html = resp.get_data(as_text=True)
+
+            self.assertIn("<p>Warble 4</p>", html)
+            self.assertIn("<p>Warble 0</p>", html)
+            self.assertNotIn("<p>Warble 5</p>", html)
+            self.assertNotIn("<html", html)
+            self.assertNotIn("X-Next-Before", resp.headers)
+
+    def test_profile_fragments(self):
+        """Does the profile page hand out its next cursor with each fragment?"""
+
+        test_id_2 = self.testuser2.id
+        for i in range(45):
+            self.testuser2.messages.append(Message(text=f"Warble {i}"))
+            db.session.flush()
+        db.session.commit()
+
+        resp = self.client.get(f"/users/{test_id_2}?fragment=1")
+        before = resp.headers["X-Next-Before"]
+        self.assertIn("<p>Warble 25</p>", resp.get_data(as_text=True))
+
+        resp = self.client.get(f"/users/{test_id_2}?fragment=1&before={before}")
+        html = resp.get_data(as_text=True)
+
+        self.assertIn("<p>Warble 24</p>", html)
+        self.assertIn("<p>Warble 5</p>", html)
+        self.assertNotIn("<p>Warble 25</p>", html)
+        self.assertIn("X-Next-Before", resp.headers)
@@ -0,0 +1,111 @@
+"""Message partition and archive tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_partitions.py
+
+
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User, Message, ArchivedSegment
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
+from partitions import (
+    archive,
+    archived_messages,
+    create_partitions,
+    live_partitions,
+    partition_name,
+    month_start,
+)
+from snowflake import id_for
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class PartitionTestCase(TestCase):
+    """Test monthly partitions of messages"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        ArchivedSegment.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+        self.tmp = tempfile.TemporaryDirectory()
+
+        self.testuser = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        """Deletes any leftovers in db.session"""
+        db.session.rollback()
+        self.tmp.cleanup()
+
+    def old_message(self, text, when):
+        msg = Message(id=id_for(when), text=text, timestamp=when)
+        self.testuser.messages.append(msg)
+        db.session.commit()
+        return msg
+
+    def test_current_month_partition(self):
+        """Do new messages land in this month's partition?"""
+
+        msg = Message(text="Hello")
+        self.testuser.messages.append(msg)
+        db.session.commit()
+
+        name = partition_name(month_start(datetime.utcnow()))
+        self.assertIn(name, live_partitions())
+        count = db.session.execute(
+            db.text(f"SELECT count(*) FROM {name} WHERE id = :id"), {"id": msg.id}
+        ).scalar()
+        self.assertEqual(count, 1)
+
+    def test_archive(self):
+        """Are archived months dropped but still shown on the profile?"""
+
+        with db.engine.begin() as connection:
+            create_partitions(connection, datetime(2020, 1, 1))
+
+        self.old_message("January news", datetime(2020, 1, 10))
+        self.old_message("Later January news", datetime(2020, 1, 20))
+        self.old_message("March news", datetime(2020, 3, 5))
+        test_id = self.testuser.id
+
+        archived = archive(datetime(2020, 3, 1), self.tmp.name)
+
+        self.assertEqual(
+            archived, [("messages_2020_01", 2), ("messages_2020_02", 0)]
+        )
+        self.assertNotIn("messages_2020_01", live_partitions())
+        self.assertEqual([m.text for m in Message.query.all()], ["March news"])
+        self.assertEqual(
+            [m.text for m in archived_messages(test_id)],
+            ["Later January news", "January news"],
+        )
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            html = c.get(f"/users/{test_id}").get_data(as_text=True)
+            self.assertIn("<p>March news</p>", html)
+            self.assertIn("<p>January news</p>", html)
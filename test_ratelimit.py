@@ -0,0 +1,206 @@
+"""Rate limit tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ratelimit.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from ratelimit import LocalBuckets, limiter, parse_limit
+
+app = create_app("testing")
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class LocalBucketsTestCase(TestCase):
+    """Test the in-process token buckets"""
+
+    def test_parse_limit(self):
+        """Is "N/period" a rate per second and a burst of N?"""
+
+        self.assertEqual(parse_limit("10/minute"), (10 / 60, 10))
+        self.assertEqual(parse_limit("2/second"), (2, 2))
+
+    def test_burst_then_refill(self):
+        """Can a client burst, then wait for one token at a time?"""
+
+        buckets = LocalBuckets()
+        with patch("ratelimit.time.monotonic", return_value=100.0) as clock:
+            for _ in range(3):
+                self.assertEqual(buckets.take("a", 1, 3), (True, 0))
+
+            allowed, retry_after = buckets.take("a", 1, 3)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(retry_after, 1)
+
+            clock.return_value = 101.0
+            self.assertTrue(buckets.take("a", 1, 3)[0])
+            self.assertFalse(buckets.take("a", 1, 3)[0])
+
+    def test_buckets_are_per_key(self):
+        """Does one client's empty bucket leave another's alone?"""
+
+        buckets = LocalBuckets()
+        buckets.take("a", 1, 1)
+
+        self.assertFalse(buckets.take("a", 1, 1)[0])
+        self.assertTrue(buckets.take("b", 1, 1)[0])
+
+    def test_bounded(self):
+        """Are the least recently used buckets dropped past maxsize?"""
+
+        buckets = LocalBuckets(maxsize=2)
+        for key in "abc":
+            buckets.take(key, 1, 1)
+
+        self.assertEqual(list(buckets._buckets), ["b", "c"])
+        self.assertTrue(buckets.take("a", 1, 1)[0])
+
+
+class RateLimitViewsTestCase(TestCase):
+    """Test the limits on views"""
+
+    def setUp(self):
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        user = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        other = User.signup(
+            username="other",
+            email="other@test.com",
+            password="password",
+            image_url=None,
+        )
+        db.session.commit()
+        self.user_id = user.id
+        self.other_id = other.id
+
+        limiter.backend = LocalBuckets()
+        self.limits = app.config["RATE_LIMITS"]
+        app.config["RATE_LIMITS"] = dict(
+            self.limits, login="2/minute", post="2/minute", follow="2/minute"
+        )
+        app.config["RATELIMIT_ENABLED"] = True
+
+    def tearDown(self):
+        app.config["RATE_LIMITS"] = self.limits
+        app.config["RATELIMIT_ENABLED"] = False
+        db.session.rollback()
+
+    def test_login_limited(self):
+        """Are repeated login attempts turned away with a Retry-After?"""
+
+        data = {"username": "testuser", "password": "wrong"}
+        for _ in range(2):
+            self.assertEqual(self.client.post("/login", data=data).status_code, 200)
+
+        resp = self.client.post("/login", data=data)
+        self.assertEqual(resp.status_code, 429)
+        self.assertGreaterEqual(int(resp.headers["Retry-After"]), 1)
+
+        # showing the form doesn't take a token
+        self.assertEqual(self.client.get("/login").status_code, 200)
+
+    def test_login_limited_per_username(self):
+        """Are guesses at one account limited, without locking out its owner?"""
+
+        app.config["RATE_LIMITS"] = dict(
+            app.config["RATE_LIMITS"], login="5/minute", login_username="2/minute"
+        )
+        attacker = {"REMOTE_ADDR": "10.0.0.1"}
+        data = {"username": "testuser", "password": "wrong"}
+        for _ in range(2):
+            resp = self.client.post("/login", data=data, environ_base=attacker)
+            self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.post("/login", data=data, environ_base=attacker)
+        self.assertEqual(resp.status_code, 429)
+
+        # another account can still be tried from there
+        data = {"username": "other", "password": "password"}
+        resp = self.client.post("/login", data=data, environ_base=attacker)
+        self.assertEqual(resp.status_code, 302)
+
+        # and the owner can still log in from their own address
+        data = {"username": "testuser", "password": "testuser"}
+        resp = app.test_client().post(
+            "/login", data=data, environ_base={"REMOTE_ADDR": "10.0.0.2"}
+        )
+        self.assertEqual(resp.status_code, 302)
+
+    def test_limits_are_per_user(self):
+        """Does one user's limit leave another's alone?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            for _ in range(2):
+                c.post("/messages/new", data={"text": "Hello"})
+            self.assertEqual(
+                c.post("/messages/new", data={"text": "Hello"}).status_code, 429
+            )
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.other_id
+            self.assertEqual(
+                c.post("/messages/new", data={"text": "Hello"}).status_code, 302
+            )
+
+    def test_json_follow_limited(self):
+        """Does the browser script get a JSON 429?"""
+
+        headers = {"Accept": "application/json"}
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.post(f"/users/follow/{self.other_id}", headers=headers)
+            c.post(f"/users/stop-following/{self.other_id}", headers=headers)
+            resp = c.post(f"/users/follow/{self.other_id}", headers=headers)
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.get_json(), {"error": "Too many requests."})
+        self.assertIn("Retry-After", resp.headers)
+
+    def test_api_shares_post_limit(self):
+        """Do API posts take from the same bucket as the form?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.post("/messages/new", data={"text": "Hello"})
+            self.assertEqual(
+                c.post("/api/v1/messages", json={"text": "Hi"}).status_code, 201
+            )
+            resp = c.post("/api/v1/messages", json={"text": "Hi"})
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.get_json()["error"], "Too many requests.")
+        self.assertIn("Retry-After", resp.headers)
+
+    def test_disabled(self):
+        """Does RATELIMIT_ENABLED = False turn the limits off?"""
+
+        app.config["RATELIMIT_ENABLED"] = False
+        data = {"username": "testuser", "password": "wrong"}
+        for _ in range(3):
+            self.assertEqual(self.client.post("/login", data=data).status_code, 200)
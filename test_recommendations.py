@@ -0,0 +1,116 @@
+"""Who-to-follow suggestion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_recommendations.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Follows, Suggestion
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
+from graph import CSRGraph
+from recommendations import suggest_for, compute_suggestions, refresh_suggestions
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+# 1 follows 2 and 3; 2 and 3 both follow 4; 3 also follows 5 and 1
+EDGES = [(1, 2), (1, 3), (2, 4), (3, 4), (3, 5), (3, 1)]
+
+
+class CSRGraphTestCase(TestCase):
+    """Test the CSR follows graph"""
+
+    def test_rows(self):
+        """Are rows sorted positions of followed users?"""
+
+        graph = CSRGraph.from_edges(EDGES)
+        i = graph.index(3)
+
+        self.assertEqual([graph.nodes[j] for j in graph.row(i)], [1, 4, 5])
+        self.assertTrue(graph.has_edge(i, graph.index(5)))
+        self.assertFalse(graph.has_edge(i, graph.index(2)))
+        self.assertIsNone(graph.index(99))
+
+
+class SuggestionTestCase(TestCase):
+    """Test friends-of-friends suggestions"""
+
+    def test_suggest_for(self):
+        """Are 2-hop accounts ranked by common follows, excluding followed?"""
+
+        graph = CSRGraph.from_edges(EDGES)
+        suggested = [
+            (graph.nodes[k], common)
+            for k, common in suggest_for(graph, graph.index(1), top=10)
+        ]
+
+        self.assertEqual(suggested, [(4, 2), (5, 1)])
+
+    def test_compute_suggestions(self):
+        """Does the chunked batch cover every user?"""
+
+        graph = CSRGraph.from_edges(EDGES)
+        rows = sorted(compute_suggestions(graph, top=1, processes=2, chunk_size=2))
+
+        self.assertEqual(rows, [(1, 0, 4, 2), (3, 0, 2, 1)])
+
+
+class SuggestionViewsTestCase(TestCase):
+    """Test the who-to-follow panel"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        Suggestion.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        self.users = [
+            User.signup(
+                username=f"testuser{i}",
+                email=f"test{i}@test.com",
+                password="testuser",
+                image_url=None,
+            )
+            for i in range(3)
+        ]
+        db.session.commit()
+
+        self.users[0].following.append(self.users[1])
+        self.users[1].following.append(self.users[2])
+        db.session.commit()
+
+    def tearDown(self):
+        """Deletes any leftovers in db.session"""
+        db.session.rollback()
+
+    def test_home_panel(self):
+        """Does the home page show stored suggestions?"""
+
+        test_id = self.users[0].id
+
+        count = refresh_suggestions(top=5, processes=1)
+        self.assertEqual(count, 1)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            resp = c.get("/")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Who to follow", html)
+            self.assertIn("@testuser2</a>", html)
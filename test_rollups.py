@@ -0,0 +1,244 @@
+"""Stats rollup tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_rollups.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from models import (
+    db,
+    DailyCount,
+    FollowerCount,
+    LikeCount,
+    LikedCount,
+    Message,
+    User,
+)
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from rollups import daily_counts, most_followed, most_liked, rebuild
+
+app = create_app("testing")
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+def today_count(metric):
+    return dict(daily_counts(1)[metric])[datetime.utcnow().date()]
+
+
+class RollupsTestCase(TestCase):
+    """Test that the write paths keep the rollups up to date"""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        DailyCount.query.delete()
+        LikeCount.query.delete()
+
+        self.client = app.test_client()
+
+        users = [
+            User.signup(
+                username=name,
+                email=f"{name}@test.com",
+                password="password",
+                image_url=None,
+            )
+            for name in ("admin", "alice", "bob")
+        ]
+        db.session.commit()
+        self.admin_id, self.alice_id, self.bob_id = [user.id for user in users]
+
+        msg = Message(text="Like me", user_id=self.alice_id)
+        db.session.add(msg)
+        db.session.commit()
+        self.msg_id = msg.id
+
+        app.config["ADMIN_USERNAMES"] = {"admin"}
+
+    def tearDown(self):
+        app.config["ADMIN_USERNAMES"] = frozenset()
+        db.session.rollback()
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def follower_counts(self):
+        return {row.user_id: row.followers for row in FollowerCount.query}
+
+    def test_follows(self):
+        """Are follows counted once, and unfollows taken back?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/follow/{self.alice_id}")
+            c.post(f"/users/follow/{self.alice_id}")
+
+            self.assertEqual(self.follower_counts(), {self.alice_id: 1})
+            self.assertEqual(today_count("follows"), 1)
+
+            c.post(f"/users/stop-following/{self.alice_id}")
+            c.post(f"/users/stop-following/{self.alice_id}")
+
+            self.assertEqual(self.follower_counts(), {self.alice_id: 0})
+            self.assertEqual(today_count("follows"), 1)
+
+    def test_likes(self):
+        """Are likes counted per message and per day?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/add_like/{self.msg_id}")
+            c.post(f"/users/add_like/{self.msg_id}")
+
+            self.assertEqual(db.session.get(LikeCount, self.msg_id).likes, 1)
+            self.assertEqual(today_count("likes"), 1)
+
+            c.post(f"/users/remove_like/{self.msg_id}")
+            db.session.expire_all()
+            self.assertEqual(db.session.get(LikeCount, self.msg_id).likes, 0)
+
+    def liked_counts(self):
+        return {row.user_id: row.liked for row in LikedCount.query}
+
+    def test_liked(self):
+        """Are the messages each user liked counted, and shown on the profile?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/add_like/{self.msg_id}")
+            c.post(f"/users/add_like/{self.msg_id}")
+            c.post(f"/users/follow/{self.alice_id}")
+
+            self.assertEqual(self.liked_counts(), {self.bob_id: 1})
+
+            # the header reads the rollups, so make them disagree with the tables
+            db.session.get(LikedCount, self.bob_id).liked = 7
+            db.session.get(FollowerCount, self.alice_id).followers = 9
+            db.session.commit()
+            html = c.get(f"/users/{self.bob_id}").get_data(as_text=True)
+            self.assertIn(f'href="/users/{self.bob_id}/liked">7</a>', html)
+            html = c.get(f"/users/{self.alice_id}").get_data(as_text=True)
+            self.assertRegex(html, rf'data-followers-count="{self.alice_id}"\s*>9</a')
+            db.session.get(LikedCount, self.bob_id).liked = 1
+            db.session.commit()
+
+            c.post(f"/users/remove_like/{self.msg_id}")
+            db.session.expire_all()
+            self.assertEqual(self.liked_counts(), {self.bob_id: 0})
+
+            c.post(f"/users/add_like/{self.msg_id}")
+            self.login(c, self.alice_id)
+            c.post(f"/messages/{self.msg_id}/delete")
+
+        db.session.expire_all()
+        self.assertEqual(self.liked_counts(), {self.bob_id: 0})
+
+    def test_messages_and_signups(self):
+        """Are posts and signups counted?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post("/messages/new", data={"text": "Hello"})
+            c.post("/messages/new", data={"text": "Again"})
+
+            self.assertEqual(today_count("messages"), 2)
+
+        with app.test_client() as c:
+            c.post(
+                "/signup",
+                data={
+                    "username": "carol",
+                    "email": "carol@test.com",
+                    "password": "password",
+                    "image_url": "",
+                },
+            )
+
+        self.assertEqual(today_count("signups"), 1)
+
+    def test_delete_user(self):
+        """Are a deleted user's follows and likes taken back?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/follow/{self.alice_id}")
+            c.post(f"/users/add_like/{self.msg_id}")
+            c.post("/users/delete")
+
+        db.session.expire_all()
+        self.assertEqual(self.follower_counts(), {self.alice_id: 0})
+        self.assertEqual(db.session.get(LikeCount, self.msg_id).likes, 0)
+
+    def test_delete_liked_user(self):
+        """Are likes of a deleted user's messages taken back from their likers?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/add_like/{self.msg_id}")
+            self.login(c, self.alice_id)
+            c.post("/users/delete")
+
+        db.session.expire_all()
+        self.assertEqual(self.liked_counts(), {self.bob_id: 0})
+
+    def test_rebuild(self):
+        """Does a rebuild agree with the counts kept as things happened?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/follow/{self.alice_id}")
+            c.post(f"/users/add_like/{self.msg_id}")
+            self.login(c, self.admin_id)
+            c.post(f"/users/follow/{self.alice_id}")
+            c.post(f"/users/follow/{self.bob_id}")
+
+        with app.app_context():
+            before = (
+                daily_counts(),
+                [(user.id, n) for user, n in most_followed()],
+                [(msg.id, n) for msg, n in most_liked()],
+                self.liked_counts(),
+            )
+            rebuild()
+            db.session.commit()
+            after = (
+                daily_counts(),
+                [(user.id, n) for user, n in most_followed()],
+                [(msg.id, n) for msg, n in most_liked()],
+                self.liked_counts(),
+            )
+
+        # the message was added directly, so only the rebuild counts it
+        before[0]["messages"][-1] = (before[0]["messages"][-1][0], 1)
+        self.assertEqual(before, after)
+        self.assertEqual(after[1], [(self.alice_id, 2), (self.bob_id, 1)])
+
+    def test_admin_stats(self):
+        """Do admins see the stats page, and no one else?"""
+
+        with self.client as c:
+            self.login(c, self.bob_id)
+            c.post(f"/users/follow/{self.alice_id}")
+            c.post(f"/users/add_like/{self.msg_id}")
+
+            resp = c.get("/admin/stats", follow_redirects=True)
+            self.assertIn("Access unauthorized", resp.get_data(as_text=True))
+
+            self.login(c, self.admin_id)
+            resp = c.get("/admin/stats")
+            html = resp.get_data(as_text=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("@alice", html)
+            self.assertIn("Like me", html)
@@ -0,0 +1,118 @@
+"""Hashtag and mention tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_tags.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, User, Message, MessageTag, Mention
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
+from tags import extract_tags, extract_mentions, backfill, tagged_messages
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class ExtractTestCase(TestCase):
+    """Test parsing tags and mentions out of text"""
+
+    def test_extract_tags(self):
+        """Are hashtags lower-cased and de-duplicated?"""
+
+        self.assertEqual(
+            extract_tags("#Flask and #python, again #flask! a#b ##x"),
+            ["flask", "python"],
+        )
+
+    def test_extract_mentions(self):
+        """Are mentions found but not email addresses?"""
+
+        self.assertEqual(
+            extract_mentions("hi @bob and @alice_2, mail bob@example.com @bob"),
+            ["bob", "alice_2"],
+        )
+
+
+class TagViewsTestCase(TestCase):
+    """Test tag and mention pages"""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(
+            username="testuser",
+            email="test@test.com",
+            password="testuser",
+            image_url=None,
+        )
+        self.testuser2 = User.signup(
+            username="testuser2",
+            email="test2@test.com",
+            password="testuser2",
+            image_url=None,
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        """Deletes any leftovers in db.session"""
+        db.session.rollback()
+
+    def test_post_indexes(self):
+        """Does posting a message store its tags and mentions?"""
+
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            c.post("/messages/new", data={"text": "#Hello @testuser2 @nobody"})
+
+            msg = Message.query.one()
+            self.assertEqual(MessageTag.query.one().tag, "hello")
+            mention = Mention.query.one()
+            self.assertEqual(mention.user_id, test_id_2)
+            self.assertEqual(mention.message_id, msg.id)
+
+            html = c.get("/tags/HELLO").get_data(as_text=True)
+            self.assertIn("<p>#Hello @testuser2 @nobody</p>", html)
+
+            html = c.get(f"/users/{test_id_2}/mentions").get_data(as_text=True)
+            self.assertIn("<p>#Hello @testuser2 @nobody</p>", html)
+
+    def test_backfill(self):
+        """Does the backfill index old messages and resume from its checkpoint?"""
+
+        for i in range(5):
+            self.testuser.messages.append(Message(text=f"old #news {i}"))
+        db.session.commit()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, "checkpoint")
+            self.assertEqual(backfill(batch_size=2, checkpoint_path=checkpoint), 5)
+            self.assertEqual(backfill(batch_size=2, checkpoint_path=checkpoint), 0)
+
+        messages, before = tagged_messages("news", limit=3)
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0].text, "old #news 4")
+
+        older, before = tagged_messages("news", before=before, limit=3)
+        self.assertEqual([msg.text for msg in older], ["old #news 1", "old #news 0"])
+        self.assertIsNone(before)
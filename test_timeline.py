@@ -0,0 +1,146 @@
+"""New warbles count tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, Follows, LatestPost, Message, User
+
+os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
+
+from app import create_app, post_message, CURR_USER_KEY
+from timeline import backfill, new_message_count
+
+app = create_app("testing")
+
+db.drop_all()
+db.create_all()
+
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class TimelineTestCase(TestCase):
+    """Test counting new messages from followed users"""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+
+        self.client = app.test_client()
+
+        users = [
+            User.signup(
+                username=name,
+                email=f"{name}@test.com",
+                password="password",
+                image_url=None,
+            )
+            for name in ("reader", "followed", "stranger")
+        ]
+        db.session.commit()
+        self.reader_id, self.followed_id, self.stranger_id = [u.id for u in users]
+
+        db.session.add(
+            Follows(user_following_id=self.reader_id, user_being_followed_id=self.followed_id)
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def post(self, user_id, text):
+        with app.test_request_context():
+            return post_message(db.session.get(User, user_id), text).id
+
+    def poll(self, c, since):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+        return c.get(f"/timeline/new?since={since}").get_json()
+
+    def test_count(self):
+        """Are only followed users' messages after the cursor counted?"""
+
+        seen = self.post(self.followed_id, "Seen")
+        self.post(self.followed_id, "New")
+        self.post(self.followed_id, "Newer")
+        self.post(self.stranger_id, "Not followed")
+
+        with self.client as c:
+            self.assertEqual(self.poll(c, seen), {"count": 2, "more": False})
+            self.assertEqual(self.poll(c, 0)["count"], 3)
+
+    def test_nothing_new(self):
+        """Is a quiet timeline answered without reading messages?"""
+
+        newest = self.post(self.followed_id, "Seen")
+        self.post(self.stranger_id, "Not followed")
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                self.assertEqual(new_message_count(self.reader_id, newest), 0)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertTrue(statements)
+        self.assertFalse([s for s in statements if "FROM messages" in s])
+
+    def test_cap(self):
+        """Does the count stop at the cap?"""
+
+        for i in range(5):
+            self.post(self.followed_id, f"Message {i}")
+
+        with app.app_context():
+            self.assertEqual(new_message_count(self.reader_id, 0, cap=3), 3)
+            self.assertEqual(
+                new_message_count(self.reader_id, 0, following_ids={self.followed_id}),
+                5,
+            )
+
+    def test_backfill(self):
+        """Are authors who posted before latest_posts filled in?"""
+
+        msg = Message(text="Old", user_id=self.followed_id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        with app.app_context():
+            self.assertEqual(new_message_count(self.reader_id, 0), 0)
+            self.assertEqual(backfill(), 1)
+            db.session.commit()
+            self.assertEqual(db.session.get(LatestPost, self.followed_id).message_id, msg_id)
+            self.assertEqual(new_message_count(self.reader_id, 0), 1)
+
+    def test_home_cursor(self):
+        """Does the home page hand the newest message id to the poller?"""
+
+        newest = self.post(self.followed_id, "Newest")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.reader_id
+            html = c.get("/").get_data(as_text=True)
+            self.assertIn(f'data-newest="{newest}"', html)
+            self.assertIn('id="new-warbles"', html)
+
+            # older pages don't poll or open the stream
+            html = c.get(f"/?before={newest}").get_data(as_text=True)
+            self.assertIn('data-newest=""', html)
+
+    def test_logged_out(self):
+        """Are logged out visitors turned away?"""
+
+        self.assertEqual(self.client.get("/timeline/new?since=0").status_code, 401)
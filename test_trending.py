@@ -0,0 +1,112 @@
+"""Trending board tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_trending.py
+
+
+from unittest import TestCase
+
+from trending import TrendingBoard, Trending
+
+NOW = 1_700_000_000
+HOUR = 60 * 60
+
+
+class TrendingBoardTestCase(TestCase):
+    """Test the bounded top-K board"""
+
+    def setUp(self):
+        self.board = TrendingBoard(k=3, window=24 * HOUR, half_life=6 * HOUR)
+
+    def test_orders_by_likes(self):
+        """Do more liked messages of the same age rank higher?"""
+
+        self.board.update(1, NOW, likes=1, followers=0, now=NOW)
+        self.board.update(2, NOW, likes=5, followers=0, now=NOW)
+        self.board.update(3, NOW, likes=3, followers=0, now=NOW)
+
+        self.assertEqual(self.board.top(NOW), [2, 3, 1])
+
+    def test_newer_messages_win_ties(self):
+        """Does an older message with equal engagement rank lower?"""
+
+        self.board.update(1, NOW - 2 * HOUR, likes=2, followers=10, now=NOW)
+        self.board.update(2, NOW, likes=2, followers=10, now=NOW)
+
+        self.assertEqual(self.board.top(NOW), [2, 1])
+
+    def test_bounded(self):
+        """Does the board keep only the best k messages?"""
+
+        for msg_id, likes in enumerate([4, 1, 3, 5, 2]):
+            self.board.update(msg_id, NOW, likes=likes, followers=0, now=NOW)
+
+        self.assertEqual(len(self.board), 3)
+        self.assertEqual(self.board.top(NOW), [3, 0, 2])
+
+    def test_rescore(self):
+        """Does a new like move a message up the board?"""
+
+        self.board.update(1, NOW, likes=3, followers=0, now=NOW)
+        self.board.update(2, NOW, likes=1, followers=0, now=NOW)
+        self.board.update(2, NOW, likes=9, followers=0, now=NOW)
+
+        self.assertEqual(self.board.top(NOW), [2, 1])
+
+    def test_discard(self):
+        """Can a deleted message be removed from the board?"""
+
+        for msg_id in range(3):
+            self.board.update(msg_id, NOW, likes=msg_id, followers=0, now=NOW)
+        self.board.discard(0)
+
+        self.assertNotIn(0, self.board)
+        self.assertEqual(self.board.top(NOW), [2, 1])
+
+    def test_expired(self):
+        """Are messages older than the window left off the board?"""
+
+        self.board.update(1, NOW - 25 * HOUR, likes=9, followers=0, now=NOW)
+        self.board.update(2, NOW - 1 * HOUR, likes=0, followers=0, now=NOW)
+
+        self.assertEqual(self.board.top(NOW), [2])
+        self.assertEqual(self.board.top(NOW + 24 * HOUR), [])
+
+
+class TrendingTestCase(TestCase):
+    """Test the per-window boards"""
+
+    def test_windows(self):
+        """Does each window only keep messages from its own time range?"""
+
+        trending = Trending(k=10)
+        trending.record(1, NOW - 3 * 24 * HOUR, 5, 0, now=NOW)
+        trending.record(2, NOW - HOUR, 1, 0, now=NOW)
+
+        self.assertEqual(trending.top("day", NOW), [2])
+        self.assertEqual(sorted(trending.top("week", NOW)), [1, 2])
+
+    def test_seed(self):
+        """Does seeding replace what was on the boards?"""
+
+        trending = Trending(k=10)
+        trending.record(1, NOW, 1, 0, now=NOW)
+        trending.seed([(2, NOW, 0, 0)], now=NOW)
+
+        self.assertEqual(trending.top("day", NOW), [2])
+        self.assertEqual(trending.seeded_at, NOW)
+
+    def test_restore(self):
+        """Does a restored copy rank and update like the original?"""
+
+        trending = Trending(k=10)
+        trending.seed([(1, NOW, 3, 0), (2, NOW, 1, 0)], now=NOW)
+
+        copy = Trending(k=10)
+        copy.restore(trending.state())
+        copy.record(2, NOW, 9, 0, now=NOW)
+
+        self.assertEqual(trending.top("day", NOW), [1, 2])
+        self.assertEqual(copy.top("day", NOW), [2, 1])
+        self.assertEqual(copy.seeded_at, NOW)
@@ -1,13 +1,18 @@
 """User Views Test"""
 
 import os
+import re
+from datetime import datetime
 from unittest import TestCase
 
 from models import db, connect_db, Message, User, Follows, Likes
+from rollups import record_followers
 
 os.environ["DATABASE_URL"] = "postgresql:///warbler_test"
 
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
+
+app = create_app("testing")
 
 
 db.drop_all()
@@ -93,6 +98,43 @@ class UserViewsTestCase(TestCase):
             self.assertEqual(fllw.user_following_id, test_id)
             self.assertEqual(fllw.user_being_followed_id, test_id_2)
 
+    def test_home_counts(self):
+        """Does the home page show counts without loading the collections?"""
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        db.session.add(Follows(user_following_id=test_id, user_being_followed_id=test_id_2))
+        db.session.add(Follows(user_following_id=test_id_2, user_being_followed_id=test_id))
+        db.session.add(Message(text="Mine", user_id=test_id))
+        db.session.commit()
+
+        statements = []
+        record = lambda *args: statements.append(args[2])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            with app.app_context():
+                db.event.listen(db.engine, "before_cursor_execute", record)
+            try:
+                html = c.get("/").get_data(as_text=True)
+            finally:
+                with app.app_context():
+                    db.event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertIn(f'data-following-count="{test_id}"\n                >1</a', html)
+        # nothing loads g.user.messages, .following, .followers or .likes
+        self.assertFalse(
+            [
+                s
+                for s in statements
+                if "FROM users, follows" in s
+                or "FROM messages, likes" in s
+                or ")s = messages.user_id" in s
+            ]
+        )
+
     def test_follow_route_redirect_logged_out(self):
         """user is redirected to the main page when trying to follow someone when not logged in"""
         test_id_2 = self.testuser2.id
@@ -240,6 +282,80 @@ class UserViewsTestCase(TestCase):
                 html,
             )
 
+    def test_user_list_streams(self):
+        """Is a large user list streamed in chunks?"""
+
+        for i in range(30):
+            db.session.add(
+                User(
+                    username=f"fan{i}",
+                    email=f"fan{i}@test.com",
+                    password="password",
+                    bio="x" * 200,
+                )
+            )
+        db.session.commit()
+
+        app.config["STREAM_CHUNK_ROWS"] = 7
+        try:
+            resp = self.client.get("/users?q=fan")
+            chunks = list(resp.response)
+        finally:
+            app.config["STREAM_CHUNK_ROWS"] = 500
+
+        html = b"".join(chunks).decode()
+        self.assertTrue(resp.is_streamed)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(html.count('class="card user-card"'), 30)
+
+    def test_follower_pages(self):
+        """Are followers paged newest follow first, with follow state and counts?"""
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        fans = [
+            User(username=f"fan{i}", email=f"fan{i}@test.com", password="password")
+            for i in range(5)
+        ]
+        db.session.add_all(fans)
+        db.session.flush()
+        for i, fan in enumerate(fans):
+            db.session.add(
+                Follows(
+                    user_following_id=fan.id,
+                    user_being_followed_id=test_id_2,
+                    created_at=datetime(2024, 1, 1 + i),
+                )
+            )
+        db.session.add(
+            Follows(user_following_id=test_id, user_being_followed_id=fans[3].id)
+        )
+        record_followers(test_id_2, len(fans))
+        db.session.commit()
+        fan3_id = fans[3].id
+
+        app.config["FOLLOWS_PAGE_SIZE"] = 3
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = test_id
+
+                first = c.get(f"/users/{test_id_2}/followers").get_data(as_text=True)
+                cursor = re.search(r"followers\?before=(\w+)", first).group(1)
+                second = c.get(
+                    f"/users/{test_id_2}/followers?before={cursor}"
+                ).get_data(as_text=True)
+        finally:
+            app.config["FOLLOWS_PAGE_SIZE"] = 50
+
+        self.assertEqual(
+            re.findall(r"<p>@(fan\d)</p>", first), ["fan4", "fan3", "fan2"]
+        )
+        self.assertEqual(re.findall(r"<p>@(fan\d)</p>", second), ["fan1", "fan0"])
+        self.assertNotIn("?before=", second)
+        self.assertIn(f'action="/users/stop-following/{fan3_id}"', first)
+        self.assertIn(f'data-followers-count="{test_id_2}"\n                >5</a', first)
+
     def test_own_follower_page_logout_redirect(self):
         """will the user be redirected from seeing their own followers page when logged out?"""
         test_id = self.testuser.id
@@ -362,6 +478,64 @@ class UserViewsTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             self.assertNotIn("<p>@testuser2</p>", html)
 
+    def test_follow_json(self):
+        """Does a script's follow get the new state and counts back?"""
+
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            resp = c.post(
+                f"/users/follow/{test_id_2}", headers={"Accept": "application/json"}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(
+                resp.get_json(),
+                {
+                    "is_following": True,
+                    "user_id": test_id_2,
+                    "follower_id": test_id,
+                    "followers": 1,
+                    "following_change": 1,
+                    "action": f"/users/stop-following/{test_id_2}",
+                },
+            )
+
+            # following twice is harmless
+            resp = c.post(
+                f"/users/follow/{test_id_2}", headers={"Accept": "application/json"}
+            )
+            self.assertEqual(resp.get_json()["followers"], 1)
+            self.assertEqual(resp.get_json()["following_change"], 0)
+            self.assertEqual(Follows.query.count(), 1)
+
+    def test_unfollow_json(self):
+        """Does a script's unfollow get the new state and counts back?"""
+
+        test_id = self.testuser.id
+        test_id_2 = self.testuser2.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = test_id
+
+            c.post(f"/users/follow/{test_id_2}")
+            resp = c.post(
+                f"/users/stop-following/{test_id_2}",
+                headers={"Accept": "application/json"},
+            )
+
+            data = resp.get_json()
+            self.assertFalse(data["is_following"])
+            self.assertEqual(data["followers"], 0)
+            self.assertEqual(data["following_change"], -1)
+            self.assertEqual(data["action"], f"/users/follow/{test_id_2}")
+            self.assertEqual(Follows.query.count(), 0)
+
     def test_own_like_page(self):
         """Can the user see their own liked page"""
 
@@ -435,6 +609,41 @@ class UserViewsTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             self.assertIn("<p>Test Message</p>", html)
 
+    def test_like_pages(self):
+        """Are liked messages paged most recently liked first?"""
+
+        test_id = self.testuser.id
+        messages = [Message(text=f"Liked {i}") for i in range(5)]
+        for msg in messages:
+            self.testuser2.messages.append(msg)
+            db.session.flush()
+        for i, msg in enumerate(reversed(messages)):
+            db.session.add(
+                Likes(user_id=test_id, message_id=msg.id, created_at=datetime(2024, 1, 1 + i))
+            )
+        db.session.commit()
+
+        app.config["TIMELINE_PAGE_SIZE"] = 3
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = test_id
+
+                first = c.get(f"/users/{test_id}/liked").get_data(as_text=True)
+                cursor = re.search(r"liked\?before=(\w+)", first).group(1)
+                second = c.get(f"/users/{test_id}/liked?before={cursor}").get_data(
+                    as_text=True
+                )
+        finally:
+            app.config["TIMELINE_PAGE_SIZE"] = 20
+
+        # the oldest message was liked last
+        self.assertEqual(
+            re.findall(r"<p>(Liked \d)</p>", first), ["Liked 0", "Liked 1", "Liked 2"]
+        )
+        self.assertEqual(re.findall(r"<p>(Liked \d)</p>", second), ["Liked 3", "Liked 4"])
+        self.assertIn("@testuser2</a>", second)
+
     def test_own_like_page_logged_out_redirect(self):
         """Will the user be redirected from another user's liked page when logged out?"""
 
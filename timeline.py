@@ -0,0 +1,107 @@
+"""The "N new warbles" count on the home timeline.
+
+The home page polls every TIMELINE_POLL_SECONDS with the id of the newest
+message it shows. Counting the followed users' messages past that id with
+a query over `messages` would cost every open tab a timeline query per
+poll, so posting also records each author's newest message id in
+latest_posts. A poll first looks there, through the follows index, for the
+followed authors who have posted since the cursor; usually there are none
+and the answer is 0 without touching `messages`. Otherwise only those
+authors' new messages are counted, with the (user_id, id) index, and never
+more than COUNT_CAP of them.
+
+Authors who posted before latest_posts existed are filled in with:
+
+    python timeline.py backfill
+"""
+
+import argparse
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Follows, LatestPost, Message
+
+COUNT_CAP = 99
+
+
+def record_posted(user_id, message_id):
+    """Note that `user_id` posted `message_id`."""
+
+    stmt = insert(LatestPost).values(user_id=user_id, message_id=message_id)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LatestPost.user_id],
+            set_={
+                "message_id": db.func.greatest(
+                    LatestPost.message_id, stmt.excluded.message_id
+                )
+            },
+        )
+    )
+
+
+def new_message_count(user_id, since, following_ids=None, cap=COUNT_CAP):
+    """How many messages the users `user_id` follows posted after id `since`.
+
+    Counts at most `cap`. Pass `following_ids` when they are already known
+    (from the follow graph) to skip the follows lookup.
+    """
+
+    authors = db.session.query(LatestPost.user_id).filter(
+        LatestPost.message_id > since
+    )
+    if following_ids is not None:
+        authors = authors.filter(LatestPost.user_id.in_(list(following_ids)))
+    else:
+        authors = authors.join(
+            Follows, Follows.user_being_followed_id == LatestPost.user_id
+        ).filter(Follows.user_following_id == user_id)
+
+    posted = [author_id for (author_id,) in authors]
+    if not posted:
+        return 0
+
+    new = (
+        db.session.query(Message.id)
+        .filter(Message.user_id.in_(posted), Message.id > since)
+        .limit(cap)
+        .subquery()
+    )
+    return db.session.query(db.func.count()).select_from(new).scalar()
+
+
+def backfill():
+    """Fill latest_posts from `messages`; returns how many authors were set."""
+
+    newest = db.session.query(Message.user_id, db.func.max(Message.id)).group_by(
+        Message.user_id
+    )
+    stmt = insert(LatestPost).from_select(["user_id", "message_id"], newest)
+    return db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LatestPost.user_id],
+            set_={
+                "message_id": db.func.greatest(
+                    LatestPost.message_id, stmt.excluded.message_id
+                )
+            },
+        )
+    ).rowcount
+
+
+if __name__ == "__main__":
+    from config import add_config_argument
+
+    parser = argparse.ArgumentParser(description="Maintain latest_posts.")
+    parser.add_argument("command", choices=["backfill"])
+    add_config_argument(parser)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        count = backfill()
+        db.session.commit()
+    print(f"Recorded the newest message of {count} users.")
@@ -0,0 +1,238 @@
+"""Time-decayed trending scores for recent messages.
+
+Every message's score decays at the same rate, so instead of recomputing
+scores as time passes we fold the decay into a fixed epoch:
+
+    score = log(engagement) + created * ln(2) / half_life
+
+which orders messages exactly like ``engagement * 2 ** (-age / half_life)``.
+A score only changes when the message gets a new like, so each window keeps
+a bounded min-heap of its top K messages that is updated in O(log K).
+"""
+
+import math
+import time
+from threading import Lock
+
+
+LIKE_WEIGHT = 1.0
+FOLLOWER_WEIGHT = 0.5
+
+DEFAULT_WINDOWS = {
+    "day": 24 * 60 * 60,
+    "week": 7 * 24 * 60 * 60,
+}
+
+
+def score(created, likes, followers, half_life):
+    """Decay-free score for a message created at unix time `created`."""
+
+    engagement = 1 + likes * LIKE_WEIGHT + math.log1p(followers) * FOLLOWER_WEIGHT
+    return math.log(engagement) + created * math.log(2) / half_life
+
+
+class TrendingBoard:
+    """Top `k` messages created in the last `window` seconds.
+
+    Entries live in an indexed min-heap (``_pos`` maps message id to heap
+    slot), so the weakest entry is always at the root and any entry can be
+    re-scored or removed in O(log K).
+    """
+
+    def __init__(self, k, window, half_life):
+        self.k = k
+        self.window = window
+        self.half_life = half_life
+        self._heap = []
+        self._pos = {}
+        self._ranking = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, msg_id):
+        return msg_id in self._pos
+
+    def update(self, msg_id, created, likes, followers, now=None):
+        """Add or re-score a message. Returns True if it is on the board."""
+
+        now = time.time() if now is None else now
+        if created < now - self.window:
+            self.discard(msg_id)
+            return False
+
+        entry = [score(created, likes, followers, self.half_life), msg_id, created]
+
+        if msg_id in self._pos:
+            self._ranking = None
+            i = self._pos[msg_id]
+            old = self._heap[i][0]
+            self._heap[i] = entry
+            if entry[0] < old:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+            return True
+
+        if len(self._heap) < self.k:
+            self._ranking = None
+            self._heap.append(entry)
+            self._pos[msg_id] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return True
+
+        if entry[0] <= self._heap[0][0]:
+            return False
+
+        self._ranking = None
+        del self._pos[self._heap[0][1]]
+        self._heap[0] = entry
+        self._pos[msg_id] = 0
+        self._sift_down(0)
+        return True
+
+    def discard(self, msg_id):
+        """Remove a message from the board if it is there."""
+
+        i = self._pos.pop(msg_id, None)
+        if i is None:
+            return
+
+        self._ranking = None
+        last = self._heap.pop()
+        if i == len(self._heap):
+            return
+
+        self._heap[i] = last
+        self._pos[last[1]] = i
+        self._sift_up(i)
+        self._sift_down(self._pos[last[1]])
+
+    def top(self, now=None):
+        """Message ids on the board, best first, dropping expired entries.
+
+        The sorted ranking is kept until the next update, so repeated reads
+        between likes are a single O(K) pass.
+        """
+
+        now = time.time() if now is None else now
+        cutoff = now - self.window
+        for expired in [e[1] for e in self._heap if e[2] < cutoff]:
+            self.discard(expired)
+
+        if self._ranking is None:
+            self._ranking = [e[1] for e in sorted(self._heap, reverse=True)]
+        return list(self._ranking)
+
+    def entries(self):
+        """The board's heap, for saving with `restore`."""
+
+        return [list(entry) for entry in self._heap]
+
+    def restore(self, entries):
+        """Replace the board with `entries` saved from another board."""
+
+        self._heap = [list(entry) for entry in entries]
+        self._pos = {entry[1]: i for i, entry in enumerate(self._heap)}
+        self._ranking = None
+
+    def clear(self):
+        """Empty the board."""
+
+        self._heap.clear()
+        self._pos.clear()
+        self._ranking = None
+
+    def _sift_up(self, i):
+        heap, pos = self._heap, self._pos
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[parent][0] <= entry[0]:
+                break
+            heap[i] = heap[parent]
+            pos[heap[i][1]] = i
+            i = parent
+        heap[i] = entry
+        pos[entry[1]] = i
+
+    def _sift_down(self, i):
+        heap, pos = self._heap, self._pos
+        size = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if entry[0] <= heap[child][0]:
+                break
+            heap[i] = heap[child]
+            pos[heap[i][1]] = i
+            i = child
+        heap[i] = entry
+        pos[entry[1]] = i
+
+
+class Trending:
+    """One TrendingBoard per time window, safe to share between threads."""
+
+    def __init__(self, k=50, windows=None, half_life=6 * 60 * 60):
+        windows = windows or DEFAULT_WINDOWS
+        self.boards = {
+            name: TrendingBoard(k, seconds, half_life)
+            for name, seconds in windows.items()
+        }
+        self.seeded_at = None
+        self._lock = Lock()
+
+    def record(self, msg_id, created, likes, followers, now=None):
+        """Feed a new message or a new like into every window."""
+
+        with self._lock:
+            for board in self.boards.values():
+                board.update(msg_id, created, likes, followers, now)
+
+    def discard(self, msg_id):
+        """Forget a deleted message."""
+
+        with self._lock:
+            for board in self.boards.values():
+                board.discard(msg_id)
+
+    def top(self, window, now=None):
+        """Best message ids for `window`, best first."""
+
+        with self._lock:
+            return self.boards[window].top(now)
+
+    def state(self):
+        """Everything needed to rebuild the boards in another process."""
+
+        with self._lock:
+            return dict(
+                seeded_at=self.seeded_at,
+                boards={name: board.entries() for name, board in self.boards.items()},
+            )
+
+    def restore(self, state):
+        """Load boards saved by `state()`; unknown windows are skipped."""
+
+        with self._lock:
+            for name, entries in state["boards"].items():
+                if name in self.boards:
+                    self.boards[name].restore(entries)
+            self.seeded_at = state["seeded_at"]
+
+    def seed(self, rows, now=None):
+        """Replace the boards with `rows` of (id, created, likes, followers)."""
+
+        now = time.time() if now is None else now
+        with self._lock:
+            for board in self.boards.values():
+                board.clear()
+            for msg_id, created, likes, followers in rows:
+                for board in self.boards.values():
+                    board.update(msg_id, created, likes, followers, now)
+            self.seeded_at = now
@@ -0,0 +1,10 @@
+"""Entry point for production workers: ``gunicorn wsgi:app``.
+
+Needs SECRET_KEY and DATABASE_URL in the environment (see config.py), and
+WORKER_ID_BASE when more than one host or container runs workers (see
+gunicorn.conf.py).
+"""
+
+from app import create_app
+
+app = create_app("production")